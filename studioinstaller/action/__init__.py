@@ -17,3 +17,5 @@ from .encrypt import *
 from .involve import *
 from .release import *
 from .format import *
+from .plan import *
+from .statediff import *
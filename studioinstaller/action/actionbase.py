@@ -16,9 +16,9 @@
 
 from abc import ABC, abstractmethod
 from typing import List, Union, final
-from ..partition.base import MediumBase
+from ..partition.base import MediumBase, LUKS
 
-__all__ = ['ActionBase', '_sort_key']
+__all__ = ['ActionBase', '_sort_key', '_mountpoints', '_mounted_inside']
 
 
 def _sort_key(pt):
@@ -32,7 +32,22 @@ def _sort_key(pt):
         return 102 + len(pt.mountpoint.split('/'))
 
 
+def _mountpoints(pt):
+    """All the paths the partition gets mounted to (e.g. several btrfs subvolumes)"""
+    mpoints = pt.subvolumes.values() if pt.fs == "btrfs" and pt.subvolumes else [pt.mountpoint]
+    return [m for m in mpoints if m.startswith('/')]
+
+
+def _mounted_inside(pt, other):
+    """True if any of ``pt`` mountpoints is nested in any of ``other`` mountpoints"""
+    return any(m != o and (o == '/' or m.startswith(f"{o}/"))
+               for m in _mountpoints(pt) for o in _mountpoints(other))
+
+
 class ActionBase(ABC):
+    # completed nodes are recorded in the state journal and skipped on a re-run
+    journaled = False
+
     def __init__(self, **kwargs):
         self.nodes: Union[List[MediumBase], None] = []
         self._extra_kw = kwargs
@@ -50,6 +65,31 @@ class ActionBase(ABC):
     def iterator(self, scheme):
         pass
 
+    def prepare(self, nodes: List[MediumBase]):
+        """Called once before ``nodes`` get served, e.g. to ask the user for all the input up front"""
+        pass
+
+    def journal_step(self, pt) -> str:
+        """The node's step name in the state journal"""
+        return f"{self.__class__.__name__.lower()} {pt.url}"
+
+    def depends(self, pt, other) -> bool:
+        """True if ``pt`` must not be served before ``other`` is done.
+        Default: parent-before-child order.
+        """
+        return other in pt.pchain
+
+    def _satisfied(self, pt, step):
+        """The disk already holds what the ``step`` would make (see ``StateDiff``)"""
+        diff = self._extra_kw.get('diff')
+        return diff is not None and diff.satisfied(pt, step)
+
+    @staticmethod
+    def _ask_passphrases(nodes):
+        for pt in nodes:
+            if isinstance(pt, LUKS):
+                pt.passphrase  # asks the user if unknown yet
+
     @abstractmethod
     def serve_standard_pv(self, pt):
         pass
@@ -19,18 +19,25 @@
 - create an LVM LV
 """
 
-import re
-from spawned import SpawnedSU, Spawned
-
 from .actionbase import ActionBase, _sort_key
 from .encrypt import Encrypt
 from .involve import Involve
-from ..partition.base import PV
+from .statediff import STEP_PARTITION, STEP_LUKS, STEP_VG, STEP_LV
+from ..partition import PartitionTable
+from ..partition.base import PV, LUKS
+from ..util import alignment, broker, journal
 
 __all__ = ['Create']
 
 
 class Create(ActionBase):
+    journaled = True
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._created = set()
+        self._encrypted = set()
+
     def __next__(self):
         for p in self.nodes:
             while p and p.parent in self.nodes:
@@ -57,55 +64,64 @@ class Create(ActionBase):
 
         return self
 
-    def _create(self, partition):
-        if not partition.is_new:
-            return
-
-        # extract numeric ID value from the whole id value (e.g. '1' from 'sda1')
-        partition_id = re.search(r"(\d*)$", partition.id).group()
+    def prepare(self, nodes):
+        self._ask_passphrases(nodes)
 
-        basic_prompt = "Command (? for help)"
+        # write partition tables up front, so that the slow LUKS formatting of independent PVs
+        # can run concurrently
+        self._create(*[pt for pt in nodes if isinstance(pt, PV)])
 
-        t = SpawnedSU(f"gdisk {partition.disk}")
+        luks = [pt for pt in nodes if isinstance(pt, PV) and isinstance(pt, LUKS) and not self._satisfied(pt, STEP_LUKS)]
+        Encrypt.encrypt_concurrently(luks)
+        self._encrypted.update(luks)
 
-        t.interact(basic_prompt, "n")
-        t.interact("Partition number", partition_id or Spawned.ANSWER_DEFAULT)
-        t.interact("First sector", Spawned.ANSWER_DEFAULT)
-        t.interact("Last sector", f"+{partition.size}" if partition.size else Spawned.ANSWER_DEFAULT)
-        t.interact("Hex code or GUID", partition.type or Spawned.ANSWER_DEFAULT)
+    def depends(self, pt, other):
+        # keep LVs order, so that a relative-sized LV gets the rest of VG
+        same_vg = pt.islvmlv and other.islvmlv and pt.lvm_vg == other.lvm_vg
+        return super().depends(pt, other) or same_vg
 
-        # add partition label
-        if partition_id and partition.label:
-            t.interact(basic_prompt, "c")
+    def _create(self, *partitions):
+        """Create all the new ``partitions`` with a single partition table write per disk"""
+        tables = {}
 
-            if label_prefix := self._extra_kw.get('system_label'):
-                partition_label = label_prefix + '-' + partition.label
-            else:
-                partition_label = partition.label
-
-            while 0 != t.interact(("Enter name", partition_label),
-                                  ("Partition number", partition_id)):
+        for pt in partitions:
+            if not pt.is_new or pt in self._created or self._satisfied(pt, STEP_PARTITION):
+                continue
+            self._created.add(pt)
+            if journal.done(f"partition {pt.url}"):
                 continue
+            tables.setdefault(pt.disk, PartitionTable(pt.disk)).add(pt, self._extra_kw.get('system_label', ''))
 
-        t.interact(basic_prompt, "w")
-        t.interact("proceed?", "Y")
-        t.waitfor(Spawned.TASK_END)
+        for table in tables.values():
+            table.write()
+            for url in table.urls:
+                journal.complete(f"partition {url}")
 
     def serve_standard_pv(self, pt):
         self._create(pt)
 
     def serve_luks_pv(self, pt):
         self._create(pt)
-        pt.execute(Encrypt())
+        if pt not in self._encrypted and not self._satisfied(pt, STEP_LUKS):
+            pt.execute(Encrypt())
 
     def serve_lvm_on_luks_vg(self, pt):
+        if self._satisfied(pt, STEP_VG):
+            return  # already opened and activated on inspection
+
         pt.parent.execute(Involve())
-        SpawnedSU.do(f"pvcreate {pt.url} && vgcreate {pt.lvm_vg} {pt.url}")
+        align = alignment.for_disk(pt.disk)
+        broker.do(f"pvcreate --dataalignment {align.kib}k {pt.url}"
+                  f" && vgcreate --physicalextentsize {align.pe_size_kib}k {pt.lvm_vg} {pt.url}")
 
     def serve_lvm_lv(self, pt):
         assert pt.lvm_vg, f"No LVM VG is defined for LVM LV {pt.id}. Abort."
+        if self._satisfied(pt, STEP_LV):
+            return
         l_option = "-l" if "%" in pt.size else "-L"
-        SpawnedSU.do(f"lvcreate {l_option} {pt.size} {pt.lvm_vg} -n {pt.lvm_lv}")
+        reply = broker.run(f"lvcreate {l_option} {pt.size} {pt.lvm_vg} -n {pt.lvm_lv}")
+        assert reply.success, f"Can't create LVM LV {pt.lvm_vg}/{pt.lvm_lv}: {reply.err}"
 
     def serve_encrypted_vv(self, pt):
-        pt.parent.execute(Involve())
+        if not self._satisfied(pt.parent, STEP_LUKS):  # otherwise opened on inspection
+            pt.parent.execute(Involve())
@@ -14,28 +14,41 @@
 
 """Encrypt partition using cryptsetup"""
 
-from spawned import SpawnedSU
-
 from .actionbase import ActionBase
 from ..partition.base import LUKS
+from ..util import alignment, broker
+from ..util.dag import run_dag
 
 __all__ = ['Encrypt']
 
 
+# luksFormat is CPU- and memory-hard (PBKDF benchmarking and key derivation),
+# so only a few volumes are formatted at the same time
+MAX_CONCURRENT_FORMATS = 2
+
+
 class Encrypt(ActionBase):
     def iterator(self, scheme):
         self.nodes.extend([pt for pt in scheme.partitions(LUKS)])
         return self
 
+    @staticmethod
+    def encrypt_concurrently(partitions):
+        """Encrypt independent LUKS ``partitions`` on a pool of its own, whatever the number of
+        the action workers (``-j``) is; a recorded plan gets them one by one
+        """
+        jobs = 1 if broker.instance().recording_active else MAX_CONCURRENT_FORMATS
+        run_dag(partitions, lambda pt: pt.execute(Encrypt()), lambda pt, other: False, jobs)
+
     @staticmethod
     def _encrypt(partition, passphrase=None):
         assert isinstance(partition, LUKS), f"Partition {partition.id} doesn't look like a LUKS volume"
         if passphrase:
             partition._passphrase = passphrase
-        with SpawnedSU(f"cryptsetup luksFormat --type={partition.luks_type} {partition.url}", timeout=600) as t:
-            t.interact("Type .*yes.*$", "YES", exact=False)
-            t.interact("Enter passphrase for", partition.passphrase)
-            t.interact("Verify passphrase", partition.passphrase)
+        # note: the passphrase is passed via stdin with no trailing newline, so it matches the typed one
+        align_payload = alignment.for_disk(partition.disk).sectors
+        broker.do(f"cryptsetup luksFormat --batch-mode --type={partition.luks_type} --align-payload={align_payload}"
+                  f" --key-file=- {partition.url}", input=partition.passphrase, timeout=600)
 
     def serve_standard_pv(self, pt):
         pass
@@ -14,10 +14,13 @@
 
 """Make file system"""
 
-from spawned import SpawnedSU
+from pathlib import Path
 
 from .actionbase import ActionBase
-from ..partition.base import VType
+from .involve import Involve
+from .statediff import STEP_FS
+from ..partition.base import VType, Partition, LUKS
+from ..util import broker
 
 __all__ = ['Format']
 
@@ -50,14 +53,42 @@ def _options(partition):
         return ' '.join(opts)
 
 
+def _active(container):
+    """A LUKS container is open, an LVM VG is activated"""
+    if isinstance(container, LUKS):
+        return Path(f"/dev/mapper/{container.mapperID}").exists()
+    return Path(f"/dev/{container.lvm_vg}").exists()
+
+
 class Format(ActionBase):
+    journaled = True
+
     def iterator(self, scheme):
         # filter only partitions to be formatted
         self.nodes.extend([pt for pt in scheme if pt.do_format or pt.isswap])
         return self
 
-    @staticmethod
-    def _format(partition):
+    def prepare(self, nodes):
+        # e.g. on a resumed run, the containers opened by ``Create`` are closed already;
+        # a recorded plan has them opened by ``Create`` in any case
+        if broker.instance().recording_active:
+            return
+
+        involved = set()
+        for pt in nodes:
+            for container in reversed(pt.pchain[1:]):
+                if isinstance(container, Partition) and container.iscontainer and container not in involved:
+                    involved.add(container)
+                    if not _active(container):
+                        container.execute(Involve())
+
+    def _format(self, partition):
+        if self._satisfied(partition, STEP_FS):
+            # keep the file system, just add the missing subvolumes
+            diff = self._extra_kw['diff']
+            self._create_subvolumes(partition, diff.missing_subvolumes.get(partition, []))
+            return
+
         if "efi" in partition.mountpoint:
             cmd = f"mkfs.vfat {_options(partition)} %s"
         elif partition.mountpoint == "/boot":
@@ -69,14 +100,22 @@ class Format(ActionBase):
         else:
             cmd = f"mkfs.ext4 {_options(partition)} %s"
 
-        SpawnedSU.do(cmd % partition.url)
+        broker.do(cmd % partition.url)
 
         if partition.fs == "btrfs" and partition.subvolumes:
-            root = "/mnt"
-            SpawnedSU.do(f"mount -o compress=lzo {partition.url} {root}")
-            for subv, mpoint in partition.subvolumes.items():
-                SpawnedSU.do(f"mkdir -p {root}{mpoint} && btrfs subvolume create {root}/{subv}")
-            SpawnedSU.do(f"umount {partition.url}")
+            self._create_subvolumes(partition, list(partition.subvolumes))
+
+    @staticmethod
+    def _create_subvolumes(partition, subvolumes):
+        if not subvolumes:
+            return
+
+        # a dedicated mountpoint, so that several partitions can be formatted concurrently
+        root = f"/mnt/.format-{partition.id}"
+        broker.do(f"mkdir -p {root} && mount -o compress=lzo {partition.url} {root}")
+        for subv in subvolumes:
+            broker.do(f"mkdir -p {root}{partition.subvolumes[subv]} && btrfs subvolume create {root}/{subv}")
+        broker.do(f"umount {partition.url} && rmdir {root}")
 
     def serve_standard_pv(self, pt):
         self._format(pt)
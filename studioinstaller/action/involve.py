@@ -20,8 +20,8 @@
 """
 
 from pathlib import Path
-from spawned import SpawnedSU
-from .actionbase import ActionBase, _sort_key
+from .actionbase import ActionBase, _sort_key, _mounted_inside
+from ..util import broker, devwait
 
 __all__ = ['Involve']
 
@@ -31,19 +31,26 @@ class Involve(ActionBase):
         self.nodes.extend(sorted(scheme.partitions(), key=_sort_key))
         return self
 
+    def prepare(self, nodes):
+        if not self._extra_kw.get('passphrase'):
+            self._ask_passphrases(nodes)
+
+    def depends(self, pt, other):
+        return super().depends(pt, other) or _mounted_inside(pt, other)
+
     @staticmethod
     def _luks_open(partition, passphrase=None, mapper_id=None):
         name_to_open = partition.mapperID or mapper_id
         assert name_to_open, f"Is it LUKS? 'mapperID' is not defined for {partition.id}"
         if passphrase:
             partition._passphrase = passphrase
-        with SpawnedSU(f"cryptsetup open {partition.url} {name_to_open}") as t:
-            t.interact("Enter passphrase for", partition.passphrase)
+        broker.do(f"cryptsetup open --key-file=- {partition.url} {name_to_open}", input=partition.passphrase)
+        assert devwait.wait_for_path(f"/dev/mapper/{name_to_open}"), f"'{name_to_open}' didn't appear in /dev/mapper"
 
     @staticmethod
     def _mount(partition, chroot, mountpoint=None, mount_options=''):
         if partition.isswap:
-            SpawnedSU.do(f"swapon {partition.url}")
+            broker.do(f"swapon {partition.url}")
 
         else:
             assert chroot, f"No 'chroot' defined while trying to mount '{partition.id}'"
@@ -59,8 +66,8 @@ class Involve(ActionBase):
                 mpoint = mpoint.lstrip('/')
             mpoint = Path(chroot, mpoint)
 
-            SpawnedSU.do(f"mkdir -p {mpoint}")
-            SpawnedSU.do(f"mount {mount_options} {partition.url} {mpoint}")
+            broker.do(f"mkdir -p {mpoint}")
+            broker.do(f"mount {mount_options} {partition.url} {mpoint}")
 
     def serve_standard_pv(self, pt, mountpoint=None, chroot=None):
         chroot = chroot or self._extra_kw.get('chroot')
@@ -81,7 +88,7 @@ class Involve(ActionBase):
         self._luks_open(pt, passphrase, mapper_id)
 
     def serve_lvm_on_luks_vg(self, pt):
-        SpawnedSU.do(f"sudo vgchange -ay {pt.lvm_vg}")
+        broker.do(f"vgchange -ay {pt.lvm_vg}")
 
     def serve_lvm_lv(self, pt, mountpoint=None, chroot=None):
         self.serve_standard_pv(pt, mountpoint, chroot)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""An ordered list of commands compiled from one or more action passes over a scheme.
+The whole plan is executed as a single script, each step reports its status via a marker line.
+"""
+
+import re
+import shlex
+from pathlib import Path
+
+from ..util import broker, tagged_logger
+
+__all__ = ['Plan', 'PlanStep']
+
+
+_tlog = tagged_logger("[Plan]")
+
+STEP_MARKER = "@@STEP"
+INPUT_VAR = "PLAN_INPUT_%d"
+
+
+class PlanStep:
+    def __init__(self, number, cmd, input=None, env=None):
+        self.number = number
+        self.cmd = cmd.strip()
+        self.input = input
+        self.env = env or {}
+        self.status = None
+
+    def __repr__(self):
+        return f"PlanStep({self.number}, {self.cmd!r}, status={self.status})"
+
+    @property
+    def input_var(self):
+        return INPUT_VAR % self.number
+
+    def script(self):
+        exports = ''.join(f"export {k}={shlex.quote(str(v))}; " for k, v in self.env.items())
+        body = f"( {exports}{self.cmd}\n)"
+        if self.input is not None:
+            # secrets (e.g. LUKS passphrases) are never stored in the script, they're passed via environment
+            body = f'printf "%s" "${self.input_var}" | {body}'
+        return "\n".join([
+            f'printf "\\n{STEP_MARKER} {self.number} BEGIN\\n"',
+            body,
+            f'rc=$?; printf "\\n{STEP_MARKER} {self.number} END %d\\n" $rc; [ $rc -eq 0 ] || exit $rc',
+        ])
+
+
+class Plan:
+    def __init__(self):
+        self.steps = []
+
+    def __iter__(self):
+        return self.steps.__iter__()
+
+    def __len__(self):
+        return len(self.steps)
+
+    def add(self, cmd: str, input: str = None, env: dict = None):
+        self.steps.append(PlanStep(len(self.steps) + 1, cmd, input, env))
+
+    @property
+    def inputs(self):
+        return {step.input_var: step.input for step in self.steps if step.input is not None}
+
+    def script(self):
+        header = ["#!/bin/bash", f"# {len(self.steps)} steps"]
+        if inputs := self.inputs:
+            header.append(f"# the following variables must be set before replaying: {' '.join(inputs)}")
+
+        steps = [f"\n# [{step.number}/{len(self.steps)}]\n{step.script()}" for step in self.steps]
+        return "\n".join(header + steps) + "\n"
+
+    def save(self, path):
+        Path(path).write_text(self.script())
+        Path(path).chmod(0o700)
+        _tlog(f"plan saved to '{path}'")
+
+    def run(self):
+        """Execute the whole plan as a single script. Returns True if all steps succeeded."""
+        reply = broker.run(self.script(), env=self.inputs)
+
+        for mo in re.finditer(rf"^{STEP_MARKER} (\d+) END (\d+)$", reply.out, re.MULTILINE):
+            self.steps[int(mo.group(1)) - 1].status = int(mo.group(2))
+
+        done = sum(1 for step in self.steps if step.status == 0)
+        _tlog(f"{done}/{len(self.steps)} steps done")
+
+        if failed := [step for step in self.steps if step.status]:
+            _tlog(f"step {failed[0].number} failed with status {failed[0].status}: {failed[0].cmd}")
+            if err := reply.err.strip():
+                _tlog(err)
+
+        return reply.success and done == len(self.steps)
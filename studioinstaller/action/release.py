@@ -19,8 +19,8 @@
 - deactivate all LMV LVs in an LVM VG
 """
 
-from spawned import SpawnedSU
-from .actionbase import ActionBase, _sort_key
+from .actionbase import ActionBase, _sort_key, _mounted_inside
+from ..util import broker
 
 __all__ = ['Release']
 
@@ -30,18 +30,22 @@ class Release(ActionBase):
         self.nodes.extend(sorted(scheme.partitions(), key=_sort_key, reverse=True))
         return self
 
+    def depends(self, pt, other):
+        # reversed order: children first
+        return pt in other.pchain or _mounted_inside(other, pt)
+
     @staticmethod
     def _luks_close(partition, mapper_id=None):
         name_to_close = partition.mapperID or mapper_id
         assert name_to_close, f"Is it LUKS? 'mapperID' is not defined for {partition.id}"
-        SpawnedSU.do(f"cryptsetup close {name_to_close}")
+        broker.do(f"cryptsetup close {name_to_close}")
 
     @staticmethod
     def _umount(partition):
         if partition.isswap:
-            SpawnedSU.do(f"swapoff {partition.url}")
+            broker.do(f"swapoff {partition.url}")
         else:
-            SpawnedSU.do(f"umount {partition.url}")
+            broker.do(f"umount {partition.url}")
 
     def serve_standard_pv(self, pt):
         self._umount(pt)
@@ -51,7 +55,7 @@ class Release(ActionBase):
         self._luks_close(pt, mapper_id)
 
     def serve_lvm_on_luks_vg(self, pt):
-        SpawnedSU.do(f"vgchange -an {pt.lvm_vg}")
+        broker.do(f"vgchange -an {pt.lvm_vg}")
 
     def serve_lvm_lv(self, pt):
         self._umount(pt)
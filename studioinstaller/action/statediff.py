@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Differences between the disk's actual state and the partitioning scheme.
+
+Every scheme entry is split into steps (partition, LUKS header, LVM VG/LV, file system, btrfs
+subvolumes); a step is satisfied if the disk already holds exactly what it would produce and
+all the steps it depends on are satisfied as well. ``Create`` and ``Format`` given a ``diff``
+skip the satisfied steps, so a re-run after a late failure doesn't repeat slow luksFormat and mkfs.
+"""
+
+import re
+
+from .involve import Involve
+from ..partition import VGLvmOnLuks
+from ..partition.base import PV, LUKS, Partition
+from ..util import alignment, broker, gpt, probe, tagged_logger
+
+__all__ = ['StateDiff', 'STEP_PARTITION', 'STEP_LUKS', 'STEP_VG', 'STEP_LV', 'STEP_FS', 'STEP_SUBVOLUMES']
+
+
+_tlog = tagged_logger("[StateDiff]")
+
+STEP_PARTITION = "partition"
+STEP_LUKS = "luks header"
+STEP_VG = "lvm vg"
+STEP_LV = "lvm lv"
+STEP_FS = "file system"
+STEP_SUBVOLUMES = "subvolumes"
+
+
+def expected_fs(pt):
+    """File system type ``Format`` makes on the partition, as reported by the superblock prober"""
+    if "efi" in pt.mountpoint:
+        return "vfat"
+    if pt.mountpoint == "/boot":
+        return "ext2"
+    if pt.isswap:
+        return "swap"
+    return pt.fs or "ext4"
+
+
+class StateDiff:
+    def __init__(self, scheme):
+        self.scheme = scheme
+        self.steps = {}  # {(partition, step): (satisfied, details)}
+        self.missing_subvolumes = {}  # {partition: [subvolume]}
+        self.stale_partitions = {}  # {disk: [partition number]} - existing, but not matching the scheme
+        self.stale_lvs = []  # ["vg/lv"] - existing, but not matching the scheme
+
+    def satisfied(self, pt, step):
+        return self.steps.get((pt, step), (False, ''))[0]
+
+    def _done(self, pt):
+        """All the steps of the partition are satisfied"""
+        return all(ok for (p, _), (ok, _) in self.steps.items() if p is pt)
+
+    def _set(self, pt, step, ok, details=''):
+        # nothing inside a partition to be re-created is kept
+        ok = ok and all(self._done(p) for p in pt.pchain[1:] if isinstance(p, Partition))
+        ok = ok and all(self.satisfied(pt, s) for p, s in list(self.steps) if p is pt)
+        self.steps[(pt, step)] = (bool(ok), details)
+
+    def inspect(self):
+        _tlog("inspecting the disk state ...")
+        tables = {disk.url: gpt.GptTable.load(disk.url) for disk in self.scheme.disks()}
+
+        for pt in sorted(self.scheme.partitions(), key=lambda p: len(p.pchain)):
+            if isinstance(pt, PV):
+                self._check_partition(pt, tables[pt.disk])
+            if isinstance(pt, LUKS):
+                self._check_luks(pt)
+            if isinstance(pt, VGLvmOnLuks):
+                self._check_vg(pt)
+            if pt.islvmlv:
+                self._check_lv(pt)
+            if pt.do_format or pt.isswap:
+                self._check_fs(pt)
+
+        return self
+
+    def _check_partition(self, pt, table):
+        number = re.search(r"(\d*)$", pt.id).group()
+        entry = table.entries.get(int(number)) if number else None
+        if not entry:
+            return self._set(pt, STEP_PARTITION, False, "missing")
+
+        sectors = entry.last_lba - entry.first_lba + 1
+        if entry.type_guid != gpt.type_guid(pt.type):
+            details = f"type {entry.type_guid}"
+        elif pt.size and sectors != gpt.parse_size(pt.size, table.sector_size):
+            details = f"size {sectors * table.sector_size} bytes"
+        else:
+            return self._set(pt, STEP_PARTITION, True)
+
+        self.stale_partitions.setdefault(pt.disk, []).append(entry.number)
+        self._set(pt, STEP_PARTITION, False, details)
+
+    def _check_luks(self, pt):
+        sb = probe.probe(pt.url) if self.satisfied(pt, STEP_PARTITION) else None
+        if not sb or sb.type != "crypto_LUKS":
+            return self._set(pt, STEP_LUKS, False, "no header")
+
+        # note: the passphrase is passed via stdin, just like on luksFormat
+        if not broker.run(f"cryptsetup open --test-passphrase --key-file=- {pt.url}", input=pt.passphrase).success:
+            return self._set(pt, STEP_LUKS, False, "passphrase doesn't match")
+
+        self._set(pt, STEP_LUKS, True)
+        pt.execute(Involve())  # look inside
+
+    def _check_vg(self, pt):
+        vgs = broker.do("vgs --noheadings -o vg_name", list_=True)
+        exists = pt.lvm_vg in [vg.strip() for vg in vgs]
+        self._set(pt, STEP_VG, exists, "" if exists else "missing")
+        if self.satisfied(pt, STEP_VG):
+            pt.execute(Involve())
+
+    def _check_lv(self, pt):
+        lines = broker.do(f"lvs --noheadings --units b --nosuffix -o lv_name,lv_size {pt.lvm_vg}", list_=True)
+        sizes = {name: int(size) for name, size in (line.split() for line in lines)}
+        if pt.lvm_lv not in sizes:
+            return self._set(pt, STEP_LV, False, "missing")
+
+        # LVM rounds the size up to whole extents
+        if pt.size and '%' not in pt.size:
+            extent = alignment.for_disk(pt.disk).pe_size_kib * 1024
+            if abs(sizes[pt.lvm_lv] - gpt.parse_size(pt.size, 1)) >= extent:
+                self.stale_lvs.append(f"{pt.lvm_vg}/{pt.lvm_lv}")
+                return self._set(pt, STEP_LV, False, f"size {sizes[pt.lvm_lv]} bytes")
+
+        self._set(pt, STEP_LV, True)
+
+    def _check_fs(self, pt):
+        sb = probe.probe(pt.url) if self._done(pt) else None
+        fs = expected_fs(pt)
+        if not sb or sb.type != fs:
+            return self._set(pt, STEP_FS, False, f"{sb.type if sb else 'nothing'} instead of {fs}")
+
+        if pt.label and sb.label.lower() != pt.label.lower():
+            return self._set(pt, STEP_FS, False, f"label '{sb.label}'")
+
+        self._set(pt, STEP_FS, True)
+
+        if fs == "btrfs" and pt.subvolumes:
+            self._check_subvolumes(pt)
+
+    def _check_subvolumes(self, pt):
+        root = f"/mnt/.inspect-{pt.id}"
+        broker.do(f"mkdir -p {root} && mount -o ro {pt.url} {root}")
+        lines = broker.do(f"btrfs subvolume list {root}", list_=True)
+        broker.do(f"umount {pt.url} && rmdir {root}")
+
+        existing = {line.split(" path ", 1)[-1].strip() for line in lines}
+        missing = [subv for subv in pt.subvolumes if subv.strip('/') not in existing]
+        self.missing_subvolumes[pt] = missing
+        self.steps[(pt, STEP_SUBVOLUMES)] = (not missing, f"missing {', '.join(missing)}" if missing else "")
+
+    def remove_stale_lvs(self):
+        """Logical volumes to be re-created are removed, so that their names become free"""
+        for lv in self.stale_lvs:
+            reply = broker.run(f"lvremove -f {lv}")
+            assert reply.success, f"Can't remove LVM LV {lv}: {reply.err}"
+
+    def remove_stale_partitions(self):
+        """Partitions to be re-created are removed, so that their numbers become free"""
+        for disk, numbers in self.stale_partitions.items():
+            table = gpt.GptTable.load(disk)
+            for number in numbers:
+                table.remove(number)
+            table.write()
+
+    def print(self):
+        print("============= Partitioning plan: =============")
+        for (pt, step), (ok, details) in self.steps.items():
+            action = "keep" if ok else "make"
+            print(f"  [{action}] {pt.url:<28} {step:<12} {details}")
+        print("")
+
+    @property
+    def pending(self):
+        return [(pt, step) for (pt, step), (ok, _) in self.steps.items() if not ok]
@@ -22,6 +22,7 @@
 """
 
 from importlib.metadata import version as app_version
+from pathlib import Path
 from sys import exit as app_exit
 
 from spawned import SpawnedSU, Spawned, ask_user, SETENV, logger
@@ -29,6 +30,7 @@ from spawned import SpawnedSU, Spawned, ask_user, SETENV, logger
 from .argparser import *
 from .disksmounthelper import DisksMountHelper
 from .distro import DistroFactory
+from .imager import Imager
 from .mounter import Mounter
 from .pluginloader import PluginLoader, PluginRunner
 from .preinstaller import PreInstaller
@@ -43,6 +45,27 @@ def select_target_disk():
     return ask_user("Select target disk:")
 
 
+def attach_target_image(op):
+    if not Path(op.image).exists():
+        size = util.image.create(op.image, op.image_size)
+        print(f"Created sparse image '{op.image}' of {size} bytes")
+    return util.image.attach(op.image)
+
+
+def finalize_target_image(op, loop_device, scheme):
+    # discard the blocks freed by the file systems, so that they become holes in the image
+    mounter = Mounter(op.chroot, scheme, op.j)
+    mounter.mount_volumes()
+    util.broker.do(f"findmnt -rno TARGET | grep '^{op.chroot}' | xargs -r -n1 fstrim")
+    mounter.unmount_target_system()
+
+    util.image.detach(loop_device)
+
+    bmap = util.image.BlockMap.build(op.image)
+    bmap.save(f"{op.image}.bmap")
+    print(f"Image block map saved to '{op.image}.bmap': {bmap}")
+
+
 def register_plugins(argparser, plugin_loader):
     for plugin_name in plugin_loader.names():
         main_entry = plugin_loader.plugin_entry_point(plugin_name)
@@ -64,25 +87,31 @@ def register_plugins(argparser, plugin_loader):
 
 
 def handle_subcmd_default(conf):
-    mounter = Mounter(conf.op.chroot, conf.scheme)
+    mounter = Mounter(conf.op.chroot, conf.scheme, conf.op.j)
     distrofactory = DistroFactory.instance()
 
     if conf.op.hard:
         mounter.unmount_target_system()
 
+    # completed steps are skipped if the previous run with this scheme failed
+    util.journal.open_journal(conf.scheme.fingerprint(), fresh=conf.op.fresh)
+
     if not conf.op.n:
         # unused; just prevents partitions automounting during the OS installation
         do_not_automount_new_partitions = DisksMountHelper()
 
-        preinstaller = PreInstaller(conf.scheme, conf.op)
-        preinstaller.prepare_partitions()
-
+        # before partitioning: an unsupported installer must not leave the disks half-prepared
         os_installer = distrofactory.getInstaller(conf)
-        os_installer.execute()
 
-        # wait a little: target OS partitions get unmounted
+        if not os_installer.partitions_disk:
+            preinstaller = PreInstaller(conf.scheme, conf.op)
+            preinstaller.prepare_partitions()
+
+        util.journal.run("os installer", os_installer.execute)
+
+        # wait until the OS installer unmounts target OS partitions
         print("waiting for the OS installer finishes the job...")
-        util.delay(5)
+        util.devwait.wait_for_unmount(conf.op.chroot)
 
     if not conf.op.N:
         if util.target.ready_for_postinstall(conf.op.chroot):
@@ -94,16 +123,19 @@ def handle_subcmd_default(conf):
             if conf.op.inject is not None:
                 # NOTE: magic values, defined by argparser setup
                 variants = "extra,devel" if conf.op.inject == 'all' else conf.op.inject
-                postinstaller.inject_tool(extras='extra' in variants,
-                                          develop='devel' in variants)
+                util.journal.run("inject tool", postinstaller.inject_tool,
+                                 extras='extra' in variants, develop='devel' in variants)
         else:
             logger.warning("It looks like the target system is not ready for post-installation actions. "
                         "Trying to unmount the whole partitioning scheme and exit.")
             mounter.unmount_target_system()
+            return
+
+    util.journal.close_journal()
 
 
 def handle_subcmd_scheme(conf):
-    mounter = Mounter(conf.op.mount or conf.op.chroot, conf.scheme)
+    mounter = Mounter(conf.op.mount or conf.op.chroot, conf.scheme, conf.op.j)
 
     if conf.op.mount:
         mounter.mount_target_system()
@@ -113,6 +145,24 @@ def handle_subcmd_scheme(conf):
         mounter.unmount_target_system()
         conf.op.umount and app_exit()  # exit if this option specified
 
+    if conf.op.capture:
+        Imager(conf.op.chroot, conf.scheme, conf.op.j).capture(conf.op.capture)
+        app_exit()
+
+    if conf.op.restore:
+        # prevents partitions automounting during the restoring
+        with DisksMountHelper():
+            PreInstaller(conf.scheme, conf.op).prepare_partitions()
+            Imager(conf.op.chroot, conf.scheme, conf.op.j).restore(conf.op.restore)
+
+            DistroFactory.instance().getPostInstaller(conf).reconfigure_restored()
+        app_exit()
+
+
+def handle_subcmd_flash(op):
+    bmap = util.image.BlockMap.load(f"{op.flash_image}.bmap")
+    util.image.flash(op.flash_image, bmap, op.disks)
+
 
 def main():
     Spawned.enable_logging()
@@ -131,6 +181,7 @@ def main():
 
     if op.d:
         Spawned.enable_debug_commands()
+        util.broker.enable_debug()
 
     if op.selftest:
         # TODO check required linux commands, .seed file, ubiquity, ubiquity.desktop file, partman, debconf database
@@ -140,7 +191,11 @@ def main():
         print(app_version(__package__))
         app_exit()
 
-    target_disk = select_target_disk()
+    if op.sub_cmd == SUBCMD_FLASH:
+        handle_subcmd_flash(op)  # no partitioning scheme is involved
+        app_exit()
+
+    target_disk = attach_target_image(op) if op.image else select_target_disk()
     scheme = partitioning.scheme(target_disk, op.P)
 
     if not scheme:
@@ -152,6 +207,9 @@ def main():
     # call a bound function (defined by argparser)
     op.func(runtime_config)
 
+    if op.image:
+        finalize_target_image(op, target_disk, scheme)
+
 
 if __name__ == '__main__':
     main()
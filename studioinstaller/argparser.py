@@ -19,10 +19,25 @@ from sys import argv as sys_argv
 
 from .util import system
 
-__all__ = ['ArgParser', 'SUBCMD_DEFAULT', 'SUBCMD_SCHEME']
+__all__ = [
+    'ArgParser',
+    'SUBCMD_DEFAULT',
+    'SUBCMD_SCHEME',
+    'SUBCMD_FLASH',
+    'INSTALLER_NATIVE',
+    'INSTALLER_SQUASHFS',
+    'INSTALLER_BASESTRAP',
+    'INSTALLER_CALAMARES',
+]
 
 SUBCMD_DEFAULT = "default"
 SUBCMD_SCHEME = "scheme"
+SUBCMD_FLASH = "flash"
+
+INSTALLER_NATIVE = "native"
+INSTALLER_SQUASHFS = "squashfs"
+INSTALLER_BASESTRAP = "basestrap"
+INSTALLER_CALAMARES = "calamares"
 
 
 class ArgParser:
@@ -45,6 +60,9 @@ class ArgParser:
         argparser.add_argument("-P", type=int, default=0, choices=[0, 1],
                                help="Pre-defined partitionings scheme id")
 
+        argparser.add_argument("-j", type=int, default=1, metavar="JOBS",
+                               help="Number of partitions to be processed concurrently (Default: 1)")
+
         DEFAULT_SYSTEM_LABEL = "studio"
         argparser.add_argument("-L", type=str, default=DEFAULT_SYSTEM_LABEL, metavar="SYSTEM_LABEL", help="System label")
 
@@ -56,6 +74,13 @@ class ArgParser:
         argparser.add_argument("--chroot", type=str, default=DEFAULT_CHROOT,
                                help=f"Target system's mountpoint (Default: {DEFAULT_CHROOT})")
 
+        DEFAULT_IMAGE_SIZE = "16G"
+        argparser.add_argument("--image", type=str, metavar="FILE",
+                               help="Target a sparse image file attached to a loop device instead of a disk;"
+                                    " the image's block map is saved to FILE.bmap at the end")
+        argparser.add_argument("--image-size", type=str, default=DEFAULT_IMAGE_SIZE, metavar="SIZE",
+                               help=f"Size of a new image (Default: {DEFAULT_IMAGE_SIZE})")
+
         # SUBCOMMANDS
         # default
         default_argparser = self.add_subcommand_parser(SUBCMD_DEFAULT,
@@ -65,6 +90,20 @@ class ArgParser:
             help="Skip disk partitioning and OS installation steps")
         default_argparser.add_argument("-N", action="store_true",
             help="Skip post-installer steps")
+        default_argparser.add_argument("--plan", type=str, const="", metavar="FILE", nargs='?',
+            help="Compile disk partitioning into a single script and run it in one go;"
+                 " the script is also saved to FILE if specified")
+        default_argparser.add_argument("--fresh", action="store_true",
+            help="Start over: forget the steps completed by the previous runs with the same partitioning scheme")
+        default_argparser.add_argument("--diff", action="store_true",
+            help="Inspect the disk and only make the partitions, LUKS containers, LVM volumes, file systems"
+                 " and subvolumes which don't match the partitioning scheme yet; prints the plan first")
+        default_argparser.add_argument("--installer", default=INSTALLER_NATIVE,
+            choices=[INSTALLER_NATIVE, INSTALLER_SQUASHFS, INSTALLER_BASESTRAP, INSTALLER_CALAMARES],
+            help="OS installation backend: the distro's own installer, unpacking of the live system's"
+                 " squashfs image (Ubuntu), package bootstrapping"
+                 " or Calamares configured from the partitioning scheme (Manjaro)"
+                 f" (Default: {INSTALLER_NATIVE})")
         default_argparser.add_argument("--inject", choices=['extra', 'devel', 'all'],
             help="Install the tool into the target OS, so that it will be available on the user's first GUI login")
 
@@ -76,6 +115,18 @@ class ArgParser:
         mount_opts.add_argument("--mount", type=str, const=DEFAULT_CHROOT, metavar="ROOT", nargs='?',
                                 help=f"Mount the whole partitioning scheme and exit (Default ROOT: {DEFAULT_CHROOT})")
         mount_opts.add_argument("--umount", action="store_true", help="Unmount the whole partitioning scheme and exit")
+        mount_opts.add_argument("--capture", type=str, metavar="DIR",
+                                help="Capture the installed system into a golden image in DIR and exit")
+        mount_opts.add_argument("--restore", type=str, metavar="DIR",
+                                help="Create and format the partitioning scheme, restore the golden image from DIR"
+                                     " and update the UUID-dependent system configuration")
+
+        # flash
+        flash_argparser = self.add_subcommand_parser(SUBCMD_FLASH,
+            help_msg="Write the data blocks of an image built with --image onto disks and verify them")
+        flash_argparser.add_argument("flash_image", type=str, metavar="IMAGE",
+                                     help="Image file; its block map is read from IMAGE.bmap")
+        flash_argparser.add_argument("disks", type=str, nargs='+', metavar="DISK", help="Target disks, written concurrently")
 
     def add_subcommand_parser(self, cmd_name, handler=None, help_msg="", options_dict=None):
         subcmd_parser = self.subcmd_registrar.add_parser(cmd_name, help=help_msg)
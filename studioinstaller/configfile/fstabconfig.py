@@ -21,9 +21,11 @@ from pathlib import Path
 from spawned import Spawned
 
 from .configfilebase import ConfigFileBase
+from ..action.statediff import expected_fs
+from ..partition.base import FS
 from .. import util
 
-__all__ = ['FstabConfig', 'FstabItem']
+__all__ = ['FstabConfig', 'FstabItem', 'fstab_items', 'scheme_fstab']
 
 
 _tlog = util.tagged_logger('[FstabConfig]')
@@ -102,3 +104,28 @@ class FstabConfig(ConfigFileBase):
     def items(self):
         active_lines = [line for line in super().__iter__() if not line.startswith('#')]
         return [FstabItem.build(line) for line in active_lines]
+
+
+def fstab_items(pt):
+    """fstab entries for a partition of the scheme: a swap line, a line per btrfs subvolume
+    or a regular line; none if the partition isn't mounted
+    """
+    # note: e.g. the ESP is declared with no type, Format picks the one
+    fs = pt.fs or (expected_fs(pt) if pt.do_format else '')
+    if not (pt.isswap or pt.mountpoint and fs):
+        return []
+
+    volume = f"UUID={pt.uuid}" if pt.isphysical else pt.url
+    if pt.isswap:
+        return [FstabItem(volume, "none", "swap", "sw", 0, 0)]
+    if fs == "btrfs" and pt.subvolumes:
+        return [FstabItem(volume, mpoint, "btrfs", f"defaults,compress=lzo,subvol={subv}", 0, 0)
+                for subv, mpoint in pt.subvolumes.items()]
+    return [FstabItem(volume, pt.mountpoint, fs, "defaults,relatime", 0, 1 if pt.mountpoint == '/' else 2)]
+
+
+def scheme_fstab(scheme) -> str:
+    """The whole /etc/fstab content for a target system installed onto the scheme"""
+    lines = ["# generated by studioinstaller from the partitioning scheme"]
+    lines += [str(item) for pt in scheme.partitions(FS) for item in fstab_items(pt)]
+    return '\n'.join(lines) + '\n'
@@ -30,6 +30,12 @@ class DisksMountHelper:
     def __del__(self):
         self.on_exit()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.on_exit()
+
     @staticmethod
     def is_daemon_active():
         return Spawned.do(
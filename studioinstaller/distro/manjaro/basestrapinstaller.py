@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Unattended Manjaro installation: bootstraps a package set into the mounted target with basestrap
+
+   Packages are downloaded in parallel; fstab and the initramfs hooks are generated from the partitioning
+   scheme. The bootloader and the LUKS keys are set up by ``ManjaroPostInstaller`` as usual.
+"""
+
+from sys import exit as app_exit
+
+from ..osinstaller import OsInstaller
+from ...mounter import Mounter
+from ...configfile import scheme_fstab
+from ...partition import PVLuks
+from ...partition.base import FS
+from ... import util
+
+__all__ = ['ManjaroBasestrapInstaller']
+
+
+_tlog = util.tagged_logger("[ManjaroBasestrapInstaller]")
+
+BASE_PACKAGES = ["base", "mkinitcpio", "linux-firmware", "sudo", "networkmanager", "nano"]
+PARALLEL_DOWNLOADS = 8
+PACMAN_CONF = "/etc/pacman.conf"
+BASESTRAP_PACMAN_CONF = "/tmp/studioinstaller-pacman.conf"
+
+DEFAULT_USER_GROUPS = "wheel audio video storage optical network"
+
+
+def _enable_parallel_downloads(pacman_conf: str) -> str:
+    lines = [line for line in pacman_conf.splitlines() if not line.lstrip('#').strip().startswith("ParallelDownloads")]
+    options = lines.index("[options]") + 1 if "[options]" in lines else 0
+    lines.insert(options, f"ParallelDownloads = {PARALLEL_DOWNLOADS}")
+    return '\n'.join(lines) + '\n'
+
+
+class ManjaroBasestrapInstaller(OsInstaller):
+    def __init__(self, runtime_config):
+        super().__init__(runtime_config)
+        self.mounter = Mounter(self.chroot, self.scheme, self.jobs)
+        self.hostname = util.target.preseed_value("netcfg/hostname") or runtime_config.op.L
+
+    @property
+    def packages(self):
+        """The base set plus whatever the partitioning scheme requires"""
+        packages = list(BASE_PACKAGES)
+
+        # the same kernel series as the live system runs
+        packages += util.broker.do("pacman -Qq | grep -E '^linux[0-9]+$'", list_=True)[-1:] or ["linux"]
+
+        if self.scheme.partitions(PVLuks):
+            packages.append("cryptsetup")
+        if any(pt.lvm_vg for pt in self.scheme):
+            packages.append("lvm2")
+        if any(pt.fs == "btrfs" for pt in self.scheme.partitions(FS)):
+            packages.append("btrfs-progs")
+        if util.system.uefi_loaded():
+            packages.append("efibootmgr")
+
+        return packages
+
+    def _prepare_installation(self):
+        if not util.broker.do("which basestrap", with_status=True).success:
+            _tlog("basestrap isn't available (install 'manjaro-tools-base'). Abort...")
+            app_exit()
+
+        self.mounter.mount_volumes()
+
+    def _setup_unattended_installation(self):
+        pacman_conf = util.broker.read_file(PACMAN_CONF).decode()
+        util.broker.write_file(BASESTRAP_PACMAN_CONF, _enable_parallel_downloads(pacman_conf).encode())
+
+    def _begin_installation(self):
+        packages = self.packages
+        _tlog(f"bootstrapping {' '.join(packages)} ...")
+        reply = util.broker.run(f"basestrap -C {BASESTRAP_PACMAN_CONF} {self.chroot} {' '.join(packages)}")
+        assert reply.success, f"basestrap failed: {reply.err}"
+
+        # keep parallel downloads for the target system's pacman, e.g. in the post-installer
+        util.broker.do(f"cp {BASESTRAP_PACMAN_CONF} {self.chroot}{PACMAN_CONF}")
+
+        self.generate_fstab()
+        self.mounter.mount_pseudo_filesystems()
+
+        with util.chroot.ChrootSession(self.chroot) as cntx:
+            self.setup_hostname(cntx)
+            self.setup_locale(cntx)
+            self.setup_timezone(cntx)
+            self.setup_initramfs(cntx)
+            self.setup_user(cntx)
+
+        self.mounter.unmount_target_system()
+
+    def generate_fstab(self):
+        util.broker.write_file(f"{self.chroot}/etc/fstab", scheme_fstab(self.scheme).encode())
+
+    def setup_hostname(self, cntx):
+        cntx.do(f"""
+            echo "{self.hostname}" > /etc/hostname
+            echo "127.0.1.1 {self.hostname}" >> /etc/hosts
+            """)
+
+    def setup_locale(self, cntx):
+        lang = util.target.preseed_value("debian-installer/locale", "en_US")
+        lang = lang if '.' in lang else f"{lang}.UTF-8"
+        cntx.do(f"""
+            sed -Ei 's/^#({lang} )/\\1/' /etc/locale.gen
+            locale-gen
+            echo "LANG={lang}" > /etc/locale.conf
+            """)
+
+    def setup_timezone(self, cntx):
+        if timezone := util.target.preseed_value("time/zone"):
+            cntx.do(f"ln -sf /usr/share/zoneinfo/{timezone} /etc/localtime && hwclock --systohc")
+
+    def setup_initramfs(self, cntx):
+        hooks = ["base", "udev", "autodetect", "modconf", "block", "keyboard", "keymap"]
+        if self.scheme.partitions(PVLuks):
+            hooks.append("encrypt")
+        if any(pt.lvm_vg for pt in self.scheme):
+            hooks.append("lvm2")
+        hooks += ["filesystems", "fsck"]
+
+        cntx.do(f"sed -Ei 's/^HOOKS=.*/HOOKS=({' '.join(hooks)})/' /etc/mkinitcpio.conf")
+
+        # note: always, as the post-installer rebuilds the images only if it adds a keyfile (encrypted /boot)
+        cntx.do("mkinitcpio -P")
+
+    def setup_user(self, cntx):
+        username = util.target.preseed_value("passwd/username", "user")
+        fullname = util.target.preseed_value("passwd/user-fullname", username)
+
+        cntx.do(f"""
+            id -u {username} > /dev/null 2>&1 || {{
+                GROUPS_=$(for g in {DEFAULT_USER_GROUPS}; do getent group $g > /dev/null && printf "%s," $g; done)
+                useradd -m -s /bin/bash -c "{fullname}" -G "${{GROUPS_%,}}" {username}
+            }}
+            echo "%wheel ALL=(ALL) ALL" > /etc/sudoers.d/10-wheel
+            chmod 440 /etc/sudoers.d/10-wheel
+            """)
+
+        # note: the password is passed via stdin, so it doesn't appear in the commands log
+        password = util.target.get_target_upass(insystem_scheduled=True)
+        cntx.do("chpasswd", input=f"{username}:{password}\n")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Renders Calamares module configs from the partitioning scheme
+
+   Calamares can partition a disk without user interaction in the "erase" mode only, so it creates
+   the scheme's partitions by itself: they are described as its ``partitionLayout`` in the order of
+   their numbers, so that Calamares numbers them the same way (its ESP goes first). LUKS containers
+   are mapped to Calamares' encryption options; the passphrase is typed into Calamares and must be
+   the scheme's one, as the post-installer adds the keyfile with it. The layout can't express LVM
+   volumes, so such schemes are rejected (see ``unsupported()``).
+"""
+
+import re
+from pathlib import Path
+
+import yaml
+
+from ...action.statediff import expected_fs
+from ...partition.base import FS, LUKS, PV
+from ...scheme import Scheme
+from ... import util
+
+__all__ = ['CalamaresConfig', 'CALAMARES_DIR']
+
+
+CALAMARES_DIR = Path("/etc/calamares")
+
+DEFAULT_USER_GROUPS = ["wheel", "audio", "video", "storage", "optical", "network", "lp", "scanner", "sys"]
+
+
+def _calamares_size(size: str):
+    """Scheme's size (e.g. '200M', '' - the rest of the disk) => Calamares' one (e.g. '200MiB', '100%')"""
+    if not size or '%' in str(size):
+        return "100%"
+    size = str(size).strip().lstrip('+').upper().rstrip('B').rstrip('I')
+    return f"{size}iB" if size[-1:] in "KMGT" else size
+
+
+def _number(pt):
+    return int(re.search(r"(\d+)$", pt.id).group())
+
+
+class CalamaresConfig:
+    def __init__(self, scheme: Scheme, system_label: str):
+        self.scheme = scheme
+        self.system_label = system_label
+
+    @property
+    def _efi(self):
+        return next((pt for pt in self.scheme.partitions(FS) if 'efi' in pt.mountpoint), None)
+
+    @property
+    def _physical(self):
+        """The disk's partitions but the ESP, by number"""
+        return sorted((pt for pt in self.scheme.partitions(PV) if pt is not self._efi), key=_number)
+
+    def _volume(self, physical):
+        """The file system on a partition: the partition itself or the one inside its LUKS container"""
+        if isinstance(physical, FS):
+            return physical
+        return next((pt for pt in self.scheme.partitions(FS) if pt.parent is physical), None)
+
+    def unsupported(self):
+        """What the erase mode can't reproduce; Calamares must not be run with such a scheme"""
+        problems = []
+        if lvm := [pt.id for pt in self.scheme.partitions() if pt.lvm_vg]:
+            problems.append(f"LVM volumes ({', '.join(lvm)})")
+        if len({pt.disk for pt in self.scheme.partitions(PV)}) > 1:
+            problems.append("more than one disk")
+
+        efi, uefi = self._efi, util.system.uefi_loaded()
+        if uefi and not (efi and _number(efi) == 1):
+            problems.append("the ESP isn't partition 1, but Calamares creates it so")
+        if efi and not uefi:
+            problems.append("an ESP, but the system isn't booted in UEFI mode")
+
+        physical = self._physical
+        first = 2 if efi or uefi else 1
+        if [_number(pt) for pt in physical] != list(range(first, first + len(physical))):
+            problems.append("gaps in the partition numbers")
+        if any(_calamares_size(pt.size) == "100%" for pt in physical[:-1]):
+            problems.append("a partition taking the rest of the disk isn't the last one")
+        if unmounted := [pt.id for pt in physical if not ((v := self._volume(pt)) and (v.mountpoint or v.isswap))]:
+            problems.append(f"partitions with nothing mounted ({', '.join(unmounted)})")
+        if len({pt.luks_type for pt in self.scheme.partitions(LUKS)}) > 1:
+            problems.append("different LUKS types")
+
+        return problems
+
+    def partition_conf(self):
+        efi = self._efi
+        root = self.scheme.root_partition
+        luks = self.scheme.partitions(LUKS)
+
+        layout = []
+        for physical in self._physical:
+            volume = self._volume(physical)
+            entry = {"name": volume.label or physical.label or physical.id}
+            if volume.isswap:
+                entry["filesystem"] = "linuxswap"
+            else:
+                entry["filesystem"] = expected_fs(volume)
+                entry["mountPoint"] = volume.mountpoint
+            entry["size"] = _calamares_size(physical.size)
+            if luks:
+                entry["noEncrypt"] = not isinstance(physical, LUKS)
+            layout.append(entry)
+
+        conf = {
+            "efiSystemPartition": efi.mountpoint if efi else "/boot/efi",
+            # note: swap is a partition of the layout, so that it gets the scheme's number
+            "userSwapChoices": ["none"],
+            "initialSwapChoice": "none",
+            "initialPartitioningChoice": "erase",
+            "defaultFileSystemType": root.fs if root and root.fs else "ext4",
+            "enableLuksAutomatedPartitioning": bool(luks),
+            "partitionLayout": layout,
+        }
+        if efi and efi.size:
+            conf["efiSystemPartitionSize"] = _calamares_size(efi.size)
+        if luks:
+            conf["luksGeneration"] = str(luks[0].luks_type)
+        return conf
+
+    def mount_conf(self):
+        conf = {
+            "extraMounts": [
+                {"device": "proc", "fs": "proc", "mountPoint": "/proc"},
+                {"device": "sys", "fs": "sysfs", "mountPoint": "/sys"},
+                {"device": "/dev", "mountPoint": "/dev", "options": ["bind"]},
+                {"device": "tmpfs", "fs": "tmpfs", "mountPoint": "/run"},
+                {"device": "/run/udev", "mountPoint": "/run/udev", "options": ["bind"]},
+                {"device": "efivarfs", "fs": "efivarfs", "mountPoint": "/sys/firmware/efi/efivars", "efi": True},
+            ],
+        }
+
+        subvolumes = [{"mountPoint": mpoint, "subvolume": subv if subv.startswith('/') else f"/{subv}"}
+                      for pt in self.scheme.partitions(FS) if pt.fs == "btrfs"
+                      for subv, mpoint in pt.subvolumes.items()]
+        if subvolumes:
+            conf["btrfsSubvolumes"] = subvolumes
+
+        return conf
+
+    def users_conf(self):
+        username = util.target.preseed_value("passwd/username", "user")
+        fullname = util.target.preseed_value("passwd/user-fullname", username)
+        hostname = util.target.preseed_value("netcfg/hostname") or self.system_label
+
+        return {
+            "defaultGroups": DEFAULT_USER_GROUPS,
+            "autologinGroup": "autologin",
+            "doAutologin": False,
+            "sudoersGroup": "wheel",
+            "setRootPassword": False,
+            "doReusePassword": True,
+            "allowWeakPasswords": True,
+            "presets": {
+                "fullName": {"value": fullname, "editable": False},
+                "loginName": {"value": username, "editable": False},
+            },
+            "hostname": {"location": "EtcFile", "template": hostname},
+        }
+
+    def locale_conf(self):
+        conf = {"localeGenPath": "/etc/locale.gen"}
+        if timezone := util.target.preseed_value("time/zone"):
+            conf["region"], _, conf["zone"] = timezone.partition('/')
+        return conf
+
+    @staticmethod
+    def settings_conf(settings: dict):
+        """Tweaks the system's ``settings.conf``: no welcome page, no confirmation, quit once done"""
+        settings = dict(settings or {})
+        for phase in settings.get("sequence", []):
+            if "show" in phase:
+                phase["show"] = [m for m in phase["show"] if m != "welcome"]
+        settings["prompt-install"] = False
+        settings["quit-at-end"] = True
+        settings["hide-back-and-next-during-exec"] = True
+        return settings
+
+    def write(self, calamares_dir=CALAMARES_DIR):
+        modules = {
+            "partition": self.partition_conf(),
+            "mount": self.mount_conf(),
+            "users": self.users_conf(),
+            "locale": self.locale_conf(),
+        }
+        for name, conf in modules.items():
+            util.broker.write_file(f"{calamares_dir}/modules/{name}.conf", yaml.safe_dump(conf, sort_keys=False).encode())
+
+        settings_file = f"{calamares_dir}/settings.conf"
+        settings = yaml.safe_load(util.broker.read_file(settings_file)) if Path(settings_file).exists() else {}
+        util.broker.write_file(settings_file, yaml.safe_dump(self.settings_conf(settings), sort_keys=False).encode())
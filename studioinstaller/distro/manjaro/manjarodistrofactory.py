@@ -12,19 +12,34 @@
 #
 #  Copyright (c) 2021 remico
 
+from sys import exit as app_exit
+
+from ...argparser import INSTALLER_BASESTRAP, INSTALLER_SQUASHFS
 from ...runtimeconfig import RuntimeConfig
+from ... import util
 
 from ..distrofactorybase import DistroFactoryBase
+from ..osinstaller import OsInstaller
 
+from .basestrapinstaller import ManjaroBasestrapInstaller
 from .manjaroinstaller import ManjaroInstaller
 from .manjaropostinstaller import ManjaroPostInstaller
 
 __all__ = ['ManjaroDistroFactory']
 
 
+_tlog = util.tagged_logger("[ManjaroDistroFactory]")
+
+
 class ManjaroDistroFactory(DistroFactoryBase):
 
-    def getInstaller(self, runtime_config: RuntimeConfig) -> ManjaroInstaller:
+    def getInstaller(self, runtime_config: RuntimeConfig) -> OsInstaller:
+        if (installer := runtime_config.op.installer) == INSTALLER_SQUASHFS:
+            _tlog(f"'--installer {installer}' isn't supported on Manjaro. Abort...")
+            app_exit(1)
+
+        if runtime_config.op.installer == INSTALLER_BASESTRAP:
+            return ManjaroBasestrapInstaller(runtime_config)
         return ManjaroInstaller(runtime_config)
 
     def getPostInstaller(self, runtime_config: RuntimeConfig) -> ManjaroPostInstaller:
@@ -18,7 +18,9 @@ from sys import exit as app_exit
 
 from spawned import Spawned, SpawnedSU
 
+from .calamaresconfig import CalamaresConfig, CALAMARES_DIR
 from ..osinstaller import OsInstaller
+from ...argparser import INSTALLER_CALAMARES
 from ...mounter import Mounter
 from ... import util
 
@@ -28,13 +30,40 @@ __all__ = ['ManjaroInstaller']
 _tlog = util.tagged_logger("[ManjaroInstaller]")
 
 class ManjaroInstaller(OsInstaller):
+    def __init__(self, runtime_config):
+        super().__init__(runtime_config)
+        self.mounter = Mounter(self.chroot, self.scheme, self.jobs)
+        self.calamares = runtime_config.op.installer == INSTALLER_CALAMARES
+        self.system_label = runtime_config.op.L
+
+        # Calamares partitions and formats the disk by itself
+        self.partitions_disk = self.calamares
+
+        # checked before anything is done, so that a rejected scheme leaves the disks untouched
+        if self.calamares and (problems := CalamaresConfig(self.scheme, self.system_label).unsupported()):
+            _tlog(f"calamares can't install onto this scheme: {'; '.join(problems)}. Abort...")
+            app_exit(1)
+
     def _prepare_installation(self):
-        Mounter(self.chroot, self.scheme).mount_target_system()
+        if not self.calamares:
+            self.mounter.mount_target_system()
+            return
+
+        if not Path("/usr/bin/calamares_polkit").exists():
+            _tlog("calamares isn't available. Abort...")
+            app_exit()
+
+        # Calamares partitions the disk by itself, so the target must not be busy
+        self.mounter.unmount_target_system()
 
     def _setup_unattended_installation(self):
-        if not Path("/etc/calamares").exists():
+        if not CALAMARES_DIR.exists():
                 return
 
+        if self.calamares:
+            CalamaresConfig(self.scheme, self.system_label).write()
+            return
+
         packagename = util.package_name()
         calamares_modules = [
             str(f.locate()) for f in app_files(packagename) if "calamares" in str(f) and str(f).endswith(".conf")
@@ -43,7 +72,7 @@ class ManjaroInstaller(OsInstaller):
             SpawnedSU.do(f"mkdir -p /etc/calamares/modules && cp {' '.join(calamares_modules)} /etc/calamares/modules")
 
     def _begin_installation(self):
-        if 0:  # calamares
+        if self.calamares:
             Spawned.do("/usr/bin/calamares_polkit", timeout=Spawned.TIMEOUT_INFINITE)
 
         else:  # manjaro-architect
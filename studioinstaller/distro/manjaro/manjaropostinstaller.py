@@ -17,22 +17,75 @@ from pathlib import Path
 from spawned import ChrootContext
 
 from ...partition import PVLuks
-from ..postinstaller import PostInstaller
+from ..postinstaller import PostInstaller, PostStep, TRIGGER_INITRAMFS, TRIGGER_GRUB
 from ...partition.base import LUKS, Container
 from ... import util
 
 __all__ = ['ManjaroPostInstaller']
 
 
+KEYFILE = "/root/boot_os.keyfile"
+
+
 class ManjaroPostInstaller(PostInstaller):
     def _run(self):
         self.mounter.mount_target_system()
 
-        with ChrootContext(self.op.chroot) as cntx:
-            self.setup_bootloader(cntx)
+        with util.chroot.ChrootSession(self.op.chroot) as cntx:
+            self._run_steps(cntx, self.steps(cntx), self.triggers(cntx))
+
+        self.mounter.unmount_target_system()
+
+    def steps(self, cntx):
+        luks_volumes = self.scheme.partitions(LUKS, Container)
+        # guard: unencrypted /boot => don't use keyfiles !
+        keyfile = KEYFILE if luks_volumes and self.boot_encrypted else None
+
+        steps = [
+            # note: all the GRUB parameters go in one step, as they're edited in the same file
+            PostStep("grub config", self.configure_grub, cntx, keyfile,
+                     packages=self.grub_packages, provides=["grub config"], dirties=[TRIGGER_GRUB]),
+            # grub-install reads /etc/default/grub, e.g. to build cryptodisk support into core.img
+            PostStep("bootloader", cntx.do, self.grub_install,
+                     packages=self.grub_packages, requires=["grub config"], dirties=[TRIGGER_GRUB]),
+        ]
+
+        if keyfile:
+            steps += [
+                PostStep("keyfile", generate_keyfile, cntx, keyfile, provides=["keyfile"]),
+                PostStep("crypttab", self.setup_crypttab, cntx, luks_volumes, keyfile),
+                PostStep("initramfs config", add_initramfs_file, cntx, keyfile, dirties=[TRIGGER_INITRAMFS]),
+            ]
+            steps += [PostStep(f"luks key {pt.url}", luks_add_key, cntx, pt, keyfile, requires=["keyfile"])
+                      for pt in luks_volumes]
+
+        return steps
+
+    def triggers(self, cntx):
+        # note: just the installed kernel's preset, not every one found in /etc/mkinitcpio.d
+        kernel = util.target.installed_kernel(self.op.chroot)
+        pkgbase = Path(f"{self.op.chroot}/usr/lib/modules/{kernel}/pkgbase")
+        mkinitcpio = f"mkinitcpio -p {pkgbase.read_text().strip()}" if kernel and pkgbase.exists() else "mkinitcpio -P"
+
+        return {
+            # the initramfs might embed a keyfile
+            TRIGGER_INITRAMFS: lambda: cntx.do(f"{mkinitcpio} && chmod 600 /boot/initramfs-*"),
+            TRIGGER_GRUB: lambda: cntx.do("update-grub"),
+        }
+
+    def reconfigure_restored(self):
+        self.mounter.mount_target_system()
 
-            luks_volumes = self.scheme.partitions(LUKS, Container)
-            self.setup_luks_volumes(cntx, luks_volumes)
+        with util.chroot.ChrootSession(self.op.chroot) as cntx:
+            # note: the keyfile and the config files come from the image, UUIDs are already updated there
+            if Path(f"{self.op.chroot}{KEYFILE}").exists():
+                for pt in self.scheme.partitions(LUKS, Container):
+                    luks_add_key(cntx, pt, KEYFILE)
+
+            cntx.do(self.grub_install)
+
+            for regenerate in self.triggers(cntx).values():
+                regenerate()
 
         self.mounter.unmount_target_system()
 
@@ -40,7 +93,7 @@ class ManjaroPostInstaller(PostInstaller):
         self.mounter.mount_target_system()
 
         with ChrootContext(self.op.chroot) as cntx:
-            cntx.do("pacman --noconfirm --needed --noprogressbar -S python-pip git")
+            # note: the inject_packages are installed by now
 
             # install the tool into the target system
             x_extras = '[seed]' if extras else ''
@@ -53,8 +106,34 @@ class ManjaroPostInstaller(PostInstaller):
 
         self.mounter.unmount_target_system()
 
-    def setup_bootloader(self, cntx):
-        grub_id = self.op.L
+    def install_packages(self, cntx, packages):
+        if packages:
+            cntx.do(f"pacman --noconfirm --needed --noprogressbar -S {' '.join(packages)}")
+
+    @property
+    def inject_packages(self):
+        return ["python-pip", "git"]
+
+    @property
+    def grub_install(self):
+        """Bootloader installation command"""
+        if util.system.uefi_loaded():
+            return f"grub-install --recheck --efi-directory=/boot/efi --bootloader-id={self.op.L} --boot-directory=/boot"
+        return f"grub-install --recheck --boot-directory=/boot {self.disk}"
+
+    @property
+    def grub_packages(self):
+        packages = ["grub"]
+        if self.scheme.root_partition.fs == "btrfs":
+            packages.append("grub-btrfs")
+        return packages
+
+    @property
+    def boot_encrypted(self):
+        return any(isinstance(p, PVLuks) for p in self.scheme.boot_partition.pchain)
+
+    def configure_grub(self, cntx, keyfile=None):
+        grub_cmdline_linux = []
 
         # root partition
         partition_root = self.scheme.root_partition
@@ -62,33 +141,25 @@ class ManjaroPostInstaller(PostInstaller):
 
         # define encryption-related kernel parameters
         if partition_root_encrypted:
-            root_pv_uuid = ''
-            while not root_pv_uuid:
-                for pt in partition_root.pchain:
-                    if isinstance(pt, PVLuks):
-                        root_pv_uuid = pt.uuid
-
-            root_mapper_id = ''
-            while not root_mapper_id:
-                for pt in partition_root.pchain:
-                    if isinstance(pt.parent, PVLuks):
-                        root_mapper_id = pt.mapperID
+            root_pv = next(pt for pt in partition_root.pchain if isinstance(pt, PVLuks))
+            root_pv_uuid = util.devwait.wait_for_uuid(root_pv.url) or root_pv.uuid
+
+            root_mapper_id = next((pt.mapperID for pt in partition_root.pchain if isinstance(pt.parent, PVLuks)), '')
+            assert root_mapper_id, "Can't find the mapper ID of the root partition's LUKS container"
 
             cryptdevice_param = f"cryptdevice=UUID={root_pv_uuid}:{root_mapper_id}" if root_pv_uuid else ""
             cryptdevice_options = ":allow-discards" if cryptdevice_param and util.blockdevice.solid(partition_root.url) else ""
 
-            grub_cmdline_linux = f"{cryptdevice_param}{cryptdevice_options}"
+            grub_cmdline_linux.append(f"{cryptdevice_param}{cryptdevice_options}")
 
-            config_root_encrypted = rf"""
-                sed -Ei 's,GRUB_CMDLINE_LINUX="(.*)",GRUB_CMDLINE_LINUX="\1 {grub_cmdline_linux}",' /etc/default/grub
-                """
+        if keyfile:
+            grub_cmdline_linux.append(f"cryptkey=rootfs:{keyfile}")
 
-        enable_root_encrypted = config_root_encrypted if partition_root_encrypted else ""
+        enable_cmdline = rf"""
+            sed -Ei 's,GRUB_CMDLINE_LINUX="(.*)",GRUB_CMDLINE_LINUX="\1 {' '.join(grub_cmdline_linux)}",' /etc/default/grub
+            """ if grub_cmdline_linux else ""
 
         # boot partition
-        partition_boot = self.scheme.boot_partition
-        partition_boot_encrypted = any(isinstance(p, PVLuks) for p in partition_boot.pchain)
-
         config_grub_encrypted = rf"""
             FILE=/etc/default/grub
 
@@ -96,47 +167,17 @@ class ManjaroPostInstaller(PostInstaller):
             && sed -i s/^#GRUB_ENABLE_CRYPTODISK=y/GRUB_ENABLE_CRYPTODISK=y/ $FILE \
             || echo "GRUB_ENABLE_CRYPTODISK=y" >> $FILE
             """
-        enable_grub_encrypted = config_grub_encrypted if partition_boot_encrypted else ""
-
-        # bootloader packages to install
-        grub_packages = "grub"
-
-        if partition_root.fs == "btrfs":
-            grub_packages += " grub-btrfs"
-
-        # bootloader installation command
-        if util.system.uefi_loaded():
-            grub_install = f"grub-install --recheck --efi-directory=/boot/efi --bootloader-id={grub_id} --boot-directory=/boot"
-        else:
-            grub_install = f"grub-install --recheck --boot-directory=/boot {self.disk}"
+        enable_grub_encrypted = config_grub_encrypted if self.boot_encrypted else ""
 
-        # execute installation
-        cntx.do(f"""
-            pacman --noconfirm --needed --noprogressbar -S {grub_packages}
-            {enable_root_encrypted}
-            {enable_grub_encrypted}
-            {grub_install}
-            """)
-
-        cntx.do("update-grub")
-
-    def setup_luks_volumes(self, cntx, volumes):
-        # guard: keyfiles unnecessary
-        if not volumes:
-            return
-
-        # guard: unencrypted /boot => don't use keyfiles !
-        if not any(isinstance(p, PVLuks) for p in self.scheme.boot_partition.pchain):
-            return
-
-        keyfile = "/root/boot_os.keyfile"
-        cryptkey_param = f"cryptkey=rootfs:{keyfile}"
-
-        generate_keyfile(cntx, keyfile)
+        if enable_cmdline or enable_grub_encrypted:
+            cntx.do(f"""
+                {enable_cmdline}
+                {enable_grub_encrypted}
+                """)
 
+    def setup_crypttab(self, cntx, volumes, keyfile):
+        entries = []
         for pt in volumes:
-            luks_add_key(cntx, pt, keyfile)
-
             # skip adding a luks partition with the root FS inside; it's unlocked via a kernel parameter
             if any(pt == p for p in self.scheme.root_partition.pchain):
                 continue
@@ -144,17 +185,13 @@ class ManjaroPostInstaller(PostInstaller):
             opts = "luks"
             if util.blockdevice.discardable(pt):
                 opts += ",discard"
-            cntx.do(f'echo "{pt.mapperID} UUID={pt.uuid} {keyfile} {opts}" >> /etc/crypttab')
+            entries.append(f"{pt.mapperID} UUID={pt.uuid} {keyfile} {opts}")
 
-        cntx.do(rf"""
-            sed -Ei 's,FILES=\((.*)\),FILES=(\1 {keyfile}),' /etc/mkinitcpio.conf
-            mkinitcpio -P
-            chmod 600 /boot/initramfs-*
+        cntx.append("/etc/crypttab", entries)
 
-            sed -Ei 's,GRUB_CMDLINE_LINUX="(.*)",GRUB_CMDLINE_LINUX="\1 {cryptkey_param}",' /etc/default/grub
-            """)
 
-        cntx.do("update-grub")
+def add_initramfs_file(cntx, path):
+    cntx.do(rf"sed -Ei 's,FILES=\((.*)\),FILES=(\1 {path}),' /etc/mkinitcpio.conf")
 
 
 def generate_keyfile(cntx, keyfile):
@@ -177,8 +214,8 @@ def luks_add_key(cntx, pt, key):
     if util.blockdevice.test_luks_key(pt.url, '/'.join([cntx.root, key])):
         return
 
-    with cntx.doi(f"cryptsetup luksAddKey {pt.url} {key}") as t:
-        t.interact("Enter any existing passphrase:", pt.passphrase)
+    # note: the passphrase is passed via stdin
+    cntx.do(f"cryptsetup luksAddKey --key-file=- {pt.url} {key}", input=pt.passphrase)
 
 
 # TODO pacman -S hibernator && resume=UUID=... kernel parameter
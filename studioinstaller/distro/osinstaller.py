@@ -22,6 +22,8 @@ class OsInstaller(ABC):
     def __init__(self, runtime_config: RuntimeConfig) -> None:
         self.scheme = runtime_config.scheme
         self.chroot = runtime_config.op.chroot
+        self.jobs = runtime_config.op.j
+        self.partitions_disk = False  # True - the installer creates the scheme's partitions by itself
 
     def execute(self):
         self._prepare_installation()
@@ -12,12 +12,45 @@
 #
 #  Copyright (c) 2021 remico
 
+import threading
 from abc import abstractclassmethod, ABC
 
 from ..runtimeconfig import RuntimeConfig
 from ..mounter import Mounter
+from .. import util
 
-__all__ = ['PostInstaller']
+__all__ = ['PostInstaller', 'PostStep', 'PACKAGES', 'TRIGGER_INITRAMFS', 'TRIGGER_GRUB']
+
+
+# provided by the single package transaction made before any step needing packages
+PACKAGES = "packages"
+
+
+# artifacts regenerated once all the post-installation steps are done
+TRIGGER_INITRAMFS = "initramfs"
+TRIGGER_GRUB = "grub config"
+
+
+class PostStep:
+    """A post-installation step: ``func(*args)`` along with what it needs and what it makes,
+    e.g. requires=["keyfile"], provides=["crypttab"], the distro ``packages`` it needs installed
+    and the artifacts it makes stale, e.g. dirties=[TRIGGER_GRUB]
+    """
+
+    def __init__(self, name, func, *args, requires=(), provides=(), packages=(), dirties=()):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.packages = list(packages)
+        self.requires = set(requires) | ({PACKAGES} if self.packages else set())
+        self.provides = set(provides)
+        self.dirties = set(dirties)
+
+    def __repr__(self):
+        return f"PostStep({self.name})"
+
+    def depends(self, other):
+        return bool(self.requires & other.provides)
 
 
 class PostInstaller(ABC):
@@ -25,15 +58,66 @@ class PostInstaller(ABC):
         self.scheme = runtime_config.scheme
         self.op = runtime_config.op
         self.disk = runtime_config.disk
-        self.mounter = Mounter(self.op.chroot, self.scheme)
+        self.mounter = Mounter(self.op.chroot, self.scheme, self.op.j)
 
     def execute(self):
         self._run()
 
+    def _run_steps(self, cntx, steps, triggers):
+        """Run independent steps concurrently (up to ``-j`` at a time), each one recorded in the state journal;
+        the packages of all the steps are installed first, in a single transaction;
+        once all of them are done, every artifact they made dirty is regenerated exactly once
+        """
+        packages = [p for step in steps for p in step.packages]
+        if self.op.inject is not None:
+            packages += self.inject_packages
+        if packages := list(dict.fromkeys(packages)):
+            # note: the list is a part of the name, so that a re-run installs whatever was added since
+            steps = [PostStep(f"packages {' '.join(packages)}", self.install_packages, cntx, packages,
+                              provides=[PACKAGES]), *steps]
+
+        dirty = set()
+        lock = threading.Lock()
+
+        def run(step):
+            # note: a step done on a previous run still counts, as the regeneration might have never happened
+            util.journal.run(step.name, step.func, *step.args)
+            with lock:
+                dirty.update(step.dirties)
+
+        util.dag.run_dag(steps, run, lambda step, other: step.depends(other), self.op.j)
+
+        for artifact, regenerate in triggers.items():
+            if artifact in dirty:
+                util.journal.run(f"trigger {artifact}", regenerate)
+
     @abstractclassmethod
     def _run(self):
         pass
 
+    @abstractclassmethod
+    def install_packages(self, cntx, packages):
+        """All the ``packages`` in one transaction"""
+        pass
+
+    @property
+    @abstractclassmethod
+    def inject_packages(self):
+        """Packages ``inject_tool`` needs; they're installed along with the others beforehand"""
+        pass
+
+    @abstractclassmethod
+    def triggers(self, cntx):
+        """{artifact: regenerate()} in the order of regeneration, i.e. the initramfs goes before the GRUB config"""
+        pass
+
     @abstractclassmethod
     def inject_tool(self, extras=False, develop=False):
         pass
+
+    @abstractclassmethod
+    def reconfigure_restored(self):
+        """Redo the UUID-dependent steps only (LUKS keys, crypttab, initramfs, bootloader)
+        on a system restored from a golden image
+        """
+        pass
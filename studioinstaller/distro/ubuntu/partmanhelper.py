@@ -20,12 +20,13 @@
 """
 
 import re
+import threading
 from pathlib import Path
 
-from spawned import Spawned, SpawnedSU, create_py_script
+from spawned import Spawned
 
 from ...scheme import Scheme
-from ...util import tagged_logger
+from ...util import broker, devwait, sysfs, tagged_logger
 
 __all__ = ['PartmanHelper']
 
@@ -36,48 +37,34 @@ PARTMAN_BASE = Path("/var/lib/partman")
 
 
 class PathResolver:
-    def __init__(self):
-        self._system_volumes = {}
-
-    @property
-    def system_volumes(self):
-        if not self._system_volumes:
-            t = SpawnedSU("parted -s /dev 'unit B print all' 2>/dev/null")
+    """Resolves partman's paths of volumes from their geometry read from sysfs"""
 
-            current_key = ""
-
-            re_disk_name = r"Disk[\s\t]+(.*?):[\s\t]+\d+"
-            re_partition_number = r"(\d+)[\s\t]+(\d+)B[\s\t]+(\d+)B[\s\t]+(\d+)B"
+    def __init__(self):
+        self._system_volumes = {}  # {volume_url: (begin-end, disk_url)}
 
-            def geometry_parser(data_line):
-                nonlocal current_key
+    @staticmethod
+    def _geometry(volume_url: str):
+        sys_dir = sysfs.block_dir(volume_url)
+        assert sys_dir, f"Unknown volume '{volume_url}'"
 
-                if mo := re.search(re_disk_name, data_line):
-                    # group-1 : disk, e.g. /dev/sda or /dev/mapper/swap
-                    current_key = mo.group(1)
-                    return
-                elif mo := re.search(re_partition_number, data_line):
-                    partition_number = mo.group(1)
-                    first_byte = mo.group(2)
-                    last_byte = mo.group(3)
-                    volume_key = current_key if "mapper" in current_key else current_key + partition_number
-                    # returns a tuple ('volume_url', 'begin-end', 'disk_url') for each partition
-                    return volume_key, f"{first_byte}-{last_byte}", current_key
+        # note: sysfs 'start' and 'size' are always in 512-byte sectors
+        size = int(sysfs.read_attr(sys_dir / "size", 0)) * 512
 
-            # {volume_url: (begin-end, disk_url)}
-            self._system_volumes = {tpl[0]: (tpl[1], tpl[2]) for line in t.datalines if (tpl := geometry_parser(line))}
+        if (sys_dir / "partition").exists():
+            start = int(sysfs.read_attr(sys_dir / "start", 0)) * 512
+            disk_url = f"/dev/{sys_dir.resolve().parent.name}"
+        else:  # partman treats a mapper device (e.g. /dev/mapper/swap or an LVM LV) as a disk with a single volume
+            start = 0
+            dm_name = sysfs.read_attr(sys_dir / "dm/name")
+            disk_url = f"/dev/mapper/{dm_name}" if dm_name else f"/dev/{sys_dir.name}"
 
-        return self._system_volumes
+        # partman names volumes by their first and last bytes
+        return f"{start}-{start + size - 1}", disk_url
 
     def volume(self, volume_url: str):
-        try:
-            return self.system_volumes[volume_url]
-        except KeyError:  # fallback: try LVM LV name conversion rules
-            _v = volume_url.split('/')
-            if len(_v) == 4:
-                volume_url = f"/dev/mapper/{_v[2].replace('-', '--')}-{_v[3]}"
-                return self.system_volumes[volume_url]
-            raise
+        if volume_url not in self._system_volumes:
+            self._system_volumes[volume_url] = self._geometry(volume_url)
+        return self._system_volumes[volume_url]
 
     def system_disk(self, volume_url: str):
         return self.volume(volume_url)[1]  # disk_url
@@ -96,28 +83,89 @@ class PathResolver:
         return Path(pm_disk, pm_volume_name)
 
 
-def re_script():
-    re_pattern = r"\${!TAB}\${!TAB}\${!TAB}(\w+)\${!TAB}\${!TAB}\${!TAB}"
-    re_replacement = r"${!TAB}${!TAB}%s${!TAB}\1${!TAB}${!TAB}%s${!TAB}"
+_TAB = "${!TAB}"  # partman's visual columns separator
+# an unmarked volume: empty 'method' column, a file system and empty 'mountpoint' column
+_RE_VISUALS = re.compile(re.escape(_TAB * 3) + r"(\w+)" + re.escape(_TAB * 3))
 
-    script = f"""
-import sys, re, fileinput
 
-file = sys.argv[1]
-format = True if sys.argv[2] == "True" else False
-mountpoint = sys.argv[3]
+def update_visuals(file: Path, do_format: bool, mountpoint: str, volume_name=None):
+    """Show the volume's method (F - format, K - keep) and mountpoint in partman's visual file.
+    ``volume_name`` - if set, only lines mentioning the volume are updated
+        (cache and snoop files describe all the volumes)
+    """
+    if not file.exists():
+        return
 
-pattern = {re_pattern}
-repl = {re_replacement} % ('F' if format else 'K', mountpoint)
+    method = 'F' if do_format else 'K'
 
-try:
-    with fileinput.FileInput(file, inplace=True, backup='.bak') as f:
-        for line in f:
-            print(re.sub(pattern, repl, line), end='')
-except FileNotFoundError:
-    pass
-    """
-    return script
+    def repl(mo):
+        return f"{_TAB * 2}{method}{_TAB}{mo.group(1)}{_TAB * 2}{mountpoint}{_TAB}"
+
+    lines = broker.read_file(file).decode().splitlines(keepends=True)
+    updated = [_RE_VISUALS.sub(repl, line) if not volume_name or volume_name in line else line for line in lines]
+
+    if updated != lines:
+        broker.write_file(file, ''.join(updated).encode())
+
+
+class _Volume:
+    """Partman's volume to be marked: waits for its directory, then for its detected file system if kept"""
+
+    def __init__(self, path: Path, mountpoint, do_format, fs):
+        self.path = path
+        self.mountpoint = mountpoint
+        self.do_format = do_format
+        self.fs = fs
+        self.awaited = path  # the path whose appearance moves the volume to the next stage
+
+    def _write(self, name, value=''):
+        broker.write_file(self.path / name, f"{value}\n".encode() if value else b"")
+
+    # do not use: filesystem {<last_manually_specified>}, existing, formatable
+    # use as is: ++ acting_filesystem {ext4}, method {keep}, use_filesystem
+    # format: ++ method {format}, format
+    # use mounted: ++ mountpoint {<path>}
+    def _mark(self):
+        self._write("existing")
+        self._write("formatable")
+        self._write("use_filesystem")
+        self._write("mountpoint", self.mountpoint)
+
+        if self.do_format:
+            self._write("format")
+            self._write("method", "format")
+            self._write("filesystem", self.fs)
+            self._write("acting_filesystem", self.fs)
+        else:
+            self._write("method", "keep")
+            self.awaited = self.path / "detected_filesystem"
+
+    def _keep(self):
+        fs = broker.read_file(self.awaited).decode().strip()
+        self._write("acting_filesystem", fs)
+        self._write("filesystem", fs)
+
+    def _update_visuals(self):
+        self._write("visual_mountpoint", self.mountpoint)
+        update_visuals(self.path / "view", self.do_format, self.mountpoint)
+        update_visuals(self.path.parent / "partition_tree_cache", self.do_format, self.mountpoint, self.path.name)
+        update_visuals(PARTMAN_BASE / "snoop", self.do_format, self.mountpoint, self.path.name)
+
+    def step(self):
+        """Do whatever is possible right now; returns True once the volume is completely marked"""
+        if not self.awaited.exists():
+            return False
+
+        if self.awaited == self.path:
+            _tlog(f"marking {self.path} ...")
+            self._mark()
+            if not self.do_format:
+                return self.step()
+        else:
+            self._keep()
+
+        self._update_visuals()
+        return True
 
 
 class PartmanHelper:
@@ -125,6 +173,7 @@ class PartmanHelper:
     def __init__(self, scheme: Scheme):
         self.scheme = scheme
         self.resolver = PathResolver()
+        self.volumes = []
 
     def run(self):
         # check partman availability
@@ -132,60 +181,26 @@ class PartmanHelper:
             _tlog("[II] partman not found => skip PartmanHelper actions")
             return
 
-        script = re_script()
-        self.visuals_updater = create_py_script(script)
-
-        SpawnedSU.do_script(f"""
-            echo "Waiting for PARTMAN files in '{PARTMAN_BASE}' ..."
-            while [ ! -d {PARTMAN_BASE} ]; do
-                sleep 1
-            done
-            echo ""PARTMAN files found. Ready for processing.""
-            """)
-
         for p in self.scheme:
             if p.mountpoint and not p.isspecial:
                 self.mark_to_use(p.url, p.mountpoint, p.do_format, p.fs)
 
-    # do not use: filesystem {<last_manually_specified>}, existing, formatable
-    # use as is: ++ acting_filesystem {ext4}, method {keep}, use_filesystem
-    # format: ++ method {format}, format
-    # use mounted: ++ mountpoint {<path>}
+        # partman is started by the OS installer later, so its files are tracked in background
+        _tlog(f"Waiting for PARTMAN files in '{PARTMAN_BASE}' ...")
+        threading.Thread(target=self._watch, daemon=True).start()
+
     def mark_to_use(self, volume_url, mountpoint, do_format, fs):
         volume_path = self.resolver.pm_resolve_volume_path(volume_url)
-        SpawnedSU.do_script(f"""
-            while [ ! -d {volume_path} ]
-            do
-                sleep 1
-                echo "waiting for {volume_path} ..."
-            done
-
-            touch {volume_path}/existing
-            touch {volume_path}/formatable
-            touch {volume_path}/use_filesystem
-            echo "{mountpoint}" > {volume_path}/mountpoint
-
-            if [ "{do_format}" == "True" ]; then
-                touch {volume_path}/format
-                echo "format" > {volume_path}/method
-                echo "{fs}" > {volume_path}/filesystem
-                echo "{fs}" > {volume_path}/acting_filesystem
-            else
-                echo "keep" > {volume_path}/method
-
-                while [ ! -f {volume_path}/detected_filesystem ]
-                do
-                    sleep 1
-                    echo "waiting for {volume_path}/detected_filesystem ..."
-                done
-
-                cat {volume_path}/detected_filesystem > {volume_path}/acting_filesystem
-                cat {volume_path}/detected_filesystem > {volume_path}/filesystem
-            fi
-
-            # replace visuals
-            echo "{mountpoint}" > {volume_path}/visual_mountpoint
-            python3 "{self.visuals_updater}" "{volume_path}/view" "{do_format}" "{mountpoint}"
-            python3 "{self.visuals_updater}" "{volume_path}/../partition_tree_cache" "{do_format}" "{mountpoint}"
-            python3 "{self.visuals_updater}" "{PARTMAN_BASE}/snoop" "{do_format}" "{mountpoint}"
-            """)
+        self.volumes.append(_Volume(volume_path, mountpoint, do_format, fs))
+
+    def _watch(self):
+        """One inotify watcher for all the volumes; each one is marked as soon as partman creates it"""
+        pending = list(self.volumes)
+
+        def process():
+            pending[:] = [v for v in pending if not v.step()]
+            return not pending
+
+        # note: the watches are moved down the tree as partman creates its directories
+        devwait.wait_until(process, lambda: [v.awaited.parent for v in pending], timeout=None)
+        _tlog("All volumes are marked")
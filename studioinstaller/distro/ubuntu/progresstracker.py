@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Tracks ubiquity's progress by tailing its debconf log
+
+   ubiquity logs every debconf PROGRESS command it gets from its install scripts, so the stages,
+   their timing and the overall percentage are known without any polling of the installer itself.
+   The installation is considered finished once the target system gets unmounted.
+"""
+
+import os
+import re
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+
+from ...util import broker, devwait, sysfs, tagged_logger
+
+__all__ = ['UbiquityProgressTracker']
+
+
+_tlog = tagged_logger("[Ubiquity]")
+
+INSTALLER_LOG = Path("/var/log/installer/debug")
+
+_RE_PROGRESS = re.compile(r"<-- PROGRESS (START|SET|STEP|REGION|INFO|STOP)\s*(.*)")
+
+
+class _ProgressBar:
+    def __init__(self, min_, max_):
+        self.min = min_
+        self.max = max_
+        self.value = min_
+        self.region = None  # (begin, end) of the nested bar, in this bar's units
+
+
+class UbiquityProgressTracker:
+    def __init__(self, target):
+        self.target = os.path.realpath(target)
+        self.offset = 0
+        self.bars = []  # nested debconf progress bars
+        self.started = time.monotonic()
+        self.stages = []  # [(stage, start time)]
+        self.target_mounted = False
+        self.completed = False
+        self._reported_percent = 0
+
+    def _elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def fraction(self):
+        """Overall progress, 0..1; a nested bar fills its parent's region"""
+        fraction = None
+        for bar in reversed(self.bars):
+            pos = bar.value
+            if fraction is not None and bar.region:
+                pos = bar.region[0] + fraction * (bar.region[1] - bar.region[0])
+            fraction = (pos - bar.min) / (bar.max - bar.min) if bar.max > bar.min else 0
+        return min(max(fraction or 0, 0), 1)
+
+    def _eta(self, fraction):
+        return self._elapsed() * (1 - fraction) / fraction if fraction > 0 else None
+
+    def _on_progress(self, command, args):
+        args = args.split()
+
+        if command == "START" and len(args) >= 2:
+            self.bars.append(_ProgressBar(int(args[0]), int(args[1])))
+        elif command == "STOP" and self.bars:
+            self.bars.pop()
+        elif command == "SET" and self.bars and args:
+            self.bars[-1].value = int(args[0])
+        elif command == "STEP" and self.bars and args:
+            self.bars[-1].value += int(args[0])
+        elif command == "REGION" and self.bars and len(args) >= 2:
+            self.bars[-1].region = (int(args[0]), int(args[1]))
+        elif command == "INFO" and args:
+            self._on_stage(args[0].rsplit('/', 1)[-1])
+
+        percent = int(self.fraction * 100)
+        if percent >= self._reported_percent + 10:
+            self._reported_percent = percent - percent % 10
+            eta = self._eta(self.fraction)
+            _tlog(f"{percent}% done, ETA {eta:.0f}s" if eta is not None else f"{percent}% done")
+
+    def _on_stage(self, stage):
+        if self.stages and self.stages[-1][0] == stage:
+            return
+        self.stages.append((stage, self._elapsed()))
+        _tlog(f"{time.strftime('%H:%M:%S')} +{self._elapsed():.0f}s stage: {stage}")
+
+    def _read_log(self):
+        try:
+            size = os.stat(INSTALLER_LOG).st_size
+        except OSError:
+            return
+
+        if size < self.offset:  # the log was rotated
+            self.offset = 0
+        if size == self.offset:
+            return
+
+        data = broker.pread(str(INSTALLER_LOG), self.offset, size - self.offset)
+        # process complete lines only; the rest is read next time
+        data = data[:data.rfind(b"\n") + 1]
+        self.offset += len(data)
+
+        for line in data.decode(errors="replace").splitlines():
+            if mo := _RE_PROGRESS.search(line):
+                try:
+                    self._on_progress(*mo.groups())
+                except ValueError:
+                    pass
+
+    def _check_target(self):
+        mounted = any(m == self.target or m.startswith(self.target.rstrip('/') + '/') for _, m in sysfs.mounts())
+        if mounted:
+            self.target_mounted = True
+        elif self.target_mounted:
+            self.completed = True
+
+    def poll(self):
+        self._read_log()
+        self._check_target()
+        return self.completed
+
+    def track(self, installer_finished):
+        """Block until the installation is done, i.e. the target system was mounted and then unmounted,
+        or until the installer process exits (``installer_finished`` - a ``threading.Event``)
+        """
+        _tlog(f"tracking the installation progress in '{INSTALLER_LOG}' ...")
+
+        # a single watcher for the whole run: it wakes up on the log writes, on the mount table changes
+        # (the kernel flags /proc/self/mountinfo with POLLPRI) and on the installer exit (via a pipe)
+        wake_r, wake_w = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+        def on_installer_exit():
+            installer_finished.wait()
+            with suppress(OSError):
+                os.write(wake_w, b"\0")
+            os.close(wake_w)
+
+        threading.Thread(target=on_installer_exit, daemon=True).start()
+
+        try:
+            with open("/proc/self/mountinfo") as mounts:
+                devwait.wait_until(lambda: self.poll() or installer_finished.is_set(), INSTALLER_LOG.parent,
+                                   timeout=None, modify=True, wake_fds=[wake_r, mounts.fileno()])
+        finally:
+            os.close(wake_r)
+
+        self.poll()
+        self.report()
+
+    def report(self):
+        total = self._elapsed()
+        _tlog(f"installation took {total:.0f}s")
+
+        ends = [start for _, start in self.stages[1:]] + [total]
+        for (stage, start), end in zip(self.stages, ends):
+            _tlog(f"  {stage:<32} {end - start:7.1f}s")
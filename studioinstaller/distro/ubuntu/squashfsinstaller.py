@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Installs Ubuntu by unpacking the live system's squashfs image straight onto the target partitions
+
+   Much faster than ubiquity: the image is unpacked using all CPU cores, then only the minimal
+   configuration (hostname, locale, timezone, user, fstab) is done; the bootloader, crypttab
+   and initramfs are set up by the post-installer as usual.
+"""
+
+import os
+from pathlib import Path
+from sys import exit as app_exit
+
+from ..osinstaller import OsInstaller
+from ...configfile import scheme_fstab
+from ...mounter import Mounter
+from ... import util
+
+__all__ = ['UbuntuSquashfsInstaller']
+
+
+_tlog = util.tagged_logger("[UbuntuSquashfsInstaller]")
+
+CASPER_DIRS = [Path("/cdrom/casper"), Path("/run/live/medium/casper")]
+SQUASHFS_IMAGES = ["filesystem.squashfs", "minimal.standard.live.squashfs", "minimal.squashfs"]
+
+DEFAULT_USER_GROUPS = "adm cdrom sudo dip plugdev lpadmin sambashare"
+
+
+def find_casper_file(*names):
+    """The first existing file of the live medium's casper directory"""
+    return next((str(path) for d in CASPER_DIRS for name in names if (path := d / name).exists()), "")
+
+
+class UbuntuSquashfsInstaller(OsInstaller):
+    def __init__(self, runtime_config):
+        super().__init__(runtime_config)
+        self.mounter = Mounter(self.chroot, self.scheme, self.jobs)
+        self.hostname = util.target.preseed_value("netcfg/hostname") or runtime_config.op.L
+
+    def _prepare_installation(self):
+        self.squashfs = find_casper_file(*SQUASHFS_IMAGES)
+        if not self.squashfs:
+            _tlog("live system's squashfs image not found. Abort...")
+            app_exit()
+
+        if not util.broker.do("which unsquashfs", with_status=True).success:
+            _tlog("unsquashfs isn't available (install 'squashfs-tools'). Abort...")
+            app_exit()
+
+        self.mounter.mount_volumes()
+
+    def _setup_unattended_installation(self):
+        pass  # no installer to be preseeded: the preseeding file values are applied directly
+
+    def _begin_installation(self):
+        cores = os.cpu_count() or 1
+        _tlog(f"unpacking {self.squashfs} to {self.chroot} using {cores} cores ...")
+        reply = util.broker.run(f"unsquashfs -f -no-progress -p {cores} -d {self.chroot} {self.squashfs}")
+        assert reply.success, f"Unpacking failed: {reply.err}"
+
+        # the image's fstab is the live system's one
+        util.broker.write_file(f"{self.chroot}/etc/fstab", scheme_fstab(self.scheme).encode())
+        self.mounter.mount_pseudo_filesystems()
+
+        with util.chroot.ChrootSession(self.chroot) as cntx:
+            self.setup_kernel(cntx)
+            self.setup_hostname(cntx)
+            self.setup_locale(cntx)
+            self.setup_timezone(cntx)
+            self.setup_user(cntx)
+            self.remove_live_packages(cntx)
+
+        self.mounter.unmount_target_system()
+
+    def setup_kernel(self, cntx):
+        # the live image's kernel lives on the medium, not inside the squashfs
+        if vmlinuz := find_casper_file("vmlinuz"):
+            util.broker.do(f'[ -e {self.chroot}/boot/vmlinuz-"$(uname -r)" ] || '
+                           f'cp {vmlinuz} {self.chroot}/boot/vmlinuz-"$(uname -r)"')
+        cntx.do("""
+            rm -f /etc/machine-id /var/lib/dbus/machine-id
+            systemd-machine-id-setup
+            update-initramfs -c -k "$(uname -r)"
+            """)
+
+    def setup_hostname(self, cntx):
+        cntx.do(f"""
+            echo "{self.hostname}" > /etc/hostname
+            sed -i '/^127.0.1.1/d' /etc/hosts
+            echo "127.0.1.1 {self.hostname}" >> /etc/hosts
+            """)
+
+    def setup_locale(self, cntx):
+        locales = util.target.preseed_value("localechooser/supported-locales", "en_US.UTF-8").replace(',', ' ')
+        lang = util.target.preseed_value("debian-installer/locale", "en_US")
+        lang = lang if '.' in lang else f"{lang}.UTF-8"
+        cntx.do(f"""
+            locale-gen {lang} {locales}
+            update-locale LANG={lang}
+            """)
+
+    def setup_timezone(self, cntx):
+        if timezone := util.target.preseed_value("time/zone"):
+            cntx.do(f"""
+                ln -sf /usr/share/zoneinfo/{timezone} /etc/localtime
+                echo "{timezone}" > /etc/timezone
+                """)
+
+    def setup_user(self, cntx):
+        username = util.target.preseed_value("passwd/username", "user")
+        fullname = util.target.preseed_value("passwd/user-fullname", username)
+        groups = util.target.preseed_value("passwd/user-default-groups", DEFAULT_USER_GROUPS)
+
+        cntx.do(f"""
+            id -u {username} > /dev/null 2>&1 || {{
+                GROUPS_=$(for g in {groups}; do getent group $g > /dev/null && printf "%s," $g; done)
+                useradd -m -s /bin/bash -c "{fullname}" -G "${{GROUPS_%,}}" {username}
+            }}
+            """)
+
+        # note: the password is passed via stdin, so it doesn't appear in the commands log
+        password = util.target.get_target_upass(insystem_scheduled=True)
+        cntx.do("chpasswd", input=f"{username}:{password}\n")
+
+    def remove_live_packages(self, cntx):
+        # the same list ubiquity uses: casper, ubiquity itself, etc.
+        if manifest := find_casper_file("filesystem.manifest-remove"):
+            packages = " ".join(Path(manifest).read_text().split())
+            # note: some of the listed packages might be missing in the image
+            cntx.do(f"apt-get -q -y purge $(dpkg-query -W -f='${{binary:Package}} ' {packages} 2>/dev/null) > /dev/null")
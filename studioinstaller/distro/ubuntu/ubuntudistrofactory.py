@@ -12,19 +12,34 @@
 #
 #  Copyright (c) 2021 remico
 
+from sys import exit as app_exit
+
+from ...argparser import INSTALLER_NATIVE, INSTALLER_SQUASHFS
 from ...runtimeconfig import RuntimeConfig
+from ... import util
 
 from ..distrofactorybase import DistroFactoryBase
+from ..osinstaller import OsInstaller
 
+from .squashfsinstaller import UbuntuSquashfsInstaller
 from .ubuntuinstaller import UbuntuInstaller
 from .ubuntupostinstaller import UbuntuPostInstaller
 
 __all__ = ['UbuntuDistroFactory']
 
 
+_tlog = util.tagged_logger("[UbuntuDistroFactory]")
+
+
 class UbuntuDistroFactory(DistroFactoryBase):
 
-    def getInstaller(self, runtime_config: RuntimeConfig) -> UbuntuInstaller:
+    def getInstaller(self, runtime_config: RuntimeConfig) -> OsInstaller:
+        if (installer := runtime_config.op.installer) not in (INSTALLER_NATIVE, INSTALLER_SQUASHFS):
+            _tlog(f"'--installer {installer}' isn't supported on Ubuntu. Abort...")
+            app_exit(1)
+
+        if runtime_config.op.installer == INSTALLER_SQUASHFS:
+            return UbuntuSquashfsInstaller(runtime_config)
         return UbuntuInstaller(runtime_config)
 
     def getPostInstaller(self, runtime_config: RuntimeConfig) -> UbuntuPostInstaller:
@@ -12,9 +12,12 @@
 #
 #  Copyright (c) 2021 remico
 
+import threading
+
 from spawned import Spawned, SpawnedSU
 
 from .partmanhelper import PartmanHelper
+from .progresstracker import UbiquityProgressTracker
 from ..osinstaller import OsInstaller
 from ...action import Involve
 from ...partition import Disk
@@ -56,4 +59,15 @@ class UbuntuInstaller(OsInstaller):
         # parse the .desktop file to get the installation command; grep for 'ubiquity' to filter other .desktop files if any
         data = Spawned.do("grep '^Exec' ~/Desktop/*.desktop | grep 'ubiquity' | tail -1 | sed 's/^Exec=//'")
         cmd = data.replace("ubiquity", "ubiquity -b --automatic")
-        Spawned(cmd).waitfor(Spawned.TASK_END, timeout=Spawned.TIMEOUT_INFINITE)
+        installer = Spawned(cmd)
+
+        installer_finished = threading.Event()
+
+        def wait_installer():
+            installer.waitfor(Spawned.TASK_END, timeout=Spawned.TIMEOUT_INFINITE)
+            installer_finished.set()
+
+        threading.Thread(target=wait_installer, daemon=True).start()
+
+        # note: ubiquity may stay open with its final dialog; the target's unmounting is enough to go on
+        UbiquityProgressTracker(self.chroot).track(installer_finished)
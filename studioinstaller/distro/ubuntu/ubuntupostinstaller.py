@@ -18,8 +18,8 @@ from pathlib import Path
 
 from spawned import ChrootContext, ENV, Spawned
 
-from ..postinstaller import PostInstaller
-from ...configfile import IniConfig, FstabConfig
+from ..postinstaller import PostInstaller, PostStep, TRIGGER_INITRAMFS, TRIGGER_GRUB
+from ...configfile import IniConfig, FstabConfig, fstab_items
 from ...partition.base import LUKS, Container, FS
 from ...runtimeconfig import RuntimeConfig
 from ... import util
@@ -27,29 +27,79 @@ from ... import util
 __all__ = ['UbuntuPostInstaller']
 
 
+KEYFILE = "/etc/luks/boot_os.keyfile"
+
+
 class UbuntuPostInstaller(PostInstaller):
     def _run(self):
         self.mounter.mount_target_system()
 
-        with ChrootContext(self.op.chroot) as cntx:
-            # TODO check if /boot is encrypted and pass cryptoboot accordingly
-            setup_bootloader(cntx, self.disk, grub_id=self.op.L, cryptoboot=True)
+        with util.chroot.ChrootSession(self.op.chroot) as cntx:
+            self._run_steps(cntx, self.steps(cntx), self.triggers(cntx))
+
+        self.mounter.unmount_target_system()
 
+    def steps(self, cntx):
+        luks_volumes = self.scheme.partitions(LUKS, Container)
+
+        steps = [
+            # TODO check if /boot is encrypted and enable cryptoboot accordingly
+            PostStep("grub config", enable_cryptoboot, cntx, provides=["grub config"], dirties=[TRIGGER_GRUB]),
+            # grub-install reads /etc/default/grub, e.g. to build cryptodisk support into core.img
+            PostStep("bootloader", install_bootloader, cntx, self.disk, self.op.L,
+                     packages=grub_packages(), requires=["grub config"], dirties=[TRIGGER_GRUB]),
+            PostStep("fstab", setup_fstab, cntx, self.scheme, dirties=[TRIGGER_INITRAMFS]),
+            PostStep("crypttab", setup_crypttab, cntx, luks_volumes, dirties=[TRIGGER_INITRAMFS]),
+            PostStep("fstrim timer", setup_fstrim_timer, cntx),
+        ]
+
+        if luks_volumes:
+            steps.append(PostStep("keyfile", create_keys, cntx, KEYFILE, packages=["cryptsetup-initramfs"],
+                                  provides=["keyfile"], dirties=[TRIGGER_INITRAMFS]))
+            steps += [PostStep(f"luks key {pt.url}", luks_add_key, cntx, pt.url, KEYFILE, pt.passphrase,
+                               requires=["keyfile"]) for pt in luks_volumes]
+
+        # setup_resume(cntx)
+        return steps
+
+    def triggers(self, cntx):
+        # note: just the installed kernel, not every one found in /lib/modules
+        kernel = util.target.installed_kernel(self.op.chroot) or "all"
+        return {
+            TRIGGER_INITRAMFS: lambda: cntx.do(f"update-initramfs -u -k {kernel}"),
+            TRIGGER_GRUB: lambda: cntx.do("update-grub"),
+        }
+
+    def reconfigure_restored(self):
+        self.mounter.mount_target_system()
+
+        with util.chroot.ChrootSession(self.op.chroot) as cntx:
+            # note: the keyfile and the config files come from the image, UUIDs are already updated there
             luks_volumes = self.scheme.partitions(LUKS, Container)
+            self.install_packages(cntx, grub_packages() + (["cryptsetup-initramfs"] if luks_volumes else []))
+
             setup_luks_volumes(cntx, luks_volumes)
+            enable_cryptoboot(cntx)
+            install_bootloader(cntx, self.disk, self.op.L)
 
-            setup_fstab(cntx, self.scheme)
-            # setup_resume(cntx)
-            cntx.do("update-initramfs -u -k all")
-            setup_fstrim_timer(cntx)
+            for regenerate in self.triggers(cntx).values():
+                regenerate()
 
         self.mounter.unmount_target_system()
 
+    def install_packages(self, cntx, packages):
+        if packages:
+            cntx.do(f"apt -q install -y {' '.join(packages)} > /dev/null")
+
+    @property
+    def inject_packages(self):
+        return ["python3-pip", "git"]
+
     def inject_tool(self, extras=False, develop=False):
         self.mounter.mount_target_system()
 
         with ChrootContext(self.op.chroot) as cntx:
-            cntx.do("apt -q install -y python3-pip git > /dev/null")
+            # note: the inject_packages are installed by now
 
             # install the tool into the target system
             x_all = '[seed]' if extras else ''
@@ -63,48 +113,54 @@ class UbuntuPostInstaller(PostInstaller):
         self.mounter.unmount_target_system()
 
 
-def setup_bootloader(cntx, grub_disk, grub_id=None, cryptoboot=False):
-    cmd_is_cryptoboot_enabled = 'grep "GRUB_ENABLE_CRYPTODISK=y" /etc/default/grub'
-    cmd_enable_cryptoboot = 'echo "GRUB_ENABLE_CRYPTODISK=y" >> /etc/default/grub' if cryptoboot else 'true'
+def grub_packages():
+    return ["grub-efi"] if util.system.uefi_loaded() else []
 
+
+def enable_cryptoboot(cntx):
+    cntx.do('grep "GRUB_ENABLE_CRYPTODISK=y" /etc/default/grub || echo "GRUB_ENABLE_CRYPTODISK=y" >> /etc/default/grub')
+
+
+def install_bootloader(cntx, grub_disk, grub_id=None):
     if util.system.uefi_loaded():
-        deps = "apt -q install -y grub-efi > /dev/null"
         opts = "--target=x86_64-efi"
         grub_id_opt = f"--no-uefi-secure-boot --bootloader-id={grub_id}" if grub_id else ""
     else:
-        deps = ""
         opts = ""
         grub_id_opt = ""
 
-    cntx.do(f"""
-        {cmd_is_cryptoboot_enabled} || {cmd_enable_cryptoboot}
-        {deps}
-        grub-install --recheck {opts} {grub_id_opt} {grub_disk}
-        update-grub
-        """)
+    cntx.do(f"grub-install --recheck {opts} {grub_id_opt} {grub_disk}")
 
 
 def setup_luks_volumes(cntx, volumes):
     if volumes:
-        keyfile = "/etc/luks/boot_os.keyfile"
-        cntx.do("apt -q install -y cryptsetup-initramfs > /dev/null")
-        create_keys(cntx, keyfile)
+        create_keys(cntx, KEYFILE)
 
-    cntx.do(f"truncate -s 0 /etc/crypttab")  # fill /etc/crypttab from scratch
     for pt in volumes:
-        luks_add_key(cntx, pt.url, keyfile, pt.passphrase)
+        luks_add_key(cntx, pt.url, KEYFILE, pt.passphrase)
 
+    setup_crypttab(cntx, volumes)
+
+
+def setup_crypttab(cntx, volumes):
+    """Fills /etc/crypttab from scratch"""
+    lines = []
+    for pt in volumes:
         opts = "luks"
         if util.blockdevice.discardable(pt):
             opts += ",discard"
-        cntx.do(f'echo "{pt.mapperID} UUID={pt.uuid} {keyfile} {opts}" >> /etc/crypttab')
+        lines.append(f"{pt.mapperID} UUID={pt.uuid} {KEYFILE} {opts}\n")
+
+    cntx.write("/etc/crypttab", "".join(lines).encode())
 
 
 def create_keys(cntx, keyfile):
     keyfile_dir = Path(keyfile).parent
     cntx.do(f"""
-        echo "KEYFILE_PATTERN={keyfile_dir}/*.keyfile" >> /etc/cryptsetup-initramfs/conf-hook
-        echo "UMASK=0077" >> /etc/initramfs-tools/initramfs.conf
+        grep -q "^KEYFILE_PATTERN={keyfile_dir}/[*].keyfile$" /etc/cryptsetup-initramfs/conf-hook ||
+            echo "KEYFILE_PATTERN={keyfile_dir}/*.keyfile" >> /etc/cryptsetup-initramfs/conf-hook
+        grep -q "^UMASK=0077$" /etc/initramfs-tools/initramfs.conf ||
+            echo "UMASK=0077" >> /etc/initramfs-tools/initramfs.conf
 
         mkdir -p {keyfile_dir}
 
@@ -124,24 +180,27 @@ def luks_add_key(cntx, pt_url, key, passphrase):
     if util.blockdevice.test_luks_key(pt_url, '/'.join([cntx.root, key])):
         return
 
-    with cntx.doi(f"cryptsetup luksAddKey {pt_url} {key}") as t:
-        t.interact("Enter any existing passphrase:", passphrase)
+    # note: the passphrase is passed via stdin
+    cntx.do(f"cryptsetup luksAddKey --key-file=- {pt_url} {key}", input=passphrase)
 
 
 def setup_fstab(cntx, scheme):
     fstab = FstabConfig(cntx)
+    media = []
 
     for pt in scheme.partitions(FS):
-        can_auto_mount = bool(pt.mountpoint and pt.fs)
-        if can_auto_mount and not fstab.contains(pt):
-            volume = f"UUID={pt.uuid}" if pt.isphysical else pt.url
-            opts = "defaults,relatime"
-            fstab.append(volume, pt.mountpoint, pt.fs, opts)
+        # note: e.g. ubiquity has written the entries already
+        if (items := fstab_items(pt)) and not fstab.contains(pt):
+            for item in items:
+                fstab.append(item)
 
         # assume that additional user partitions are mounted in /media
         if "/media" in pt.mountpoint:
-            user = util.target.target_user(cntx.root)
-            cntx.do(f"chown -R {user}:{user} {pt.mountpoint}")
+            media.append(pt.mountpoint)
+
+    if media:
+        user = util.target.target_user(cntx.root)
+        cntx.do(f"chown -R {user}:{user} {' '.join(media)}")
 
 
 def setup_resume(cntx):
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Golden image of an installed system: capture it once, restore on many machines
+
+   Every mounted file system (and every btrfs subvolume) of the partitioning scheme is packed
+   into its own multi-threaded zstd-compressed tarball; ``manifest.json`` lists the tarballs along with
+   the UUIDs of the captured volumes, so that the UUIDs referenced by the system's configs can be
+   replaced with the ones of the freshly formatted volumes on restore.
+"""
+
+import json
+from pathlib import Path
+
+from .mounter import Mounter
+from .partition.base import FS, LUKS
+from .scheme import Scheme
+from . import util
+
+__all__ = ['Imager', 'MANIFEST']
+
+
+_tlog = util.tagged_logger("[Imager]")
+
+MANIFEST = "manifest.json"
+MANIFEST_VERSION = 1
+
+# configs referencing volumes by UUID
+UUID_CONFIGS = ["/etc/fstab", "/etc/crypttab", "/etc/default/grub", "/boot/grub/grub.cfg"]
+
+TAR_OPTIONS = "--xattrs --xattrs-include='*' --acls --numeric-owner"
+
+
+def _archive_name(mountpoint):
+    return f"{mountpoint.strip('/').replace('/', '-') or 'root'}.tar.zst"
+
+
+def _nested(entry, other):
+    """``entry``'s mountpoint is inside ``other``'s one"""
+    a, b = entry["mountpoint"], other["mountpoint"]
+    return a != b and (b == '/' or a.startswith(b.rstrip('/') + '/'))
+
+
+class Imager:
+    def __init__(self, chroot, scheme: Scheme, jobs=1):
+        self.chroot = chroot
+        self.scheme = scheme
+        self.jobs = jobs
+        self.mounter = Mounter(chroot, scheme, jobs)
+
+    def entries(self):
+        """A tarball per mounted file system or btrfs subvolume; parent mountpoints go first"""
+        entries = []
+        for pt in self.scheme.partitions(FS):
+            if not pt.mountpoint or pt.isswap:
+                continue
+            if pt.fs == "btrfs" and pt.subvolumes:
+                entries += [{"volume": pt.id, "subvolume": subv, "mountpoint": mpoint}
+                            for subv, mpoint in pt.subvolumes.items()]
+            else:
+                entries.append({"volume": pt.id, "mountpoint": pt.mountpoint})
+
+        for entry in entries:
+            entry["archive"] = _archive_name(entry["mountpoint"])
+
+        return sorted(entries, key=lambda e: len(Path(e["mountpoint"]).parts))
+
+    def uuids(self):
+        """UUIDs of the volumes which configs might refer to; LUKS containers must be open"""
+        return {pt.id: uuid for pt in self.scheme.partitions()
+                if isinstance(pt, (FS, LUKS)) and (uuid := pt.uuid)}
+
+    def capture(self, image_dir):
+        image_dir = Path(image_dir)
+        util.broker.do(f"mkdir -p {image_dir}")
+
+        self.mounter.mount_volumes()
+        try:
+            entries = self.entries()
+            util.dag.run_dag(entries, lambda entry: self._pack(entry, image_dir), lambda a, b: False, self.jobs)
+
+            manifest = {"version": MANIFEST_VERSION, "entries": entries, "uuids": self.uuids()}
+            util.broker.write_file(str(image_dir / MANIFEST), json.dumps(manifest, indent=2).encode())
+        finally:
+            self.mounter.unmount_target_system()
+
+        _tlog(f"image captured to {image_dir}")
+
+    def _pack(self, entry, image_dir):
+        _tlog(f"packing {entry['mountpoint']} ...")
+        reply = util.broker.run(f"""
+            set -o pipefail
+            tar -C {self.chroot}{entry['mountpoint']} --one-file-system {TAR_OPTIONS} -cpf - . \\
+                | zstd -q -T0 -f -o {image_dir / entry['archive']}
+            """)
+        assert reply.success, f"Packing {entry['mountpoint']} failed: {reply.err}"
+
+    def restore(self, image_dir):
+        """Unpacks the image onto the created and formatted scheme; returns {old UUID: new UUID}"""
+        image_dir = Path(image_dir)
+        manifest = json.loads(util.broker.read_file(str(image_dir / MANIFEST)))
+        assert manifest.get("version") == MANIFEST_VERSION, f"Unsupported image manifest: {image_dir / MANIFEST}"
+
+        self.mounter.mount_volumes()
+        try:
+            entries = manifest["entries"]
+            util.dag.run_dag(entries, lambda entry: self._unpack(entry, image_dir), _nested, self.jobs)
+
+            new_uuids = self.uuids()
+            uuids = {old: new_uuids[id_] for id_, old in manifest["uuids"].items()
+                     if id_ in new_uuids and new_uuids[id_] != old}
+            self.rewrite_uuids(uuids)
+        finally:
+            self.mounter.unmount_target_system()
+
+        _tlog(f"image restored from {image_dir}")
+        return uuids
+
+    def _unpack(self, entry, image_dir):
+        _tlog(f"unpacking {entry['mountpoint']} ...")
+        reply = util.broker.run(f"""
+            set -o pipefail
+            zstd -q -T0 -dc {image_dir / entry['archive']} \\
+                | tar -C {self.chroot}{entry['mountpoint']} {TAR_OPTIONS} -xpf -
+            """)
+        assert reply.success, f"Unpacking {entry['mountpoint']} failed: {reply.err}"
+
+    def rewrite_uuids(self, uuids):
+        if not uuids:
+            return
+
+        # note: both lower and upper case, as e.g. vfat UUIDs are uppercase
+        expressions = " ".join(f"-e 's/{old}/{new}/gI'" for old, new in uuids.items())
+        for config in UUID_CONFIGS:
+            util.broker.do(f"[ -f {self.chroot}{config} ] && sed -i {expressions} {self.chroot}{config}")
@@ -12,23 +12,30 @@
 #
 #  Copyright (c) 2021 remico
 
-from spawned import SpawnedSU
-
 from .action import Involve, Release
+from .util import broker
 
 __all__ = ['Mounter']
 
 
 class Mounter:
-    def __init__(self, chroot, scheme) -> None:
+    def __init__(self, chroot, scheme, jobs=1) -> None:
         self.chroot = chroot
         self.scheme = scheme
+        self.jobs = jobs
 
     def mount_target_system(self):
-        SpawnedSU.do(f"mkdir -p {self.chroot}")
-        self.scheme.execute(Involve(chroot=self.chroot))
+        self.mount_volumes()
+        self.mount_pseudo_filesystems()
+
+    def mount_volumes(self):
+        """Mount the partitioning scheme only"""
+        broker.do(f"mkdir -p {self.chroot}")
+        self.scheme.execute(Involve(chroot=self.chroot), self.jobs)
 
-        SpawnedSU.do(f"""
+    def mount_pseudo_filesystems(self):
+        """Bind the host's /sys, /proc, /dev, etc. into the target system, so that chrooted commands work"""
+        broker.do(f"""
             for n in sys proc dev etc/resolv.conf sys/firmware/efi/efivars; do
                 mount --bind /$n {self.chroot}/$n;
             done
@@ -36,10 +43,10 @@ class Mounter:
             """)
 
     def unmount_target_system(self):
-        mounts = SpawnedSU.do(f'mount | grep "{self.chroot}" | cut -d" " -f3', list_=True)
+        mounts = broker.do(f'mount | grep "{self.chroot}" | cut -d" " -f3', list_=True)
         mounts.reverse()
 
         for m in mounts:
-            SpawnedSU.do(f"umount {m}")
+            broker.do(f"umount {m}")
 
-        self.scheme.execute(Release())
+        self.scheme.execute(Release(), self.jobs)
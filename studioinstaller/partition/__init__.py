@@ -20,6 +20,7 @@
 # __all__ = [basename(f)[:-3] for f in modules if isfile(f) and not f.endswith('__init__.py')]
 
 from .disk import *
+from .partitiontable import *
 from .lvlvm import *
 from .pvplain import *
 from .pvluks import *
@@ -20,10 +20,20 @@ from abc import ABC, abstractmethod
 __all__ = ['MediumBase', 'URL_PV', 'URL_DISK', 'URL_MAPPED', 'URL_LVM_LV']
 
 
+_RE_DISK_WITH_DIGITS = re.compile(r"(loop|nbd|md|mmcblk|nvme\d+n)\d+")
+
+
 def _cut_trailing_digits(s):
     return re.match(r".*?(?=\d*$)", s).group()
 
 
+def _disk_name(id_):
+    """Whole disk name: sda1 => sda, loop0p1 => loop0, nvme0n1 => nvme0n1"""
+    if mo := re.match(r"(.*\d)p\d+$", id_):
+        return mo.group(1)
+    return id_ if _RE_DISK_WITH_DIGITS.fullmatch(id_) else _cut_trailing_digits(id_)
+
+
 def URL_PV(id_):
     return f"/dev/{id_}"
 
@@ -37,7 +47,7 @@ def URL_LVM_LV(vg, lv):
 
 
 def URL_DISK(id_):
-    return f"/dev/{_cut_trailing_digits(id_)}"
+    return f"/dev/{_disk_name(id_)}"
 
 
 class MediumBase(ABC):
@@ -62,7 +72,11 @@ class MediumBase(ABC):
 
     @property
     def id(self):
-        return f"{self.parent.id}{self._id}" if str(self._id).isdigit() and self.parent else self._id
+        if not (str(self._id).isdigit() and self.parent):
+            return self._id
+        # a disk named with a trailing digit gets 'p' before the partition number, e.g. loop0p1
+        separator = 'p' if self.parent.id[-1:].isdigit() else ''
+        return f"{self.parent.id}{separator}{self._id}"
 
     @property
     @abstractmethod
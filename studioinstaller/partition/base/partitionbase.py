@@ -82,7 +82,10 @@ class Partition(MediumBase):
     @final
     def execute(self, action):
         print(f">>>>> ACTION [{action.__class__.__name__}]:", f"<{self.__class__.__name__}>::{self.id}")
-        self._a_execute(action)
+        try:
+            self._a_execute(action)
+        finally:
+            blockdevice.invalidate()  # actions change devices, their UUIDs or mountpoints
 
     @abstractmethod
     def _a_execute(self, action):
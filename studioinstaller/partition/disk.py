@@ -14,8 +14,8 @@
 
 """Hardware medium"""
 
-from spawned import SpawnedSU
 from .base import MediumBase, URL_DISK
+from ..util import gpt
 
 __all__ = ['Disk']
 
@@ -25,7 +25,8 @@ class Disk(MediumBase):
         super().__init__(id_=id_.replace('/dev/', ''), **kwargs)
 
     def create_new_partition_table(self):
-        SpawnedSU.do(f"sgdisk --zap-all {self.url}")
+        table = gpt.GptTable(self.url)  # a new empty table
+        table.write()
 
 
     @property
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Non-interactive partition table builder"""
+
+import re
+from pathlib import Path
+
+from ..util import alignment, devwait, gpt
+
+__all__ = ['PartitionTable', 'PartitionEntry']
+
+
+class PartitionEntry:
+    def __init__(self, number, size='', type_='', label=''):
+        self.number = number  # '' - the first available partition number
+        self.size = size  # '' - the rest of the largest free block
+        self.type = type_
+        self.label = label
+
+    def __repr__(self):
+        return f"PartitionEntry({self.number}, {self.size}, {self.type}, {self.label})"
+
+    @staticmethod
+    def build(partition, label_prefix=''):
+        # extract numeric ID value from the whole id value (e.g. '1' from 'sda1')
+        number = re.search(r"(\d*)$", partition.id).group()
+        label = '-'.join(filter(None, [label_prefix, partition.label])) if partition.label else ''
+        return PartitionEntry(number, partition.size, partition.type, label)
+
+
+class PartitionTable:
+    """Collects all partition entries of a disk and writes them in one go"""
+
+    def __init__(self, disk_url):
+        self.disk = disk_url
+        self.entries = []
+        self.urls = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, partition, label_prefix=''):
+        assert partition.disk == self.disk, f"Partition {partition.id} doesn't belong to {self.disk}"
+        self.entries.append(PartitionEntry.build(partition, label_prefix))
+        self.urls.append(partition.url)
+
+    def write(self):
+        """Write all entries in one go, make the kernel re-read the table once,
+        then wait for udev to create the new partitions' device nodes
+        """
+        if not self.entries:
+            return
+
+        table = gpt.GptTable.load(self.disk, alignment.for_disk(self.disk).bytes)
+        for entry in self.entries:
+            table.add(entry.number, entry.size, entry.type, entry.label)
+        table.write()
+
+        if Path(self.disk).is_block_device():
+            for url in self.urls:
+                assert devwait.wait_for_path(url), f"Device node '{url}' didn't appear"
@@ -15,10 +15,11 @@
 """Prepare partitions for OS installation according to the partitioning scheme"""
 
 import re
+from sys import exit as app_exit
 
-from spawned import ask_user, logger as log, SpawnedSU
+from spawned import ask_user, logger as log
 
-from .action import Create, Format
+from .action import Create, Format, StateDiff
 from .partition.base import Partition, FS
 from .partition import LVLvm
 from .scheme import Scheme
@@ -66,18 +67,43 @@ class PreInstaller:
 
             # otherwise ask for removing individual partitions
             else:
-                t = SpawnedSU(f"parted {disk.url} print")
-                partitions = [line.strip() for line in t.datalines if line.strip() and line.strip()[0].isdigit()]
+                lines = util.broker.do(f"parted {disk.url} print", list_=True)
+                partitions = [line.strip() for line in lines if line.strip() and line.strip()[0].isdigit()]
 
                 for partition in partitions:
                     print(f"Partition [[ {log.ok_blue_s(partition)} ]]")
                     partition_id = re.search(r"(\d+)", partition).group()
 
                     if 'y' == ask_user(f"Delete partition {disk.url}{partition_id} [y/N]:").lower():
-                        SpawnedSU.do(f"sgdisk --delete={partition_id} {disk.url}")
+                        table = util.gpt.GptTable.load(disk.url)
+                        table.remove(partition_id)
+                        table.write()
                         print(f" * Partition {disk.url}{partition_id} DELETED", end="\n\n")
 
     def prepare_partitions(self):
-        self.free_space_on_disks()
-        self.scheme.execute(Create(system_label=self.op.L))
-        self.scheme.execute(Format())
+        diff = None
+
+        if getattr(self.op, "diff", False):
+            # keep whatever already matches the scheme
+            diff = StateDiff(self.scheme).inspect()
+            diff.print()
+            diff.remove_stale_lvs()
+            diff.remove_stale_partitions()
+        else:
+            util.journal.run("free space on disks", self.free_space_on_disks)
+
+        actions = Create(system_label=self.op.L, diff=diff), Format(diff=diff)
+        plan_file = getattr(self.op, "plan", None)  # the option isn't defined for all the subcommands
+
+        if plan_file is None:
+            for action in actions:
+                self.scheme.execute(action, self.op.j)
+            return
+
+        plan = self.scheme.plan(*actions)
+        if plan_file:
+            plan.save(plan_file)
+
+        if not plan.run():
+            log.fail("Partitioning plan failed. Abort.")
+            app_exit()
@@ -14,10 +14,15 @@
 
 """Encapsulates a partitioning scheme"""
 
+import hashlib
+import json
 from typing import List
 
+from .action import Plan
 from .partition.base import Partition
 from .partition import Disk
+from .util import broker, journal
+from .util.dag import run_dag
 
 __all__ = ['Scheme']
 
@@ -63,9 +68,42 @@ class Scheme:
                         and (pt.is_new == new if new is not None else True)
                 ]
 
-    def execute(self, action):
-        for pt in action.iterator(self):
-            pt.execute(action)
+    def execute(self, action, jobs=1):
+        """
+        ``jobs`` - max number of partitions served concurrently;
+            the order of dependent partitions is defined by ``action.depends()``
+        """
+        nodes = list(action.iterator(self))
+        if action.journaled:
+            nodes = [pt for pt in nodes if not journal.done(action.journal_step(pt))]
+        action.prepare(nodes)
+
+        def serve(pt):
+            if action.journaled:
+                journal.run(action.journal_step(pt), pt.execute, action)
+            else:
+                pt.execute(action)
+
+        if jobs > 1:
+            run_dag(nodes, serve, action.depends, jobs)
+        else:
+            for pt in nodes:
+                serve(pt)
+
+    def plan(self, *actions) -> Plan:
+        """Compile the ``actions`` passes into a single plan instead of executing them"""
+        plan = Plan()
+        with broker.instance().recording(plan):
+            for action in actions:
+                self.execute(action)
+        return plan
+
+    def fingerprint(self) -> str:
+        """Short stable hash of the scheme's partitions and their settings"""
+        attrs = ("url", "size", "type", "label", "fs", "mountpoint", "lvm_vg", "lvm_lv", "luks_type")
+        items = sorted(json.dumps([pt.__class__.__name__, *(str(getattr(pt, a, '')) for a in attrs),
+                                   sorted(pt.subvolumes.items())]) for pt in self.scheme)
+        return hashlib.sha256('\n'.join(items).encode()).hexdigest()[:16]
 
     @property
     def boot_partition(self):
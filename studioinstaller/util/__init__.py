@@ -12,7 +12,17 @@
 #
 #  Copyright (c) 2021 remico
 
+from . import alignment
 from . import blockdevice
+from . import broker
+from . import chroot
+from . import dag
+from . import devwait
+from . import gpt
+from . import image
+from . import journal
+from . import probe
+from . import sysfs
 from . import system
 from . import target
 from .util import *
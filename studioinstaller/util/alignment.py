@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Device-topology-aware alignment of partitions, LUKS payload and LVM extents"""
+
+from functools import lru_cache, reduce
+from math import gcd
+
+from . import sysfs
+
+__all__ = ['Alignment', 'for_disk']
+
+MiB = 1 << 20
+DEFAULT_ALIGNMENT = 1 * MiB
+DEFAULT_PE_SIZE = 4 * MiB
+
+
+def _lcm(*values):
+    return reduce(lambda a, b: a * b // gcd(a, b), values)
+
+
+# RAID level => number of parity/mirror disks in a stripe
+_RAID_REDUNDANCY = {"raid4": 1, "raid5": 1, "raid6": 2}
+
+
+def _raid_stripe(disk_url):
+    """Full stripe width of an md device, in bytes; 0 if not a striped RAID"""
+    if not (path := sysfs.block_dir(disk_url)) or not (path / "md").exists():
+        return 0
+
+    chunk = int(sysfs.read_attr(path / "md/chunk_size", 0))
+    disks = int(sysfs.read_attr(path / "md/raid_disks", 0))
+    level = sysfs.read_attr(path / "md/level", "")
+
+    if level == "raid0":
+        return chunk * disks
+    if level in _RAID_REDUNDANCY:
+        return chunk * (disks - _RAID_REDUNDANCY[level])
+    return 0
+
+
+class Alignment:
+    def __init__(self, disk_url):
+        self.disk = disk_url
+        self.optimal_io_size = sysfs.queue_attr(disk_url, "optimal_io_size")
+        self.minimum_io_size = sysfs.queue_attr(disk_url, "minimum_io_size")
+        self.physical_block_size = sysfs.queue_attr(disk_url, "physical_block_size")
+        self.discard_granularity = sysfs.queue_attr(disk_url, "discard_granularity")
+        self.raid_stripe = _raid_stripe(disk_url)
+
+    def __repr__(self):
+        return f"Alignment({self.disk}: {self.bytes} bytes)"
+
+    @property
+    def _optimal_io_size(self):
+        """``optimal_io_size`` if it's sane: some devices (e.g. USB bridges) report bogus values like
+        33553920, which would give gigabytes of alignment. Like parted, it's taken only if it's a multiple
+        of the physical block size and either divides 1 MiB or is a multiple of it.
+        """
+        size = self.optimal_io_size
+        if size <= 0 or size % (self.physical_block_size or 512):
+            return 0
+        return size if DEFAULT_ALIGNMENT % size == 0 or size % DEFAULT_ALIGNMENT == 0 else 0
+
+    @property
+    def bytes(self):
+        """The least common multiple of all the known topology values and 1 MiB"""
+        values = [self._optimal_io_size, self.minimum_io_size, self.physical_block_size,
+                  self.discard_granularity, self.raid_stripe]
+        return _lcm(DEFAULT_ALIGNMENT, *[v for v in values if v > 0])
+
+    @property
+    def sectors(self):
+        """In 512-byte sectors, e.g. for ``cryptsetup --align-payload``"""
+        return self.bytes // 512
+
+    @property
+    def kib(self):
+        return self.bytes // 1024
+
+    @property
+    def pe_size_kib(self):
+        """LVM physical extent size, a multiple of both the alignment and the LVM default"""
+        return _lcm(self.bytes, DEFAULT_PE_SIZE) // 1024
+
+
+@lru_cache(maxsize=None)
+def for_disk(disk_url) -> Alignment:
+    return Alignment(disk_url)
@@ -12,9 +12,18 @@
 #
 #  Copyright (c) 2021 remico
 
-from spawned import SpawnedSU, Spawned
+import os
+import threading
+
+from . import broker
+from . import probe
+from . import sysfs
 
 __all__ = [
+    'BlockDevice',
+    'BlockDeviceIndex',
+    'index',
+    'invalidate',
     'solid',
     'discardable',
     'uuid',
@@ -22,26 +31,153 @@ __all__ = [
 ]
 
 
+def _device_type(sys_dir):
+    if (sys_dir / "partition").exists():
+        return "part"
+    if dm_uuid := sysfs.read_attr(sys_dir / "dm/uuid"):
+        return {"CRYPT": "crypt", "LVM": "lvm"}.get(dm_uuid.split('-', 1)[0], "dm")
+    if level := sysfs.read_attr(sys_dir / "md/level"):
+        return level
+    if sys_dir.name.startswith("loop"):
+        return "loop"
+    return "disk"
+
+
+def _device_path(sys_dir):
+    if dm_name := sysfs.read_attr(sys_dir / "dm/name"):
+        return f"/dev/mapper/{dm_name}"
+    return f"/dev/{sys_dir.name}"
+
+
+def _parent_name(sys_dir):
+    """A partition's disk or the first underlying device of a dm/md device"""
+    if (sys_dir / "partition").exists():
+        return sys_dir.resolve().parent.name
+    slaves = sorted((sys_dir / "slaves").glob("*"))
+    return slaves[0].name if slaves else None
+
+
+class BlockDevice:
+    """A single entry of the block devices tree"""
+
+    def __init__(self, name, path, type_, rota=False, uuid='', disc_gran=0, disc_max=0,
+                 label='', partlabel='', mountpoint='', parent=None):
+        self.name = name
+        self.path = path
+        self.type = type_
+        self.rota = rota
+        self.uuid = uuid
+        self.disc_gran = disc_gran
+        self.disc_max = disc_max
+        self.label = label
+        self.partlabel = partlabel
+        self.mountpoint = mountpoint
+        self.parent = parent
+
+    def __repr__(self):
+        return f"BlockDevice({self.path}, {self.type}, uuid={self.uuid})"
+
+    @property
+    def solid(self):
+        return not self.rota
+
+    @property
+    def discard(self):
+        return self.disc_gran > 0 and self.disc_max > 0
+
+
+class BlockDeviceIndex:
+    """Snapshot of the whole block devices tree, read from sysfs and udev's /dev/disk/by-* links;
+    no subprocess and no privileges are needed.
+    It's loaded lazily and reloaded on the next lookup after ``invalidate()``.
+    """
+
+    def __init__(self):
+        self._devices = None  # {path: BlockDevice}
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._devices = None
+
+    @staticmethod
+    def _load():
+        uuids = sysfs.disk_links("uuid")
+        labels = sysfs.disk_links("label")
+        partlabels = sysfs.disk_links("partlabel")
+        mountpoints = {}
+        for devno, mountpoint in sysfs.mounts():
+            mountpoints.setdefault(devno, mountpoint)
+
+        by_name = {}
+        parents = {}
+        for sys_dir in sysfs.devices():
+            node = f"/dev/{sys_dir.name}"
+
+            by_name[sys_dir.name] = BlockDevice(
+                name=sys_dir.name,
+                path=_device_path(sys_dir),
+                type_=_device_type(sys_dir),
+                rota=sysfs.queue_attr(node, "rotational") == 1,
+                uuid=uuids.get(node, ''),
+                disc_gran=sysfs.queue_attr(node, "discard_granularity"),
+                disc_max=sysfs.queue_attr(node, "discard_max_bytes"),
+                label=labels.get(node, ''),
+                partlabel=partlabels.get(node, ''),
+                mountpoint=mountpoints.get(sysfs.read_attr(sys_dir / "dev"), ''),
+            )
+            parents[sys_dir.name] = _parent_name(sys_dir)
+
+        devices = {}
+        for name, dev in by_name.items():
+            dev.parent = by_name.get(parents[name])
+            devices[dev.path] = dev
+            devices[f"/dev/{name}"] = dev  # e.g. /dev/dm-0 for /dev/mapper/*
+        return devices
+
+    @property
+    def devices(self):
+        with self._lock:
+            if self._devices is None:
+                self._devices = self._load()
+            return self._devices
+
+    def get(self, volume_url):
+        devices = self.devices
+        return devices.get(str(volume_url)) or devices.get(os.path.realpath(volume_url))
+
+
+_index = BlockDeviceIndex()
+
+
+def index() -> BlockDeviceIndex:
+    return _index
+
+
+def invalidate():
+    """Must be called after any change of devices, e.g. partitioning, formatting, opening a LUKS volume"""
+    _index.invalidate()
+
+
 def solid(volume_url):
-    return Spawned.do(f"lsblk -n -d -o ROTA {volume_url}").strip() == "0"  # 0 - SSD, 1 - HDD
+    dev = _index.get(volume_url)
+    return bool(dev and dev.solid)
 
 
 def discardable(partition):
-    pattern = "TRIM supported"
-    return solid(partition.url) and \
-        pattern in SpawnedSU.do(f'sudo hdparm -I {partition.disk} | grep "{pattern}"')
+    disk = _index.get(partition.disk)
+    return solid(partition.url) and bool(disk and disk.discard)
 
 
 def uuid(volume_url):
-    return SpawnedSU.do(f"blkid -s UUID -o value {volume_url}")
+    """Taken from udev's links if available, otherwise read from the volume's superblock"""
+    if (dev := _index.get(volume_url)) and dev.uuid:
+        return dev.uuid
+    sb = probe.probe(volume_url)
+    return sb.uuid if sb else ''
 
 
 def test_luks_key(volume_url, key):
-    return SpawnedSU.do(
+    return broker.do(
             f"cryptsetup open --test-passphrase -d {key} {volume_url} 2>/dev/null",
             with_status=True
         ).success
-
-
-# TODO lsblk -o name,type,path,mountpoint,rota,uuid,disc-gran,disc-max,label,partlabel --json /dev/sd*
-# -l -n -p -I <major_num>
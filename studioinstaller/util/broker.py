@@ -0,0 +1,536 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Persistent privileged command broker.
+
+A single root helper process is started (lazily) once per run. Commands are sent
+to it over a pipe and each reply carries framed stdout, stderr and exit status,
+so the sudo/shell spawning cost is paid only once.
+Requests are served concurrently, so the broker can be shared between threads.
+The helper also keeps persistent shells inside a chroot (sessions), see ``util.chroot``.
+"""
+
+import base64
+import itertools
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+
+from spawned import ENV, ask_user, create_py_script, onExit
+
+from .util import tagged_logger
+
+__all__ = [
+    'Reply',
+    'RootBroker',
+    'instance',
+    'run',
+    'do',
+    'pread',
+    'pwrite',
+    'read_file',
+    'write_file',
+    'copy_extents',
+    'DIRECT_IO_ALIGNMENT',
+    'session_open',
+    'session_run',
+    'session_close',
+    'enable_debug',
+]
+
+_tlog = tagged_logger("[RootBroker]")
+
+_HEADER = struct.Struct(">I")
+
+# direct I/O granularity safe for any logical block size up to 4 KiB; a multiple of the page size
+DIRECT_IO_ALIGNMENT = 4096
+
+_HELPER_SCRIPT = r"""
+import base64, hashlib, json, mmap, os, struct, subprocess, sys, threading
+
+_HEADER = struct.Struct(">I")
+_in = sys.stdin.buffer
+_out = sys.stdout.buffer
+_out_lock = threading.Lock()
+
+
+def _reply(msg):
+    data = json.dumps(msg).encode()
+    with _out_lock:
+        _out.write(_HEADER.pack(len(data)) + data)
+        _out.flush()
+
+
+def _op_run(rq):
+    env = dict(os.environ, **rq.get("env", {}))
+    try:
+        p = subprocess.run(["/bin/bash", "-c", rq["cmd"]],
+                           input=rq.get("input", "").encode(),
+                           stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                           env=env, timeout=rq.get("timeout"))
+        out, err, status = p.stdout, p.stderr, p.returncode
+    except subprocess.TimeoutExpired as e:
+        out, err, status = e.stdout or b"", (e.stderr or b"") + b"\ncommand timed out", 124
+    return {"out": out.decode(errors="replace"), "err": err.decode(errors="replace"), "status": status}
+
+
+def _op_pread(rq):
+    with open(rq["path"], "rb") as f:
+        data = os.pread(f.fileno(), rq["size"], rq["offset"])
+    return {"out": base64.b64encode(data).decode(), "err": "", "status": 0}
+
+
+def _op_pwrite(rq):
+    fd = os.open(rq["path"], os.O_WRONLY)
+    try:
+        os.pwrite(fd, base64.b64decode(rq["data"]), rq["offset"])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return {"out": "", "err": "", "status": 0}
+
+
+def _op_read_file(rq):
+    with open(rq["path"], "rb") as f:
+        return {"out": base64.b64encode(f.read()).decode(), "err": "", "status": 0}
+
+
+def _op_write_file(rq):
+    with open(rq["path"], "wb") as f:
+        f.write(base64.b64decode(rq["data"]))
+    return {"out": "", "err": "", "status": 0}
+
+
+def _direct_part(pos, size, align):
+    # the leading part of [pos, pos + size) suitable for direct I/O
+    return size - size % align if pos % align == 0 else 0
+
+
+def _op_copy_extents(rq):
+    # large aligned direct I/O: an anonymous mmap is page aligned; whatever isn't aligned to the I/O
+    # granularity (e.g. an odd-sized image's tail) goes through the page cache instead
+    chunk, align = rq["chunk"], rq["align"]
+    buf = mmap.mmap(-1, chunk)
+    view = memoryview(buf)
+    src = os.open(rq["src"], os.O_RDONLY)
+    dst = os.open(rq["dst"], os.O_RDWR | os.O_DIRECT)
+    dst_cached = os.open(rq["dst"], os.O_RDWR)
+    digests = []
+    try:
+        for offset, length in rq["extents"]:
+            for pos in range(offset, offset + length, chunk):
+                n = os.preadv(src, [view[:min(chunk, offset + length - pos)]], pos)
+                direct = _direct_part(pos, n, align)
+                if direct:
+                    os.pwritev(dst, [view[:direct]], pos)
+                if n > direct:
+                    os.pwrite(dst_cached, view[direct:n], pos + direct)
+        os.fsync(dst_cached)
+        os.fsync(dst)
+
+        # read back what is on the disk now
+        for offset, length in rq["extents"]:
+            sha = hashlib.sha256()
+            for pos in range(offset, offset + length, chunk):
+                size = min(chunk, offset + length - pos)
+                direct = _direct_part(pos, size, align)
+                if direct:
+                    sha.update(view[:os.preadv(dst, [view[:direct]], pos)])
+                if size > direct:
+                    os.posix_fadvise(dst_cached, pos + direct, size - direct, os.POSIX_FADV_DONTNEED)
+                    sha.update(os.pread(dst_cached, size - direct, pos + direct))
+            digests.append(sha.hexdigest())
+    finally:
+        os.close(src)
+        os.close(dst)
+        os.close(dst_cached)
+        view.release()
+        buf.close()
+    return {"out": json.dumps(digests), "err": "", "status": 0}
+
+
+_sessions = {}  # {session id: [bash process, lock]}
+
+
+def _op_session_open(rq):
+    p = subprocess.Popen(["chroot", rq["root"], "/bin/bash"],
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _sessions[rq["session"]] = [p, threading.Lock()]
+    return {"out": "", "err": "", "status": 0}
+
+
+def _read_until(stream, marker, chunks):
+    # collect lines up to the marker one; returns what follows the marker
+    for line in iter(stream.readline, b""):
+        if line.startswith(marker):
+            return line[len(marker):]
+        chunks.append(line)
+    return None
+
+
+def _op_session_run(rq):
+    p, lock = _sessions[rq["session"]]
+    end = f"__studioinstaller_end_{rq['id']}__"
+
+    # a subshell per command: an 'exit' or a 'cd' doesn't affect the session; stdin is never the session's one
+    if rq.get("input"):
+        stdin, redirect = f"base64 -d <<'{end}' |\n{base64.b64encode(rq['input'].encode()).decode()}\n{end}\n", ""
+    else:
+        stdin, redirect = "", " < /dev/null"
+    script = (f"{stdin}({rq['cmd']}\n){redirect}\n"
+              f"__status=$?; echo; echo \"{end}$__status\"; echo >&2; echo \"{end}\" >&2\n")
+
+    out, err = [], []
+    with lock:
+        p.stdin.write(script.encode())
+        p.stdin.flush()
+        err_reader = threading.Thread(target=_read_until, args=(p.stderr, end.encode(), err))
+        err_reader.start()
+        status = _read_until(p.stdout, end.encode(), out)
+        err_reader.join()
+
+    if status is None:
+        return {"out": "", "err": "chroot session terminated", "status": -1}
+
+    # drop the newline echoed before the markers
+    out, err = b"".join(out)[:-1], b"".join(err)[:-1]
+    return {"out": out.decode(errors="replace"), "err": err.decode(errors="replace"), "status": int(status)}
+
+
+def _op_session_close(rq):
+    if session := _sessions.pop(rq["session"], None):
+        session[0].stdin.close()
+        session[0].wait()
+    return {"out": "", "err": "", "status": 0}
+
+
+_OPS = {"run": _op_run, "pread": _op_pread, "pwrite": _op_pwrite,
+        "read_file": _op_read_file, "write_file": _op_write_file, "copy_extents": _op_copy_extents,
+        "session_open": _op_session_open, "session_run": _op_session_run, "session_close": _op_session_close}
+
+
+def _serve(rq):
+    try:
+        reply = _OPS[rq["op"]](rq)
+    except Exception as e:
+        reply = {"out": "", "err": f"{type(e).__name__}: {e}", "status": -1}
+    reply["id"] = rq["id"]
+    _reply(reply)
+
+
+while header := _in.read(_HEADER.size):
+    (size,) = _HEADER.unpack(header)
+    rq = json.loads(_in.read(size))
+    threading.Thread(target=_serve, args=(rq,), daemon=True).start()
+"""
+
+
+class Reply:
+    """Result of a command executed by the broker"""
+
+    def __init__(self, out='', err='', status=0):
+        self.out = out
+        self.err = err
+        self.status = status
+
+    def __repr__(self):
+        return f"Reply(status={self.status}, out={self.out!r}, err={self.err!r})"
+
+    def __str__(self):
+        return self.data
+
+    @property
+    def success(self):
+        return self.status == 0
+
+    @property
+    def data(self):
+        return self.out.strip()
+
+    @property
+    def datalines(self):
+        return [line for line in self.out.splitlines() if line.strip()]
+
+
+class RootBroker:
+    """Long-lived root helper process taking commands over a pipe"""
+
+    def __init__(self):
+        self._proc = None
+        self._reader = None
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}  # {request_id: [threading.Event, Reply]}
+        self._recorder = None
+        self.debug = False
+
+    @property
+    def running(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+
+            helper = create_py_script(_HELPER_SCRIPT)
+            argv = [sys.executable if os.geteuid() == 0 else "python3", helper]
+            need_password = False
+
+            if os.geteuid() != 0:
+                need_password = 0 != subprocess.run(["sudo", "-n", "true"],
+                                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode
+                argv = ["sudo", "-S", "-p", "", *argv]
+
+            self._proc = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+            if need_password:
+                upass = ENV("UPASS") or ask_user("Enter password for sudo:")
+                self._proc.stdin.write(f"{upass}\n".encode())
+                self._proc.stdin.flush()
+
+            self._reader = threading.Thread(target=self._read_replies, daemon=True)
+            self._reader.start()
+
+    def stop(self):
+        with self._lock:
+            if self.running:
+                self._proc.stdin.close()
+                self._proc.wait()
+            self._proc = None
+
+    def _read_replies(self):
+        stream = self._proc.stdout
+        while header := stream.read(_HEADER.size):
+            (size,) = _HEADER.unpack(header)
+            msg = json.loads(stream.read(size))
+            if waiter := self._pending.get(msg.pop("id")):
+                waiter[1] = Reply(**msg)
+                waiter[0].set()
+
+        # the helper is gone: don't leave anybody waiting forever
+        for waiter in list(self._pending.values()):
+            waiter[1] = Reply(err="root broker terminated", status=-1)
+            waiter[0].set()
+
+    def _request(self, op, **params):
+        self.start()
+
+        rq_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[rq_id] = waiter
+
+        data = json.dumps(dict(params, op=op, id=rq_id)).encode()
+        with self._lock:
+            self._proc.stdin.write(_HEADER.pack(len(data)) + data)
+            self._proc.stdin.flush()
+
+        waiter[0].wait()
+        return self._pending.pop(rq_id)[1]
+
+    @property
+    def recording_active(self):
+        return self._recorder is not None
+
+    @contextmanager
+    def recording(self, recorder):
+        """Record commands instead of executing them.
+        ``recorder`` - any object with ``add(cmd, input, env)`` method, e.g. a ``Plan``
+        """
+        self._recorder = recorder
+        try:
+            yield recorder
+        finally:
+            self._recorder = None
+
+    def run(self, cmd: str, input: str = None, timeout=None, env: dict = None) -> Reply:
+        """Execute ``cmd`` in a root bash shell.
+        ``input`` - data to be passed to the command's stdin (e.g. a passphrase)
+        ``env`` - extra environment variables
+        """
+        if self._recorder is not None:
+            self._recorder.add(cmd, input, env)
+            return Reply()
+
+        if self.debug:
+            _tlog(cmd)
+
+        reply = self._request("run", cmd=cmd, input=input or "", timeout=timeout, env=env or {})
+
+        if self.debug and not reply.success:
+            _tlog(f"status {reply.status}:", reply.err.strip())
+
+        return reply
+
+    def do(self, cmd: str, input: str = None, timeout=None, env: dict = None, list_=False, with_status=False):
+        """Mimics ``SpawnedSU.do()``: returns the command output, its lines or the whole reply"""
+        reply = self.run(cmd, input, timeout, env)
+        if with_status:
+            return reply
+        return reply.datalines if list_ else reply.data
+
+    def pread(self, path: str, offset: int, size: int) -> bytes:
+        """Read ``size`` bytes at ``offset``; in-process if the file is readable by the current user"""
+        if os.access(path, os.R_OK):
+            with open(path, "rb") as f:
+                return os.pread(f.fileno(), size, offset)
+
+        reply = self._request("pread", path=path, offset=offset, size=size)
+        assert reply.success, f"Can't read '{path}': {reply.err}"
+        return base64.b64decode(reply.out)
+
+    def pwrite(self, path: str, offset: int, data: bytes):
+        """Write ``data`` at ``offset``; in-process if the file is writable by the current user"""
+        if self._recorder is not None:
+            b64 = base64.b64encode(data).decode()
+            self._recorder.add(f"echo {b64} | base64 -d | "
+                               f"dd of={path} bs=64K seek={offset} oflag=seek_bytes conv=notrunc,fsync status=none")
+            return
+
+        if self.debug:
+            _tlog(f"pwrite {len(data)} bytes to {path} at {offset}")
+
+        if os.access(path, os.W_OK):
+            fd = os.open(path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, data, offset)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            return
+
+        reply = self._request("pwrite", path=path, offset=offset, data=base64.b64encode(data).decode())
+        assert reply.success, f"Can't write '{path}': {reply.err}"
+
+    def read_file(self, path: str) -> bytes:
+        """The whole file content; in-process if the file is readable by the current user"""
+        if os.access(path, os.R_OK):
+            with open(path, "rb") as f:
+                return f.read()
+
+        reply = self._request("read_file", path=str(path))
+        assert reply.success, f"Can't read '{path}': {reply.err}"
+        return base64.b64decode(reply.out)
+
+    def write_file(self, path: str, data: bytes):
+        """Create or overwrite a file; in-process if the current user has enough permissions"""
+        if self._recorder is not None:
+            self._recorder.add(f"echo {base64.b64encode(data).decode()} | base64 -d > {path}")
+            return
+
+        if self.debug:
+            _tlog(f"write {len(data)} bytes to {path}")
+
+        if os.access(path, os.W_OK) or (not os.path.exists(path) and os.access(os.path.dirname(path), os.W_OK)):
+            with open(path, "wb") as f:
+                f.write(data)
+            return
+
+        reply = self._request("write_file", path=str(path), data=base64.b64encode(data).decode())
+        assert reply.success, f"Can't write '{path}': {reply.err}"
+
+    def copy_extents(self, src: str, dst: str, extents, chunk: int):
+        """Copy ``extents`` [(offset, length)] from ``src`` to the same offsets of ``dst`` with direct I/O;
+        returns the SHA-256 of every extent as read back from ``dst``.
+        ``chunk`` - the I/O size, a multiple of DIRECT_IO_ALIGNMENT; unaligned extents are copied
+            through the page cache
+        """
+        assert chunk % DIRECT_IO_ALIGNMENT == 0, f"Invalid I/O size {chunk}"
+
+        if self.debug:
+            _tlog(f"copy {len(extents)} extents from {src} to {dst}")
+
+        reply = self._request("copy_extents", src=src, dst=dst, extents=extents,
+                              chunk=chunk, align=DIRECT_IO_ALIGNMENT)
+        assert reply.success, f"Can't copy '{src}' to '{dst}': {reply.err}"
+        return json.loads(reply.out)
+
+    def session_open(self, root: str) -> int:
+        """Start a persistent root shell chrooted into ``root``; returns the session id"""
+        session = next(self._ids)
+        reply = self._request("session_open", session=session, root=root)
+        assert reply.success, f"Can't start a shell in '{root}': {reply.err}"
+        return session
+
+    def session_run(self, session: int, cmd: str, input: str = None) -> Reply:
+        """Execute ``cmd`` in the session's shell, in a subshell of its own"""
+        if self.debug:
+            _tlog(f"[session {session}]", cmd)
+
+        reply = self._request("session_run", session=session, cmd=cmd, input=input or "")
+
+        if self.debug and not reply.success:
+            _tlog(f"[session {session}] status {reply.status}:", reply.err.strip())
+
+        return reply
+
+    def session_close(self, session: int):
+        if self.running:
+            self._request("session_close", session=session)
+
+
+_broker = RootBroker()
+onExit(lambda: _broker.stop())
+
+
+def instance() -> RootBroker:
+    return _broker
+
+
+def run(cmd: str, input: str = None, timeout=None, env: dict = None) -> Reply:
+    return _broker.run(cmd, input, timeout, env)
+
+
+def do(cmd: str, input: str = None, timeout=None, env: dict = None, list_=False, with_status=False):
+    return _broker.do(cmd, input, timeout, env, list_, with_status)
+
+
+def pread(path: str, offset: int, size: int) -> bytes:
+    return _broker.pread(path, offset, size)
+
+
+def pwrite(path: str, offset: int, data: bytes):
+    _broker.pwrite(path, offset, data)
+
+
+def read_file(path: str) -> bytes:
+    return _broker.read_file(path)
+
+
+def write_file(path: str, data: bytes):
+    _broker.write_file(path, data)
+
+
+def copy_extents(src: str, dst: str, extents, chunk: int):
+    return _broker.copy_extents(src, dst, extents, chunk)
+
+
+def session_open(root: str) -> int:
+    return _broker.session_open(root)
+
+
+def session_run(session: int, cmd: str, input: str = None) -> Reply:
+    return _broker.session_run(session, cmd, input)
+
+
+def session_close(session: int):
+    _broker.session_close(session)
+
+
+def enable_debug():
+    _broker.debug = True
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Persistent shell sessions inside the target system.
+
+A session keeps a root shell chrooted into the target open (in the root broker) for as long as
+it is used, so a command costs a pipe round trip rather than a new chroot invocation. Every command
+still gets its own exit status, stdout and stderr. Each thread gets its own shell, so concurrently
+running post-installation steps don't wait for each other.
+"""
+
+import shlex
+import threading
+
+from . import broker
+from .util import tagged_logger
+
+__all__ = ['ChrootSession']
+
+_tlog = tagged_logger("[ChrootSession]")
+
+_EOF = "__STUDIOINSTALLER_EOF__"
+
+
+class ChrootSession:
+    """Drop-in replacement of ``spawned.ChrootContext`` for non-interactive commands"""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sessions = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                broker.session_close(session)
+            self._sessions.clear()
+        self._local = threading.local()
+
+    def _session(self):
+        if (session := getattr(self._local, "session", None)) is None:
+            session = self._local.session = broker.session_open(self.root)
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def run(self, cmd: str, input: str = None, user=None) -> broker.Reply:
+        """Execute ``cmd`` in the target system.
+        ``input`` - data to be passed to the command's stdin (e.g. a passphrase)
+        ``user`` - name or uid of the user to run the command as; root by default
+        """
+        if user is not None and str(user) not in ("0", "root"):
+            cmd = f'runuser -u "$(id -nu {user})" -- /bin/bash -c {shlex.quote(cmd)}'
+
+        if broker.instance().recording_active:
+            return broker.run(f"chroot {self.root} /bin/bash -c {shlex.quote(cmd)}", input)
+
+        reply = broker.session_run(self._session(), cmd, input)
+        if not reply.success:
+            _tlog(f"status {reply.status}: {cmd.strip()}\n{reply.err.strip()}")
+        return reply
+
+    def do(self, cmd: str, input: str = None, user=None, list_=False):
+        """Mimics ``ChrootContext.do()``: returns the command output or its lines"""
+        reply = self.run(cmd, input, user)
+        return reply.datalines if list_ else reply.data
+
+    def append(self, path: str, lines):
+        """Appends all the ``lines`` to the file in one go; a no-op if there are none"""
+        if text := "".join(f"{line}\n" for line in lines):
+            self.do(f"cat >> {path} <<'{_EOF}'\n{text}{_EOF}")
+
+    def write(self, path: str, data: bytes):
+        """Creates or overwrites the file at ``path`` inside the target system"""
+        broker.write_file(f"{self.root}/{path.lstrip('/')}", data)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Dependency-graph executor running independent items concurrently on a thread pool"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+__all__ = ['run_dag']
+
+
+def run_dag(items, run, depends, jobs):
+    """Call ``run(item)`` for each of ``items``.
+
+    ``items`` - a sequence in a valid serial order
+    ``depends(a, b)`` - True if ``a`` must not start before ``b`` is done;
+        only items preceding ``a`` in ``items`` are checked, so the serial order is
+        preserved for every pair of dependent items
+    ``jobs`` - max number of concurrently running items
+
+    The first exception raised by ``run`` stops scheduling and is re-raised
+    once the already running items are finished.
+    """
+    items = list(items)
+    waits_for = {i: {j for j in range(i) if depends(items[i], items[j])} for i in range(len(items))}
+
+    pending = set(range(len(items)))
+    done = set()
+    running = {}
+    error = None
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while running or (pending and not error):
+            if not error:
+                # note: dependencies always point backwards, so at least the first pending item is ready
+                for i in sorted(pending):
+                    if waits_for[i] <= done:
+                        pending.remove(i)
+                        running[pool.submit(run, items[i])] = i
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+            for future in finished:
+                done.add(running.pop(future))
+                error = error or future.exception()
+
+    if error:
+        raise error
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Event-driven waiting for device nodes, UUIDs and unmounts.
+
+Directories are watched with inotify, the mount table with ``poll()`` on
+``/proc/self/mountinfo``, so a caller wakes up exactly when the awaited thing happens.
+Polling with a short interval is used as a fallback only if inotify is not available.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from pathlib import Path
+
+from . import broker
+from . import sysfs
+
+__all__ = [
+    'wait_for_path',
+    'wait_for_uuid',
+    'wait_for_unmount',
+    'wait_until',
+]
+
+DEFAULT_TIMEOUT = 30  # seconds
+DEV_BY_UUID = Path("/dev/disk/by-uuid")
+
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_WATCH_MASK = _IN_ATTRIB | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+
+_POLL_INTERVAL = 0.2  # seconds; fallback only
+
+
+def _load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+
+
+_libc = _load_libc()
+
+
+class _Inotify:
+    """Minimal inotify wrapper: any event in a watched directory just wakes a waiter up"""
+
+    def __init__(self):
+        self.fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC) if _libc else -1
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify is not available")
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        os.close(self.fd)
+
+    def watch(self, directory, mask=_WATCH_MASK):
+        if _libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            raise OSError(ctypes.get_errno(), f"can't watch '{directory}'")
+
+    def add_wake_fd(self, fd):
+        """Wake up on ``fd`` too, e.g. a non-blocking pipe or ``/proc/self/mountinfo``"""
+        self._poll.register(fd, select.POLLIN | select.POLLPRI | select.POLLERR)
+
+    def wait(self, timeout):
+        """Block until some events arrive or ``timeout`` (seconds, None - forever) expires"""
+        for fd, _ in self._poll.poll(None if timeout is None else max(0, int(timeout * 1000))):
+            _drain(fd)
+
+
+def _drain(fd):
+    """Consume whatever woke a waiter up; events themselves are of no interest"""
+    try:
+        os.lseek(fd, 0, os.SEEK_SET)  # e.g. /proc/self/mountinfo: POLLPRI is reset by re-reading it
+    except OSError:
+        pass
+    try:
+        while os.read(fd, 4096):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _existing_ancestor(path: Path) -> Path:
+    while not path.exists() and path != path.parent:
+        path = path.parent
+    return path
+
+
+def _remaining(deadline):
+    return None if deadline is None else max(0, deadline - time.monotonic())
+
+
+def wait_until(check, watched_dirs, timeout=DEFAULT_TIMEOUT, modify=False, wake_fds=()):
+    """Returns the first truthy ``check()`` result, or None if ``timeout`` expires.
+    ``watched_dirs`` - a directory whose changes may affect the result, or a callable returning
+        a list of such directories (re-evaluated after every wake-up); until a directory appears,
+        its nearest existing ancestor is watched instead
+    ``modify`` - wake up on writes to files inside the directories too (e.g. for tailing a log)
+    ``wake_fds`` - other file descriptors to wake up on (see ``_Inotify.add_wake_fd``)
+    """
+    mask = _WATCH_MASK | _IN_MODIFY if modify else _WATCH_MASK
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    try:
+        inotify = _Inotify()
+        for fd in wake_fds:
+            inotify.add_wake_fd(fd)
+    except OSError:
+        inotify = None
+
+    def dirs():
+        return [_existing_ancestor(Path(d)) for d in (watched_dirs() if callable(watched_dirs) else [watched_dirs])]
+
+    try:
+        while True:
+            if inotify:
+                # (re)arm the watches before checking, so that no event can be missed in between
+                try:
+                    armed = dirs()
+                    for directory in armed:
+                        inotify.watch(directory, mask)
+                except OSError:
+                    inotify.__exit__()
+                    inotify = None
+
+            if result := check():
+                return result
+
+            if inotify and dirs() != armed:
+                continue  # the check made progress; arm the new watches before sleeping
+
+            if (remaining := _remaining(deadline)) == 0:
+                return None
+
+            if inotify:
+                inotify.wait(remaining)
+            else:
+                time.sleep(_POLL_INTERVAL if remaining is None else min(_POLL_INTERVAL, remaining))
+    finally:
+        if inotify:
+            inotify.__exit__()
+
+
+def wait_for_path(path, timeout=DEFAULT_TIMEOUT) -> bool:
+    """Wait for a file, a directory or a device node to appear.
+    ``timeout`` - seconds; None means forever
+    When the broker records a plan, an equivalent ``udevadm settle`` command is recorded instead.
+    """
+    rb = broker.instance()
+    if rb.recording_active:
+        if timeout is None:
+            # note: --timeout=0 doesn't wait at all, and the default is 120 seconds
+            rb.run(f"until [ -e {path} ]; do udevadm settle --exit-if-exists={path}; sleep 0.1; done")
+        else:
+            rb.run(f"udevadm settle --exit-if-exists={path} --timeout={timeout}")
+        return True
+
+    path = Path(path)
+    return bool(wait_until(path.exists, path.parent, timeout))
+
+
+def wait_for_uuid(device_url, timeout=DEFAULT_TIMEOUT) -> str:
+    """Wait for udev to publish a device's filesystem/LUKS UUID; returns '' on timeout"""
+    device = os.path.realpath(device_url)
+
+    def lookup():
+        try:
+            return next((link.name for link in DEV_BY_UUID.iterdir() if os.path.realpath(link) == device), '')
+        except OSError:
+            return ''
+
+    return wait_until(lookup, DEV_BY_UUID, timeout) or ''
+
+
+def wait_for_unmount(path, timeout=DEFAULT_TIMEOUT) -> bool:
+    """Wait until nothing is mounted at or below ``path``.
+    The kernel flags ``/proc/self/mountinfo`` with POLLPRI on every mount table change.
+    """
+    path = os.path.realpath(path)
+    prefix = path.rstrip('/') + '/'
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    with open("/proc/self/mountinfo") as f:
+        poller = select.poll()
+        poller.register(f, select.POLLPRI | select.POLLERR)
+
+        while True:
+            f.seek(0)
+            mountpoints = (mountpoint for _, mountpoint in sysfs.parse_mountinfo(f.read()))
+            if not any(m == path or m.startswith(prefix) for m in mountpoints):
+                return True
+
+            if (remaining := _remaining(deadline)) == 0:
+                return False
+
+            poller.poll(None if remaining is None else int(remaining * 1000))
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""In-process GPT engine.
+
+Computes partitions geometry and builds the protective MBR, the primary and backup
+GPT headers and the partition entry arrays, then writes them with a couple of ``pwrite``
+calls. Works on block devices and regular (e.g. sparse) files.
+"""
+
+import os
+import re
+import stat
+import struct
+import uuid
+import zlib
+
+from . import blockdevice
+from . import broker
+from . import sysfs
+
+__all__ = [
+    'GptEntry',
+    'GptTable',
+    'parse_size',
+    'type_guid',
+    'DEFAULT_ALIGNMENT',
+]
+
+DEFAULT_ALIGNMENT = 1 << 20  # bytes
+
+GPT_SIGNATURE = b"EFI PART"
+GPT_REVISION = 0x00010000
+GPT_HEADER = struct.Struct("<8sIIII4Q16sQIII")  # 92 bytes
+GPT_ENTRY = struct.Struct("<16s16sQQQ72s")  # 128 bytes
+GPT_ENTRIES_NUM = 128
+
+_UNUSED_GUID = bytes(16)
+
+# sgdisk type codes (see VType) => partition type GUIDs
+_TYPE_GUIDS = {
+    "ef02": "21686148-6449-6E6F-744E-656564454649",  # BIOS boot
+    "ef00": "C12A7328-F81F-11D2-BA4B-00A0C93EC93B",  # EFI system
+    "8200": "0657FD6D-A4AB-43C4-84E5-0933C84B4F4F",  # Linux swap
+    "8300": "0FC63DAF-8483-4772-8E79-3D69D8477DE4",  # Linux filesystem
+    "8302": "933AC7E1-2EB4-4F13-B844-0E14E2AEF915",  # Linux /home
+    "8309": "CA7D7CCB-63ED-4C53-861C-1742536059CC",  # Linux LUKS
+    "8e00": "E6D6D379-F507-44C2-A23C-238F2A3DF928",  # Linux LVM
+}
+DEFAULT_TYPE = "8300"
+
+_SIZE_UNITS = {'': 0, 'K': 10, 'M': 20, 'G': 30, 'T': 40, 'P': 50}
+
+
+def type_guid(type_code: str) -> uuid.UUID:
+    """Accepts either a 4-digit sgdisk type code or a GUID string"""
+    type_code = str(type_code or DEFAULT_TYPE).lower()
+    return uuid.UUID(_TYPE_GUIDS.get(type_code, type_code))
+
+
+def parse_size(size: str, sector_size: int) -> int:
+    """Size string (e.g. '200M', '40G'; a plain number means sectors, like sgdisk does) => number of sectors"""
+    mo = re.fullmatch(r"\+?\s*(\d+(?:\.\d+)?)\s*([KMGTP]?)(?:i?B)?", str(size).strip(), re.IGNORECASE)
+    assert mo, f"Invalid partition size: '{size}'"
+    value, unit = mo.groups()
+    if not unit:
+        return int(value)
+    nbytes = int(float(value) * (1 << _SIZE_UNITS[unit.upper()]))
+    return -(-nbytes // sector_size)  # round up
+
+
+def _geometry(path):
+    """Returns (logical sector size, number of sectors) of a block device or a regular file"""
+    if stat.S_ISBLK(os.stat(path).st_mode):
+        sector_size = sysfs.queue_attr(path, "logical_block_size", 512)
+        size_bytes = int(sysfs.read_attr(sysfs.block_dir(path) / "size")) * 512  # always in 512-byte units
+    else:
+        sector_size = 512
+        size_bytes = os.stat(path).st_size
+    return sector_size, size_bytes // sector_size
+
+
+def _crc32(data: bytes) -> int:
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+class GptEntry:
+    def __init__(self, number, type_guid_, first_lba, last_lba, name='', part_guid=None, attributes=0):
+        self.number = number
+        self.type_guid = type_guid_
+        self.part_guid = part_guid or uuid.uuid4()
+        self.first_lba = first_lba
+        self.last_lba = last_lba
+        self.attributes = attributes
+        self.name = name
+
+    def __repr__(self):
+        return f"GptEntry({self.number}, {self.type_guid}, {self.first_lba}-{self.last_lba}, '{self.name}')"
+
+    def pack(self) -> bytes:
+        name = self.name.encode("utf-16-le")[:72]
+        return GPT_ENTRY.pack(self.type_guid.bytes_le, self.part_guid.bytes_le,
+                              self.first_lba, self.last_lba, self.attributes, name)
+
+    @staticmethod
+    def unpack(number, data: bytes):
+        type_, part, first, last, attrs, name = GPT_ENTRY.unpack(data)
+        if type_ == _UNUSED_GUID:
+            return None
+        name = name.decode("utf-16-le", errors="replace").split('\0', 1)[0]
+        return GptEntry(number, uuid.UUID(bytes_le=type_), first, last, name, uuid.UUID(bytes_le=part), attrs)
+
+
+class GptTable:
+    def __init__(self, path, sector_size=None, total_sectors=None, alignment=DEFAULT_ALIGNMENT):
+        self.path = str(path)
+
+        if sector_size is None or total_sectors is None:
+            sector_size, total_sectors = _geometry(self.path)
+
+        self.sector_size = sector_size
+        self.total_sectors = total_sectors
+        self.alignment = max(1, alignment // sector_size)  # in sectors
+        self.disk_guid = uuid.uuid4()
+        self.entries = {}  # {number: GptEntry}
+
+        entries_bytes = GPT_ENTRIES_NUM * GPT_ENTRY.size
+        self.entries_sectors = -(-entries_bytes // sector_size)
+        self.first_usable = 2 + self.entries_sectors
+        self.last_usable = total_sectors - 2 - self.entries_sectors
+
+        assert self.last_usable > self.first_usable, f"'{self.path}' is too small for GPT"
+
+    def __iter__(self):
+        return iter(sorted(self.entries.values(), key=lambda e: e.number))
+
+    @staticmethod
+    def load(path, alignment=DEFAULT_ALIGNMENT):
+        """Read the existing primary table, if any. An invalid table is treated as empty."""
+        table = GptTable(path, alignment=alignment)
+        ss = table.sector_size
+
+        data = broker.pread(table.path, ss, ss * (1 + table.entries_sectors))
+        header, entries = data[:GPT_HEADER.size], data[ss:]
+        fields = GPT_HEADER.unpack(header)
+
+        signature, header_crc, disk_guid = fields[0], fields[3], fields[9]
+        entries_num, entry_size, entries_crc = fields[11], fields[12], fields[13]
+        check = header[:16] + b"\0\0\0\0" + header[20:]
+
+        if signature != GPT_SIGNATURE or header_crc != _crc32(check) or entry_size != GPT_ENTRY.size:
+            return table
+
+        entries = entries[:entries_num * entry_size]
+        if entries_crc != _crc32(entries):
+            return table
+
+        table.disk_guid = uuid.UUID(bytes_le=disk_guid)
+        for i in range(entries_num):
+            if entry := GptEntry.unpack(i + 1, entries[i * entry_size:(i + 1) * entry_size]):
+                table.entries[entry.number] = entry
+
+        return table
+
+    def clear(self):
+        self.entries.clear()
+        self.disk_guid = uuid.uuid4()
+
+    def remove(self, number: int):
+        self.entries.pop(int(number), None)
+
+    def free_blocks(self):
+        """Free (first, last) sector ranges"""
+        blocks = []
+        start = self.first_usable
+        for e in sorted(self.entries.values(), key=lambda e: e.first_lba):
+            if e.first_lba > start:
+                blocks.append((start, e.first_lba - 1))
+            start = max(start, e.last_lba + 1)
+        if start <= self.last_usable:
+            blocks.append((start, self.last_usable))
+        return blocks
+
+    def _align(self, sector):
+        return -(-sector // self.alignment) * self.alignment
+
+    def add(self, number='', size='', type_='', name='') -> GptEntry:
+        """Add a partition at the start of the largest free block, just like sgdisk does by default.
+        ``number`` - '' means the first unused number
+        ``size`` - '' means up to the end of the block
+        """
+        number = int(number) if number else next(n for n in range(1, GPT_ENTRIES_NUM + 1) if n not in self.entries)
+        assert 1 <= number <= GPT_ENTRIES_NUM, f"Invalid partition number {number}"
+        assert number not in self.entries, f"Partition {number} already exists on {self.path}"
+
+        blocks = [(self._align(first), last) for first, last in self.free_blocks() if self._align(first) <= last]
+        assert blocks, f"No free space on {self.path}"
+        first, last = max(blocks, key=lambda b: b[1] - b[0])
+
+        if size:
+            sectors = parse_size(size, self.sector_size)
+            assert first + sectors - 1 <= last, f"Not enough free space on {self.path} for {size}"
+            last = first + sectors - 1
+
+        entry = GptEntry(number, type_guid(type_), first, last, name)
+        self.entries[number] = entry
+        return entry
+
+    def _entries_array(self) -> bytes:
+        array = bytearray(GPT_ENTRIES_NUM * GPT_ENTRY.size)
+        for e in self.entries.values():
+            offset = (e.number - 1) * GPT_ENTRY.size
+            array[offset:offset + GPT_ENTRY.size] = e.pack()
+        return bytes(array)
+
+    def _header(self, current_lba, backup_lba, entries_lba, entries_crc) -> bytes:
+        fields = [GPT_SIGNATURE, GPT_REVISION, GPT_HEADER.size, 0, 0,
+                  current_lba, backup_lba, self.first_usable, self.last_usable,
+                  self.disk_guid.bytes_le, entries_lba, GPT_ENTRIES_NUM, GPT_ENTRY.size, entries_crc]
+        fields[3] = _crc32(GPT_HEADER.pack(*fields))
+        return GPT_HEADER.pack(*fields).ljust(self.sector_size, b"\0")
+
+    def _protective_mbr(self) -> bytes:
+        mbr = bytearray(self.sector_size)
+        size = min(self.total_sectors - 1, 0xFFFFFFFF)
+        mbr[446:462] = struct.pack("<B3sB3sII", 0, b"\x00\x02\x00", 0xEE, b"\xff\xff\xff", 1, size)
+        mbr[510:512] = b"\x55\xaa"
+        return bytes(mbr)
+
+    def build(self):
+        """Returns [(offset, data)] chunks to be written"""
+        ss = self.sector_size
+        last_lba = self.total_sectors - 1
+        backup_entries_lba = last_lba - self.entries_sectors
+
+        entries = self._entries_array()
+        entries_crc = _crc32(entries)
+        entries_padded = entries.ljust(self.entries_sectors * ss, b"\0")
+
+        primary = self._protective_mbr() + self._header(1, last_lba, 2, entries_crc) + entries_padded
+        backup = entries_padded + self._header(last_lba, 1, backup_entries_lba, entries_crc)
+
+        return [(0, primary), (backup_entries_lba * ss, backup)]
+
+    def write(self):
+        for offset, data in self.build():
+            broker.pwrite(self.path, offset, data)
+
+        # make the kernel re-read the table once; not applicable to regular files
+        if stat.S_ISBLK(os.stat(self.path).st_mode):
+            broker.do(f"partprobe {self.path}")
+            blockdevice.invalidate()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Sparse disk images and their block maps.
+
+An image is a sparse file attached to a loop device, so the whole installation pipeline
+works on it as on a real disk. Its block map lists the extents really holding data
+(found with ``SEEK_DATA``/``SEEK_HOLE``), so flashing copies just those, with large aligned
+direct I/O, to any number of disks at once.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import broker, gpt, sysfs
+from .util import tagged_logger
+
+__all__ = ['BLOCK', 'BlockMap', 'create', 'attach', 'detach', 'flash']
+
+_tlog = tagged_logger("[Image]")
+
+BLOCK = 1024 * 1024  # extents alignment and the flashing I/O size
+
+
+def _align_down(value):
+    return value - value % BLOCK
+
+
+def _align_up(value):
+    return _align_down(value + BLOCK - 1)
+
+
+def _data_extents(fd, size):
+    """[(offset, length)] of the file's data regions, aligned to BLOCK and merged"""
+    extents = []
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError:  # ENXIO: no data after offset
+            break
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        start, end = _align_down(start), min(_align_up(end), size)
+
+        if extents and start <= extents[-1][0] + extents[-1][1]:
+            extents[-1] = (extents[-1][0], end - extents[-1][0])
+        else:
+            extents.append((start, end - start))
+        offset = end
+    return extents
+
+
+class BlockMap:
+    def __init__(self, size, extents, digests):
+        self.size = size
+        self.extents = extents  # [(offset, length)]
+        self.digests = digests  # SHA-256 of every extent
+
+    def __repr__(self):
+        return f"BlockMap({len(self.extents)} extents, {self.mapped_bytes} of {self.size} bytes)"
+
+    @property
+    def mapped_bytes(self):
+        return sum(length for _, length in self.extents)
+
+    @classmethod
+    def build(cls, image):
+        fd = os.open(image, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            extents = _data_extents(fd, size)
+
+            digests = []
+            for offset, length in extents:
+                sha = hashlib.sha256()
+                for pos in range(offset, offset + length, BLOCK):
+                    sha.update(os.pread(fd, min(BLOCK, offset + length - pos), pos))
+                digests.append(sha.hexdigest())
+        finally:
+            os.close(fd)
+
+        return cls(size, extents, digests)
+
+    def save(self, path):
+        data = {"size": self.size, "block": BLOCK, "extents": self.extents, "digests": self.digests}
+        broker.write_file(str(path), json.dumps(data, indent=1).encode())
+
+    @classmethod
+    def load(cls, path):
+        data = json.loads(broker.read_file(str(path)))
+        assert data["block"] == BLOCK, f"Unsupported block map alignment: {data['block']}"
+        return cls(data["size"], [tuple(e) for e in data["extents"]], data["digests"])
+
+
+def create(path, size):
+    """A new sparse file of ``size`` (e.g. '16G') rounded up to BLOCK; returns the size in bytes"""
+    size = _align_up(gpt.parse_size(size, 1))
+    broker.do(f"rm -f {path} && truncate -s {size} {path}")
+    return size
+
+
+def attach(path):
+    """Loop device with the image's partitions scanned, e.g. /dev/loop0"""
+    reply = broker.run(f"losetup --find --partscan --show {path}")
+    assert reply.success, f"Can't attach '{path}' to a loop device: {reply.err}"
+    return reply.data
+
+
+def detach(loop_device):
+    broker.do(f"losetup -d {loop_device}")
+
+
+def _flash_one(image, bmap, disk):
+    disk_size = int(sysfs.read_attr(sysfs.block_dir(disk) / "size", 0)) * 512 if sysfs.block_dir(disk) else 0
+    assert disk_size >= bmap.size, f"'{disk}' is smaller than the image ({disk_size} < {bmap.size} bytes)"
+
+    _tlog(f"flashing {bmap.mapped_bytes} bytes to {disk} ...")
+    digests = broker.copy_extents(str(image), disk, bmap.extents, BLOCK)
+
+    bad = [offset for (offset, _), expected, actual in zip(bmap.extents, bmap.digests, digests) if expected != actual]
+    assert not bad, f"'{disk}' verification failed for the extents at {bad}"
+
+    # the image's backup GPT header ended up in the middle of a larger disk: move it to the disk's end
+    if bmap.size < disk_size:
+        gpt.GptTable.load(disk).write()
+
+    _tlog(f"{disk}: done and verified")
+
+
+def flash(image, bmap: BlockMap, disks):
+    """Write the mapped extents of the image onto every disk concurrently and verify them"""
+    with ThreadPoolExecutor(max_workers=max(1, len(disks))) as pool:
+        for future in [pool.submit(_flash_one, image, bmap, disk) for disk in disks]:
+            future.result()
+
+    broker.do(" ; ".join(f"partprobe {disk}" for disk in disks))
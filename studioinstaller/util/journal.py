@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Installation state journal.
+
+Completed steps of an installation are recorded in a file keyed by the partitioning scheme's
+fingerprint, so a re-run after a failure skips whatever has already been done.
+Steps run while commands are recorded into a ``Plan`` are not journaled, since they're not executed yet.
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from . import broker
+from .util import tagged_logger
+
+__all__ = ['Journal', 'JOURNAL_DIR', 'open_journal', 'close_journal', 'instance', 'done', 'complete', 'run']
+
+_tlog = tagged_logger("[Journal]")
+
+JOURNAL_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "studioinstaller"
+
+
+class Journal:
+    def __init__(self, fingerprint, fresh=False):
+        self.path = JOURNAL_DIR / f"journal-{fingerprint}.json"
+        self._lock = threading.Lock()
+        self._done = []
+
+        if fresh:
+            self.path.unlink(missing_ok=True)
+        elif self.path.exists():
+            self._done = json.loads(self.path.read_text())
+            _tlog(f"resuming: {len(self._done)} steps done already ({self.path})")
+
+    def done(self, step) -> bool:
+        return step in self._done
+
+    def complete(self, step):
+        with self._lock:
+            if step in self._done:
+                return
+            self._done.append(step)
+
+            # write-then-rename, so that the journal is never left half-written
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._done, indent=1))
+            tmp.replace(self.path)
+
+    def discard(self):
+        with self._lock:
+            self._done.clear()
+            self.path.unlink(missing_ok=True)
+
+    def run(self, step, func, *args, **kwargs):
+        """Call ``func`` unless the ``step`` is done already; the step is done once ``func`` returns"""
+        if broker.instance().recording_active:
+            return func(*args, **kwargs)
+
+        if self.done(step):
+            _tlog(f"skip '{step}': done already")
+            return None
+
+        result = func(*args, **kwargs)
+        self.complete(step)
+        return result
+
+
+_journal = None
+
+
+def open_journal(fingerprint, fresh=False) -> Journal:
+    global _journal
+    _journal = Journal(fingerprint, fresh)
+    return _journal
+
+
+def close_journal(finished=True):
+    """Once the whole installation is ``finished``, the next run starts over"""
+    global _journal
+    if _journal is not None and finished:
+        _journal.discard()
+    _journal = None
+
+
+def instance():
+    """The opened journal or None, i.e. nothing gets journaled"""
+    return _journal
+
+
+def done(step) -> bool:
+    return _journal is not None and not broker.instance().recording_active and _journal.done(step)
+
+
+def complete(step):
+    if _journal is not None and not broker.instance().recording_active:
+        _journal.complete(step)
+
+
+def run(step, func, *args, **kwargs):
+    if _journal is None:
+        return func(*args, **kwargs)
+    return _journal.run(step, func, *args, **kwargs)
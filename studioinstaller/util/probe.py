@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""In-process superblock prober.
+
+Detects LUKS1/LUKS2, btrfs, ext2/3/4, swap and vfat volumes and reads their UUID and label
+from a single aligned ``pread`` of the device head, i.e. without spawning ``blkid``.
+"""
+
+import struct
+import uuid
+
+from . import broker
+
+__all__ = ['Superblock', 'probe', 'PROBE_SIZE']
+
+PROBE_SIZE = 68 * 1024  # up to the end of the btrfs superblock at 64 KiB
+
+
+class Superblock:
+    def __init__(self, type_, uuid_='', label=''):
+        self.type = type_
+        self.uuid = uuid_
+        self.label = label
+
+    def __repr__(self):
+        return f"Superblock({self.type}, uuid={self.uuid}, label={self.label})"
+
+
+def _cstr(data: bytes) -> str:
+    return data.split(b"\0", 1)[0].decode(errors="replace").strip()
+
+
+def _uuid(data: bytes) -> str:
+    return str(uuid.UUID(bytes=data)) if any(data) else ''
+
+
+def _luks(head):
+    if head[:6] != b"LUKS\xba\xbe":
+        return None
+    (version,) = struct.unpack_from(">H", head, 6)
+    label = _cstr(head[24:72]) if version == 2 else ''
+    return Superblock("crypto_LUKS", _cstr(head[168:208]), label)
+
+
+def _btrfs(head):
+    sb = head[0x10000:0x11000]
+    if sb[0x40:0x48] != b"_BHRfS_M":
+        return None
+    return Superblock("btrfs", _uuid(sb[0x20:0x30]), _cstr(sb[0x12b:0x22b]))
+
+
+def _ext(head):
+    sb = head[1024:2048]
+    if sb[56:58] != b"\x53\xef":
+        return None
+    compat, incompat = struct.unpack_from("<II", sb, 92)
+    if incompat & (0x40 | 0x80 | 0x200):  # extents, 64bit, flex_bg
+        type_ = "ext4"
+    elif compat & 0x4:  # has_journal
+        type_ = "ext3"
+    else:
+        type_ = "ext2"
+    return Superblock(type_, _uuid(sb[104:120]), _cstr(sb[120:136]))
+
+
+def _swap(head):
+    # the signature is at the end of the first page, whatever the page size was
+    for page_size in (4096, 8192, 16384, 65536):
+        if head[page_size - 10:page_size] in (b"SWAPSPACE2", b"SWAP-SPACE"):
+            return Superblock("swap", _uuid(head[1036:1052]), _cstr(head[1052:1068]))
+    return None
+
+
+def _vfat(head):
+    if head[510:512] != b"\x55\xaa":
+        return None
+    if head[82:87] == b"FAT32":
+        serial_at, label_at = 67, 71
+    elif head[54:58] == b"FAT1":
+        serial_at, label_at = 39, 43
+    else:
+        return None
+    (serial,) = struct.unpack_from("<I", head, serial_at)
+    label = _cstr(head[label_at:label_at + 11])
+    return Superblock("vfat", f"{serial >> 16:04X}-{serial & 0xFFFF:04X}", '' if label == "NO NAME" else label)
+
+
+# the most reliable signatures first
+_PROBERS = [_luks, _btrfs, _ext, _swap, _vfat]
+
+
+def probe(volume_url):
+    """Returns the volume's ``Superblock`` or None if its format is unknown or the volume is unreadable"""
+    try:
+        head = broker.pread(str(volume_url), 0, PROBE_SIZE)
+    except (OSError, AssertionError):
+        return None
+
+    head = head.ljust(PROBE_SIZE, b"\0")  # a tiny volume
+    return next((sb for prober in _PROBERS if (sb := prober(head))), None)
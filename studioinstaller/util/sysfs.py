@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+"""Block devices facts read straight from sysfs, udev's /dev/disk/by-* links and procfs"""
+
+import os
+import re
+from pathlib import Path
+
+__all__ = [
+    'SYSFS_BLOCK',
+    'block_dir',
+    'queue_dir',
+    'read_attr',
+    'queue_attr',
+    'devices',
+    'disk_links',
+    'parse_mountinfo',
+    'mounts',
+]
+
+SYSFS_BLOCK = Path("/sys/class/block")
+DEV_DISK = Path("/dev/disk")
+MOUNTINFO = Path("/proc/self/mountinfo")
+
+
+def block_dir(device_url):
+    """sysfs directory of a device, e.g. /dev/mapper/root => /sys/class/block/dm-0 ; None if unknown"""
+    path = SYSFS_BLOCK / Path(os.path.realpath(device_url)).name
+    return path if path.exists() else None
+
+
+def queue_dir(device_url):
+    """Request queue directory; partitions share the queue of their disk"""
+    if not (path := block_dir(device_url)):
+        return None
+    if (path / "queue").exists():
+        return path / "queue"
+    if (parent := path.resolve().parent / "queue").exists():
+        return parent
+    return None
+
+
+def read_attr(path, default=None):
+    try:
+        return Path(path).read_text().strip()
+    except (OSError, TypeError):
+        return default
+
+
+def queue_attr(device_url, name, default=0):
+    """Integer attribute of the device's request queue"""
+    value = read_attr(queue / name) if (queue := queue_dir(device_url)) else None
+    return int(value) if value and value.lstrip('-').isdigit() else default
+
+
+def devices():
+    """sysfs directories of all block devices"""
+    try:
+        return sorted(SYSFS_BLOCK.iterdir())
+    except OSError:
+        return []
+
+
+def _udev_unescape(name: str) -> str:
+    return re.sub(r"\\x([0-9a-fA-F]{2})", lambda mo: chr(int(mo.group(1), 16)), name)
+
+
+def disk_links(kind):
+    """Resolved udev symlinks of /dev/disk/by-``kind`` (e.g. 'uuid', 'label'): {device_path: value}"""
+    try:
+        links = list((DEV_DISK / f"by-{kind}").iterdir())
+    except OSError:
+        return {}
+    return {os.path.realpath(link): _udev_unescape(link.name) for link in links}
+
+
+def _mountinfo_unescape(path: str) -> str:
+    return re.sub(r"\\([0-7]{3})", lambda mo: chr(int(mo.group(1), 8)), path)
+
+
+def parse_mountinfo(text: str):
+    """[(device number 'major:minor', mountpoint)] of a mountinfo file content"""
+    return [(fields[2], _mountinfo_unescape(fields[4])) for line in text.splitlines() if len(fields := line.split()) > 4]
+
+
+def mounts():
+    return parse_mountinfo(read_attr(MOUNTINFO, ''))
@@ -12,6 +12,7 @@
 #
 #  Copyright (c) 2021 remico
 
+import re
 from importlib.metadata import files as app_files
 from pathlib import Path
 
@@ -23,11 +24,13 @@ from .util import tagged_logger, package_name
 __all__ = [
     'resource_file',
     'preseeding_file',
+    'preseed_value',
     'get_target_upass',
     'read_upass_from_preseeding_file',
     'target_user',
     'target_home',
     'ready_for_postinstall',
+    'installed_kernel',
     'deploy_resource',
 ]
 
@@ -51,6 +54,20 @@ def preseeding_file():
     return ""
 
 
+def preseed_value(question, default=''):
+    """Value of a question in the .seed file, e.g. preseed_value("passwd/username")"""
+    if not (prefile := preseeding_file()):
+        return default
+
+    for line in Path(prefile).read_text().splitlines():
+        # <owner> <question> <type> <value>
+        fields = line.split(None, 3)
+        if len(fields) >= 3 and not fields[0].startswith('#') and fields[1] == question:
+            return fields[3].strip() if len(fields) == 4 else ''
+
+    return default
+
+
 def get_target_upass(insystem_scheduled):
     if tupass := ENV('TUPASS'):
         return tupass
@@ -90,6 +107,17 @@ def ready_for_postinstall(chroot):
     return path.exists() and not any(path.iterdir())
 
 
+def installed_kernel(root_fs: str):
+    """Version of the newest kernel installed into the target system (e.g. '5.15.0-41-generic'), or ''"""
+    modules = next((d for d in (Path(root_fs) / "usr/lib/modules", Path(root_fs) / "lib/modules") if d.is_dir()), None)
+    if not modules:
+        return ""
+
+    # note: e.g. Arch's extramodules-* dirs aren't kernels
+    versions = [d.name for d in modules.iterdir() if (d / "kernel").is_dir()]
+    return max(versions, key=lambda v: [int(n) for n in re.findall(r"\d+", v)], default="")
+
+
 def deploy_resource(filename, dst_path, owner=None, mode=None):
     src_path = resource_file(filename)
     dst_full_path = dst_path if dst_path.endswith(filename) else f"{dst_path}/{filename}"
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+"""Fixtures shared by the tests
+
+If the ``spawned`` submodule isn't checked out, a stand-in is installed: the package imports it
+everywhere, while the tested code never spawns a process through it.
+"""
+
+import atexit
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+import pytest
+
+# the package imports its own '_typing' and 'spawned' as top-level modules (see its __init__);
+# the interpreter's '_typing' (Python 3.11+, imported by 'typing' already) mustn't shadow the former
+sys.path.insert(0, str(Path(__file__).parents[1] / "studioinstaller"))
+if not hasattr(sys.modules.get("_typing"), "__path__"):
+    sys.modules.pop("_typing", None)
+
+
+def _stub_spawned():
+    def not_available(*args, **kwargs):
+        raise RuntimeError("'spawned' is stubbed in the tests")
+
+    def create_py_script(text):
+        fd, path = tempfile.mkstemp(suffix=".py")
+        os.write(fd, text.encode())
+        os.close(fd)
+        atexit.register(os.unlink, path)
+        return path
+
+    class Spawned:
+        TIMEOUT_INFINITE = -1
+        TASK_END = None
+        do = staticmethod(not_available)
+
+    class logger:
+        @staticmethod
+        def tagged(tag, color=None):
+            return lambda func: lambda *text: print(tag, *func(*text))
+
+        ok_blue_s = fail_s = warning_s = staticmethod(str)
+        fail = warning = staticmethod(print)
+
+    module = types.ModuleType("spawned")
+    module.Spawned = module.SpawnedSU = module.ChrootContext = Spawned
+    module.logger = logger
+    module.ENV = os.environ.get
+    module.SETENV = os.environ.__setitem__
+    module.ask_user = not_available
+    module.create_py_script = create_py_script
+    module.onExit = atexit.register
+    sys.modules["spawned"] = module
+
+
+try:
+    import spawned  # noqa: F401
+except ImportError:
+    _stub_spawned()
+
+
+@pytest.fixture
+def sparse_file(tmp_path):
+    """Factory of sparse files of a given size in bytes"""
+    def create(size, name="disk.img"):
+        path = tmp_path / name
+        with open(path, "wb") as f:
+            f.truncate(size)
+        return path
+    return create
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    from studioinstaller.util import journal
+    monkeypatch.setattr(journal, "JOURNAL_DIR", tmp_path / "journal")
+    yield journal.JOURNAL_DIR
+    journal.close_journal(finished=False)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import pytest
+
+from studioinstaller.util import alignment
+
+KiB = 1024
+MiB = 1024 * KiB
+
+
+@pytest.fixture
+def topology(monkeypatch):
+    """Factory of ``Alignment`` objects for a fake disk with the given queue attributes"""
+    def create(raid_stripe=0, **attrs):
+        monkeypatch.setattr(alignment.sysfs, "queue_attr", lambda disk, name, default=0: attrs.get(name, default))
+        monkeypatch.setattr(alignment, "_raid_stripe", lambda disk: raid_stripe)
+        return alignment.Alignment("/dev/fake")
+    return create
+
+
+def test_default(topology):
+    a = topology()
+    assert (a.bytes, a.sectors, a.kib) == (MiB, 2048, 1024)
+    assert a.pe_size_kib == 4 * 1024
+
+
+def test_divisors_of_default(topology):
+    a = topology(physical_block_size=4 * KiB, minimum_io_size=4 * KiB, optimal_io_size=0)
+    assert a.bytes == MiB
+
+
+def test_raid_stripe(topology):
+    # e.g. a raid5 of 4 disks with 512 KiB chunks: 1.5 MiB stripes
+    a = topology(raid_stripe=3 * 512 * KiB, optimal_io_size=3 * 512 * KiB)
+    assert a.bytes == 3 * MiB
+    assert a.pe_size_kib == 12 * 1024
+
+
+@pytest.mark.parametrize("optimal_io_size", [33553920, 3 * 512 * KiB, 4 * KiB + 512])
+def test_bogus_optimal_io_size(topology, optimal_io_size):
+    # e.g. 33553920 (0xFFFE00) of some USB bridges; a non-RAID 1.5 MiB; not a multiple of the block size
+    a = topology(physical_block_size=4 * KiB, minimum_io_size=4 * KiB, optimal_io_size=optimal_io_size)
+    assert a.bytes == MiB
+
+
+def test_optimal_io_size(topology):
+    a = topology(physical_block_size=4 * KiB, optimal_io_size=8 * MiB)
+    assert a.bytes == 8 * MiB
+
+
+def test_discard_granularity(topology):
+    a = topology(physical_block_size=4 * KiB, discard_granularity=2 * MiB)
+    assert a.bytes == 2 * MiB
+    assert a.pe_size_kib == 4 * 1024
+
+
+@pytest.mark.parametrize("values, lcm", [((4, 6), 12), ((MiB,), MiB), ((MiB, 3 * MiB // 2), 3 * MiB), ((7, 1), 7)])
+def test_lcm(values, lcm):
+    assert alignment._lcm(*values) == lcm
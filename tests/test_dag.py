@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import threading
+import time
+
+import pytest
+
+from studioinstaller.util.dag import run_dag
+
+
+class Recorder:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.events = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        with self._lock:
+            self.events.append(("start", item))
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+            self.events.append(("end", item))
+
+    def index(self, event, item):
+        return self.events.index((event, item))
+
+
+def test_dependencies_respected():
+    deps = {"b": {"a"}, "c": {"a"}, "d": {"b", "c"}}
+    rec = Recorder()
+    run_dag("abcd", rec, lambda x, y: y in deps.get(x, ()), jobs=4)
+
+    for item, required in deps.items():
+        for other in required:
+            assert rec.index("end", other) < rec.index("start", item)
+    assert rec.max_running == 2  # b and c
+
+
+def test_dependencies_only_backwards():
+    # 'a' claims to depend on 'b', which goes later: the serial order wins
+    rec = Recorder()
+    run_dag("ab", rec, lambda x, y: (x, y) == ("a", "b"), jobs=2)
+    assert {item for _, item in rec.events} == {"a", "b"}
+
+
+def test_jobs_limit():
+    rec = Recorder()
+    run_dag(range(8), rec, lambda a, b: False, jobs=3)
+    assert rec.max_running == 3
+    assert len(rec.events) == 16
+
+
+def test_serial():
+    rec = Recorder(delay=0)
+    run_dag(range(5), rec, lambda a, b: False, jobs=1)
+    assert rec.events == [(event, i) for i in range(5) for event in ("start", "end")]
+
+
+def test_error_stops_scheduling():
+    started = []
+
+    def run(item):
+        started.append(item)
+        if item == 1:
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        run_dag(range(5), run, lambda a, b: True, jobs=2)  # a chain
+    assert started == [0, 1]
+
+
+def test_error_waits_for_running():
+    finished = []
+
+    def run(item):
+        if item == 0:
+            raise ValueError("first")
+        time.sleep(0.05)
+        finished.append(item)
+
+    with pytest.raises(ValueError):
+        run_dag(range(3), run, lambda a, b: False, jobs=3)
+    assert sorted(finished) == [1, 2]
+
+
+def test_empty():
+    run_dag([], lambda item: None, lambda a, b: False, jobs=2)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import pytest
+
+from studioinstaller import partitioning
+from studioinstaller.configfile import scheme_fstab
+from studioinstaller.util import blockdevice
+
+
+@pytest.fixture(autouse=True)
+def fake_uuids(monkeypatch):
+    monkeypatch.setattr(blockdevice, "uuid", lambda url: f"uuid-of-{url.rsplit('/', 1)[-1]}")
+
+
+def entries(scheme_id):
+    fstab = scheme_fstab(partitioning.scheme("/dev/sda", scheme_id))
+    return sorted(line.split() for line in fstab.splitlines() if not line.startswith('#'))
+
+
+def test_default_scheme():
+    assert entries(None) == sorted([
+        ["UUID=uuid-of-sda1", "/boot/efi", "vfat", "defaults,relatime", "0", "2"],
+        ["/dev/mapper/boot", "/boot", "ext2", "defaults,relatime", "0", "2"],
+        ["/dev/studio-vg/root", "/", "btrfs", "defaults,compress=lzo,subvol=@", "0", "0"],
+        ["/dev/studio-vg/root", "/var/cache", "btrfs", "defaults,compress=lzo,subvol=@cache", "0", "0"],
+        ["/dev/studio-vg/home", "/home", "btrfs", "defaults,compress=lzo,subvol=@home", "0", "0"],
+        ["/dev/studio-vg/swap", "none", "swap", "sw", "0", "0"],
+    ])
+
+
+def test_plain_scheme():
+    assert entries(1) == sorted([
+        ["UUID=uuid-of-sda1", "/boot/efi", "vfat", "defaults,relatime", "0", "2"],
+        ["UUID=uuid-of-sda2", "/", "btrfs", "defaults,compress=lzo,subvol=@", "0", "0"],
+        ["UUID=uuid-of-sda4", "/home", "btrfs", "defaults,compress=lzo,subvol=@home", "0", "0"],
+        ["UUID=uuid-of-sda3", "none", "swap", "sw", "0", "0"],
+    ])
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import shutil
+import subprocess
+import uuid
+import zlib
+
+import pytest
+
+from studioinstaller.util import gpt
+
+MiB = 1 << 20
+
+
+def _table(path):
+    table = gpt.GptTable(path)
+    table.add(1, "200M", "ef00", "efi")
+    table.add(2, "1G", "8300", "boot")
+    table.add(3, "", "8309", "crypt")
+    table.write()
+    return table
+
+
+def _header(data, lba, ss=512):
+    return gpt.GPT_HEADER.unpack(data[lba * ss:lba * ss + gpt.GPT_HEADER.size])
+
+
+def _check_header(data, fields, ss=512):
+    signature, _, size, crc = fields[:4]
+    header = bytearray(gpt.GPT_HEADER.pack(*fields))
+    header[16:20] = bytes(4)
+    assert signature == gpt.GPT_SIGNATURE
+    assert size == gpt.GPT_HEADER.size
+    assert crc == zlib.crc32(header) & 0xFFFFFFFF
+
+    entries_lba, entries_num, entry_size, entries_crc = fields[10:14]
+    entries = data[entries_lba * ss:entries_lba * ss + entries_num * entry_size]
+    assert entries_crc == zlib.crc32(entries) & 0xFFFFFFFF
+
+
+def test_sparse_file_layout(sparse_file):
+    path = sparse_file(4 << 30)
+    table = _table(path)
+    data = path.read_bytes()
+    last_lba = len(data) // 512 - 1
+
+    assert data[510:512] == b"\x55\xaa" and data[450] == 0xEE  # protective MBR
+
+    primary, backup = _header(data, 1), _header(data, last_lba)
+    _check_header(data, primary)
+    _check_header(data, backup)
+
+    # the backup header points back to the primary one and its entries lie right before it
+    assert (primary[5], primary[6]) == (1, last_lba)
+    assert (backup[5], backup[6]) == (last_lba, 1)
+    assert backup[10] == last_lba - table.entries_sectors
+    assert primary[7:9] == backup[7:9] and primary[9] == backup[9]  # usable range, disk GUID
+
+
+def test_entries_aligned(sparse_file):
+    table = _table(sparse_file(4 << 30))
+    entries = list(table)
+
+    assert [e.number for e in entries] == [1, 2, 3]
+    assert all(e.first_lba * 512 % MiB == 0 for e in entries)
+    assert (entries[0].last_lba - entries[0].first_lba + 1) * 512 == 200 * MiB
+    assert entries[2].last_lba == table.last_usable
+
+
+def test_load_round_trip(sparse_file):
+    path = sparse_file(4 << 30)
+    written = _table(path)
+    loaded = gpt.GptTable.load(path)
+
+    assert loaded.disk_guid == written.disk_guid
+    for a, b in zip(written, loaded):
+        assert (a.number, a.type_guid, a.part_guid, a.first_lba, a.last_lba, a.name) == \
+               (b.number, b.type_guid, b.part_guid, b.first_lba, b.last_lba, b.name)
+
+
+def test_load_ignores_corrupted_table(sparse_file):
+    path = sparse_file(64 * MiB)
+    table = gpt.GptTable(path)
+    table.add(1, "8M")
+    table.write()
+
+    with open(path, "r+b") as f:
+        offset = 2 * 512 + 40  # the first entry's last LBA
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    assert not gpt.GptTable.load(path).entries
+
+
+@pytest.mark.skipif(not shutil.which("partx"), reason="partx isn't available")
+def test_partx_accepts_table(sparse_file):
+    path = sparse_file(4 << 30)
+    table = _table(path)
+
+    # note: libblkid verifies the headers' and the entries' CRCs
+    out = subprocess.run(["partx", "--raw", "--noheadings", "--output", "NR,START,END,TYPE,UUID,NAME", str(path)],
+                         check=True, capture_output=True, text=True).stdout
+    rows = [line.split() for line in out.splitlines()]
+
+    assert len(rows) == 3
+    for (number, start, end, type_, part_guid, name), entry in zip(rows, table):
+        assert int(number) == entry.number
+        assert (int(start), int(end)) == (entry.first_lba, entry.last_lba)
+        assert uuid.UUID(type_) == entry.type_guid
+        assert uuid.UUID(part_guid) == entry.part_guid
+        assert name == entry.name
+
+
+def test_add_errors(sparse_file):
+    table = gpt.GptTable(sparse_file(64 * MiB))
+    table.add(1, "16M")
+
+    with pytest.raises(AssertionError):
+        table.add(1, "1M")  # already exists
+    with pytest.raises(AssertionError):
+        table.add(2, "1G")  # doesn't fit
+
+
+@pytest.mark.parametrize("size, sectors", [("200M", 409600), ("+1G", 2097152), ("1.5K", 3), ("2048", 2048)])
+def test_parse_size(size, sectors):
+    assert gpt.parse_size(size, 512) == sectors
+
+
+def test_type_guid():
+    assert gpt.type_guid("ef00") == uuid.UUID("c12a7328-f81f-11d2-ba4b-00a0c93ec93b")
+    assert gpt.type_guid("") == gpt.type_guid(gpt.DEFAULT_TYPE)
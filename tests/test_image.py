@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import hashlib
+import json
+
+import pytest
+
+from studioinstaller.util import image
+from studioinstaller.util.image import BLOCK, BlockMap
+
+
+def _write(path, offset, data):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+@pytest.fixture
+def sparse_image(sparse_file):
+    path = sparse_file(64 * BLOCK, "disk.img")
+    _write(path, 0, b"\x01" * 4096)                         # block 0
+    _write(path, 10 * BLOCK + 100, b"\x02" * 10)             # block 10, unaligned
+    _write(path, 20 * BLOCK, b"\x03" * (2 * BLOCK + 1))      # blocks 20-22
+    _write(path, 23 * BLOCK, b"\x04" * 10)                   # block 23: merged with the previous extent
+    return path
+
+
+def test_extents(sparse_image):
+    bmap = BlockMap.build(sparse_image)
+
+    assert bmap.size == 64 * BLOCK
+    assert bmap.extents == [(0, BLOCK), (10 * BLOCK, BLOCK), (20 * BLOCK, 4 * BLOCK)]
+    assert bmap.mapped_bytes == 6 * BLOCK
+    assert all(offset % BLOCK == 0 and length % BLOCK == 0 for offset, length in bmap.extents)
+
+
+def test_digests(sparse_image):
+    bmap = BlockMap.build(sparse_image)
+    data = sparse_image.read_bytes()
+
+    for (offset, length), digest in zip(bmap.extents, bmap.digests):
+        assert digest == hashlib.sha256(data[offset:offset + length]).hexdigest()
+
+
+def test_empty_image(sparse_file):
+    bmap = BlockMap.build(sparse_file(8 * BLOCK))
+    assert bmap.extents == [] and bmap.mapped_bytes == 0
+
+
+def test_unaligned_tail(sparse_file):
+    path = sparse_file(3 * BLOCK + 512)
+    _write(path, 3 * BLOCK, b"\x05" * 512)
+
+    bmap = BlockMap.build(path)
+    assert bmap.extents == [(3 * BLOCK, 512)]  # clipped to the image's end
+
+
+def test_save_load(sparse_image, tmp_path):
+    bmap = BlockMap.build(sparse_image)
+    bmap.save(tmp_path / "disk.bmap")
+    loaded = BlockMap.load(tmp_path / "disk.bmap")
+
+    assert (loaded.size, loaded.extents, loaded.digests) == (bmap.size, bmap.extents, bmap.digests)
+
+
+def test_load_other_alignment(tmp_path):
+    (tmp_path / "disk.bmap").write_text(json.dumps({"size": 0, "block": 4096, "extents": [], "digests": []}))
+    with pytest.raises(AssertionError):
+        BlockMap.load(tmp_path / "disk.bmap")
+
+
+def test_align():
+    assert image._align_up(BLOCK + 1) == 2 * BLOCK
+    assert image._align_up(BLOCK) == BLOCK
+    assert image._align_down(2 * BLOCK - 1) == BLOCK
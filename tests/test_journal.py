@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import json
+
+import pytest
+
+from studioinstaller.util import journal
+
+
+def test_round_trip(journal_dir):
+    j = journal.open_journal("abc")
+    j.complete("partition /dev/sda1")
+    j.complete("format /dev/sda1")
+    j.complete("partition /dev/sda1")  # only once
+
+    assert json.loads((journal_dir / "journal-abc.json").read_text()) == ["partition /dev/sda1", "format /dev/sda1"]
+
+    journal.close_journal(finished=False)  # e.g. a failure
+    journal.open_journal("abc")
+    assert journal.done("format /dev/sda1")
+    assert not journal.done("format /dev/sda2")
+
+
+def test_fresh(journal_dir):
+    journal.open_journal("abc").complete("step")
+    journal.close_journal(finished=False)
+
+    journal.open_journal("abc", fresh=True)
+    assert not journal.done("step")
+    assert not (journal_dir / "journal-abc.json").exists()
+
+
+def test_keyed_by_fingerprint(journal_dir):
+    journal.open_journal("abc").complete("step")
+    journal.close_journal(finished=False)
+
+    journal.open_journal("def")
+    assert not journal.done("step")
+
+
+def test_finished_discards(journal_dir):
+    journal.open_journal("abc").complete("step")
+    journal.close_journal()
+
+    assert not (journal_dir / "journal-abc.json").exists()
+    assert journal.instance() is None
+    journal.open_journal("abc")
+    assert not journal.done("step")
+
+
+def test_run_skips_done(journal_dir):
+    calls = []
+    journal.open_journal("abc")
+
+    assert journal.run("step", lambda x: calls.append(x) or x * 2, 21) == 42
+    assert journal.run("step", lambda x: calls.append(x), 1) is None
+    assert calls == [21]
+
+
+def test_run_failure_not_journaled(journal_dir):
+    journal.open_journal("abc")
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        journal.run("step", fail)
+    assert not journal.done("step")
+
+
+def test_no_journal():
+    journal.close_journal(finished=False)
+    assert journal.run("step", lambda: 1) == 1
+    assert not journal.done("step")
+    journal.complete("step")  # no-op
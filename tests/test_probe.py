@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+#  This file is part of "Linux Studio Installer" project
+#
+#  Author: Roman Gladyshev <remicollab@gmail.com>
+#  License: MIT License
+#
+#  SPDX-License-Identifier: MIT
+#  License text is available in the LICENSE file and online:
+#  http://www.opensource.org/licenses/MIT
+#
+#  Copyright (c) 2021 remico
+
+
+import shutil
+import struct
+import subprocess
+
+import pytest
+
+from studioinstaller.util import probe
+
+UUID = "0b5d4d3e-7a51-4e2a-9f65-3c2f1b8a6d10"
+
+# tool, arguments, expected type; the image path goes last
+MKFS = [
+    ("mkfs.ext4", ["-q", "-F", "-t", "ext4", "-U", UUID, "-L", "root"], "ext4"),
+    ("mkfs.ext4", ["-q", "-F", "-t", "ext2", "-U", UUID, "-L", "boot"], "ext2"),
+    ("mkfs.ext4", ["-q", "-F", "-t", "ext3", "-U", UUID, "-L", "data"], "ext3"),
+    ("mkswap", ["-U", UUID, "-L", "swap"], "swap"),
+    ("mkfs.vfat", ["-F", "32", "-i", "1234ABCD", "-n", "EFI"], "vfat"),
+    ("mkfs.btrfs", ["-q", "-f", "-U", UUID, "-L", "home"], "btrfs"),
+]
+
+
+def _blkid(path):
+    out = subprocess.run(["blkid", "-p", "-o", "export", str(path)], capture_output=True, text=True).stdout
+    return dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+
+
+@pytest.mark.parametrize("tool, args, type_", MKFS, ids=[m[2] for m in MKFS])
+def test_superblock(sparse_file, tool, args, type_):
+    if not shutil.which(tool):
+        pytest.skip(f"{tool} isn't available")
+
+    path = sparse_file(256 << 20)
+    subprocess.run([tool, *args, str(path)], check=True, capture_output=True)
+    sb = probe.probe(path)
+
+    assert sb is not None and sb.type == type_
+    assert sb.label == args[args.index("-L" if "-L" in args else "-n") + 1]
+    if shutil.which("blkid"):
+        assert sb.uuid.lower() == _blkid(path).get("UUID", "").lower()
+
+
+def test_luks_header(sparse_file):
+    path = sparse_file(1 << 20)
+    header = bytearray(4096)
+    header[:6] = b"LUKS\xba\xbe"
+    struct.pack_into(">H", header, 6, 2)
+    header[24:31] = b"cryptos"
+    header[168:168 + len(UUID)] = UUID.encode()
+    with open(path, "r+b") as f:
+        f.write(header)
+
+    sb = probe.probe(path)
+    assert (sb.type, sb.uuid, sb.label) == ("crypto_LUKS", UUID, "cryptos")
+
+
+def test_unknown(sparse_file):
+    assert probe.probe(sparse_file(1 << 20)) is None
+    assert probe.probe(sparse_file(100, "tiny.img")) is None